@@ -0,0 +1,66 @@
+"""Image and font loading shared by the games.
+
+Images are loaded once, scaled straight to the size they are drawn at and
+converted to the display pixel format, so blitting them each frame is a plain
+copy. Fonts are cached the same way, since SysFont looks the font up every
+time it is called.
+"""
+import os
+
+import pygame
+
+# Images live next to the scripts, not in whatever directory we were started from
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_images = {}
+_fonts = {}
+
+
+def asset_path(name):
+    """Absolute path of a file shipped next to the games"""
+    return os.path.join(ASSET_DIR, name)
+
+
+def load_image(path, size=None, smooth=True):
+    """Load an image at its final size, cached by (path, size, smooth).
+
+    Conversion to the display format needs a video mode, so images loaded
+    before the window exists are returned unconverted and not cached.
+    """
+    key = (path, tuple(size) if size else None, smooth)
+    image = _images.get(key)
+    if image is not None:
+        return image
+
+    image = pygame.image.load(path)
+    display_ready = pygame.display.get_surface() is not None
+    if display_ready:
+        if image.get_flags() & pygame.SRCALPHA:
+            image = image.convert_alpha()
+        else:
+            image = image.convert()
+    if size and image.get_size() != tuple(size):
+        if smooth and image.get_bitsize() in (24, 32):
+            image = pygame.transform.smoothscale(image, size)
+        else:
+            image = pygame.transform.scale(image, size)
+
+    if display_ready:
+        _images[key] = image
+    return image
+
+
+def get_font(name, size):
+    """pygame.font.SysFont, cached by (name, size)"""
+    key = (name, size)
+    font = _fonts.get(key)
+    if font is None:
+        font = pygame.font.SysFont(name, size)
+        _fonts[key] = font
+    return font
+
+
+def clear_cache():
+    """Forget every cached image and font"""
+    _images.clear()
+    _fonts.clear()
@@ -0,0 +1,604 @@
+"""Benchmarks for the games in old_py.
+
+    python bench.py imports                 # cold import time of each game module
+    python bench.py run                     # time every hot-path case
+    python bench.py run -k tank --save base.json
+    python bench.py compare base.json       # rerun and flag regressions
+
+Every import is timed in a fresh interpreter, after pygame and numpy are
+already loaded, so the numbers are the cost of the game module itself. The
+run fails if importing a game initializes pygame or opens a window.
+
+The cases run headless: the random module is seeded before each one, and
+the render cases draw to offscreen surfaces through SDL's dummy video
+driver. A case's time is the median (and best) over several repeats of the time
+per call, where each repeat makes enough calls to take at least
+MIN_RUN_TIME. compare judges the best times against the baseline's.
+
+A case that plays several frames per call is a generator function that
+yields at the end of each frame. It also reports its worst frame: the
+median over the calls of each call's slowest frame, flagged when it takes
+longer than a frame at 60 FPS.
+"""
+import argparse
+import atexit
+import contextlib
+import copy
+import datetime
+import fnmatch
+import inspect
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+GAME_MODULES = ["tank", "chess", "cake", "snail", "nine_lives", "snail_odds"]
+
+MIN_RUN_TIME = 0.05  # Seconds each timed repeat runs for at least
+THRESHOLD = 0.10  # Relative slowdown compare reports as a regression
+FRAME_BUDGET = 1 / 60  # Seconds a frame may take at 60 FPS
+SEED = 1234
+
+_IMPORT_PROBE = """
+import json, time
+import pygame, numpy
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed,
+                  "pygame_init": pygame.get_init(),
+                  "display_init": pygame.display.get_init()}}))
+"""
+
+
+def time_import(module, repeat=5):
+    """Median cold import time of module, plus whether it touched pygame state"""
+    env = dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1")
+    samples = []
+    side_effects = False
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", _IMPORT_PROBE.format(module=module)],
+                                cwd=HERE, env=env, capture_output=True, text=True, check=True)
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        samples.append(probe["seconds"])
+        side_effects |= probe["pygame_init"] or probe["display_init"]
+    return statistics.median(samples), side_effects
+
+
+def bench_imports(args):
+    failed = False
+    print(f"{'module':<12} {'import':>10}  pygame untouched")
+    for module in GAME_MODULES:
+        seconds, side_effects = time_import(module, args.repeat)
+        failed |= side_effects
+        print(f"{module:<12} {seconds * 1000:8.2f} ms  {'no' if side_effects else 'yes'}")
+    return 1 if failed else 0
+
+
+# Benchmark cases: name -> setup function returning the callable to time
+CASES = {}
+
+
+def case(name):
+    """Register a setup function as the benchmark case name"""
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+def init_video():
+    """Video for the render cases: a hidden dummy display, drawn to offscreen"""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    pygame.init()
+    if pygame.display.get_surface() is None:
+        pygame.display.set_mode((1, 1))
+    return pygame
+
+
+@case("tank.terrain")
+def bench_tank_terrain():
+    import tank
+    return lambda: tank.Terrain(tank.SCREEN_WIDTH, tank.SCREEN_HEIGHT)
+
+
+@case("tank.explosion")
+def bench_tank_explosion():
+    # A crater on a fresh copy of the same terrain every call
+    import tank
+    terrain = tank.Terrain(tank.SCREEN_WIDTH, tank.SCREEN_HEIGHT, SEED)
+    pristine = {index: terrain.chunk(index).copy() for index in range(terrain.n_chunks)}
+    x = terrain.width // 2
+    y = terrain.height - terrain.get_height_at(x)
+
+    def explode():
+        terrain.chunks = {index: chunk.copy() for index, chunk in pristine.items()}
+        terrain.collapsing = []
+        terrain.create_explosion(x, y, tank.EXPLOSION_RADIUS)
+    return explode
+
+
+@case("tank.collapse")
+def bench_tank_collapse():
+    # One step of the ground falling into a crater: the per-frame cost while
+    # it settles. Starts over from the fresh crater once everything is down
+    import tank
+    terrain = tank.Terrain(tank.SCREEN_WIDTH, tank.SCREEN_HEIGHT, SEED)
+    x = terrain.width // 2
+    y = terrain.height - terrain.get_height_at(x) + tank.EXPLOSION_RADIUS // 2
+    terrain.create_explosion(x, y, tank.EXPLOSION_RADIUS)
+    crater = {index: chunk.copy() for index, chunk in terrain.chunks.items()}
+    spans = [list(span) for span in terrain.collapsing]
+
+    def fall():
+        if not terrain.settle():
+            terrain.chunks = {index: chunk.copy() for index, chunk in crater.items()}
+            terrain.collapsing = [list(span) for span in spans]
+    return fall
+
+
+@case("tank.wide")
+def bench_tank_wide():
+    # A frame on a 20,000 px battlefield while the view pans across it at
+    # full scroll speed, generating, drawing and evicting chunks as it goes.
+    # Should cost about what render.tank does on a screen-sized one
+    pygame = init_video()
+    import tank
+    game = tank.Game(num_players=4, screen=pygame.Surface((tank.SCREEN_WIDTH, tank.SCREEN_HEIGHT)),
+                     width=20000)
+    span = game.terrain.width - tank.SCREEN_WIDTH
+
+    def frame():
+        game.camera_x = (game.camera_x + tank.CAMERA_SPEED) % span
+        game.retain_terrain()
+        game.draw()
+    return frame
+
+
+@case("tank.flight")
+def bench_tank_flight():
+    # A full shot from the first tank, stopped one step short of its impact.
+    # The barrel is raised until the shell clears the nearby slopes.
+    import tank
+    game = tank.Game(num_players=4)
+    shooter = game.tanks[0]
+    for angle in range(45, 181, 5):
+        shooter.barrel_angle = angle
+        scratch = copy.deepcopy(game.terrain)  # The impact digs a crater
+        shells = tank.Shells()
+        shooter.fire(shells)
+        steps = -1
+        while shells.count:
+            shells.step(scratch, [])
+            steps += 1
+        if steps >= 20:
+            break
+
+    def flight():
+        shells = tank.Shells()
+        shooter.fire(shells)
+        for _ in range(steps):
+            shells.step(game.terrain, game.tanks)
+    return flight
+
+
+@case("tank.barrage")
+def bench_tank_barrage():
+    # 300 shells dropped across the field at once, stepped until every one
+    # has landed and the ground has settled, on a fresh copy of the same
+    # terrain every call. A frame is a step and its terrain work; in the
+    # game that work overlaps drawing, here it is waited for
+    import random
+    import tank
+    terrain = tank.Terrain(tank.SCREEN_WIDTH, tank.SCREEN_HEIGHT, SEED)
+    pristine = {index: terrain.chunk(index).copy() for index in range(terrain.n_chunks)}
+    rng = random.Random(SEED)
+    volley = [(rng.uniform(0, terrain.width - 1), rng.uniform(0, 200), rng.uniform(-8, 8), rng.uniform(0, 10))
+              for _ in range(300)]
+    xs, ys, vxs, vys = (list(column) for column in zip(*volley))
+
+    def barrage():
+        terrain.chunks = {index: chunk.copy() for index, chunk in pristine.items()}
+        terrain.collapsing = []
+        shells = tank.Shells()
+        shells.add(xs, ys, vxs, vys, (0, 0, 0))
+        while shells.count or terrain.busy():
+            shells.step(terrain, [])
+            terrain.settle()
+            yield
+    return barrage
+
+
+@case("chess.movegen")
+def bench_chess_movegen():
+    import chess
+    board = chess.Board()
+    players = list(chess.Player)
+    return lambda: [board.generate_moves(player) for player in players]
+
+
+@case("chess.perft3")
+def bench_chess_perft():
+    import chess
+    board = chess.Board()
+    return lambda: board.perft(chess.Player.NORTH, 3)
+
+
+@case("chess.undo")
+def bench_chess_undo():
+    # Snapshot and restore through the game's undo history
+    import chess
+    game = chess.Game()
+
+    def undo():
+        game.save_game_state()
+        game.undo_move()
+    return undo
+
+
+@case("chess.make_unmake")
+def bench_chess_make_unmake():
+    import chess
+    board = chess.Board()
+    moves = board.generate_moves(chess.Player.NORTH)
+
+    def make_unmake():
+        for move in moves:
+            board.unmake_move(board.make_move(*move))
+    return make_unmake
+
+
+@case("chess.eval")
+def bench_chess_eval():
+    # One search node's evaluation, from the scores make_move keeps
+    import chess
+    import chess_eval
+    board = chess.Board()
+    return lambda: chess_eval.evaluate(board, chess.Player.NORTH)
+
+
+@case("chess.eval_full")
+def bench_chess_eval_full():
+    # The same scores summed over the whole board, as without the incremental updates
+    import chess
+    import chess_eval
+    board = chess.Board()
+    return lambda: chess_eval.scores(board)
+
+
+@case("chess.search")
+def bench_chess_search():
+    import chess
+    import chess_engine
+    board = chess.Board()
+    engine = chess_engine.Engine()
+
+    def search():
+        # From cold: nothing remembered from the previous call
+        engine.tables.clear()
+        engine.replies.clear()
+        engine.search(board, chess.Player.NORTH, board.generate_moves(chess.Player.NORTH))
+    return search
+
+
+@case("chess.ponder_reply")
+def bench_chess_ponder_reply():
+    # The bot's move after pondering the person's, which it had time to
+    # search in full: a lookup
+    import chess
+    import chess_engine
+    board = chess.Board()
+    engine = chess_engine.Engine()
+    engine.ponder(board, chess.Player.NORTH, chess.Player.EAST)
+    engine.thread.join()
+    board.make_move(*board.generate_moves(chess.Player.NORTH)[0])
+    return lambda: engine.choose_move(board, chess.Player.EAST)
+
+
+def temporary_folder():
+    """A new folder, removed with everything in it when the run exits"""
+    import tempfile
+    folder = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, folder, ignore_errors=True)
+    return folder
+
+
+@case("chess.book")
+def bench_chess_book():
+    # Lookup in a memory-mapped book of a million entries, the opening's
+    # position among them
+    import chess
+    import chess_book
+    board = chess.Board()
+    key = board.zobrist_key(chess.Player.NORTH)
+    entries = {(random.getrandbits(64), 0, 0): 1 for _ in range(1000000)}
+    entries[key, 23, 55] = 1
+    path = os.path.join(temporary_folder(), "book.bin")
+    chess_book.write_book(path, entries)
+    book = chess_book.OpeningBook(path)
+    return lambda: book.pick(key)
+
+
+@case("chess.tablebase")
+def bench_chess_tablebase():
+    # Probe of a king against king ending in a freshly built table
+    import chess
+    import chess_tablebase
+    path = os.path.join(temporary_folder(), "KK.ktb")
+    chess_tablebase.write_table(path, "KK", chess_tablebase.generate("KK"))
+    tables = chess_tablebase.Tablebases([chess_tablebase.Tablebase(path)])
+    board = chess.Board.__new__(chess.Board)
+    board.unpack(bytes(chess.BOARD_BYTES))
+    board.grid[0][8] = chess.Piece(chess.PieceType.KING, chess.Player.NORTH, 0, 8)
+    board.grid[15][7] = chess.Piece(chess.PieceType.KING, chess.Player.SOUTH, 15, 7)
+    return lambda: tables.probe(board, chess.Player.NORTH)
+
+
+@case("nine_lives.eval")
+def bench_nine_lives_eval():
+    import nine_lives
+    game = nine_lives.NineLives()
+    expressions = [[7], [3, '+', 4], [9, '×', '(', 8, '-', 2, ')'],
+                   ['(', 1, '+', 2, ')', '×', '(', 3, '+', 4, ')', '-', 5], [6, '-']]
+
+    def evaluate():
+        for expression in expressions:
+            game.current_expression = expression
+            game.calculate_value()
+    return evaluate
+
+
+@case("cake.collisions")
+def bench_cake_collisions():
+    # A player wandering through a crowded field: swept moves against the
+    # obstacle index plus the coin pickup check, 600 steps per call. The
+    # default gap between obstacles only leaves room for about 60 of them
+    import cake
+    game = cake.Game(6, obstacle_count=120, obstacle_gap=5)
+    assert len(game.obstacles) == 120, f"only {len(game.obstacles)} of 120 obstacles placed"
+    player = game.players[game.active_player]
+    start = player.x, player.y
+    rng = random.Random(SEED)
+    directions = [(rng.uniform(-1, 1) * cake.PLAYER_SPEED, rng.uniform(-1, 1) * cake.PLAYER_SPEED)
+                  for _ in range(600)]
+
+    def wander():
+        player.place(*start)
+        for dx, dy in directions:
+            player.stamina = cake.MAX_STAMINA
+            player.move(dx, dy, game.obstacles, game.obstacle_index)
+            game.collect_coins()
+    return wander
+
+
+@case("cake.spawn_dense")
+def bench_cake_spawn_dense():
+    # Setting up a game whose obstacles are packed edge to edge over about 90%
+    # of the board: placing them, then the coins and players in what is left
+    # (most coins find no room; the report of that on stderr is silenced)
+    import cake
+
+    def setup():
+        random.seed(SEED)
+        with contextlib.redirect_stderr(io.StringIO()):
+            return cake.Game(6, obstacle_count=1000, obstacle_gap=0)
+    game = setup()
+    covered = sum(o.width * o.height for o in game.obstacles) / cake.SCREEN_SIZE ** 2
+    assert covered > 0.85, f"obstacles cover only {covered:.0%} of the board"
+    return setup
+
+
+def offscreen(game, size):
+    """Point a game's drawing at an offscreen surface"""
+    pygame = init_video()
+    game.screen = pygame.Surface(size)
+    return game
+
+
+@case("render.tank")
+def bench_render_tank():
+    pygame = init_video()
+    import tank
+    game = tank.Game(num_players=4, screen=pygame.Surface((tank.SCREEN_WIDTH, tank.SCREEN_HEIGHT)))
+    return game.draw
+
+
+@case("render.chess")
+def bench_render_chess():
+    init_video()
+    import chess
+    game = chess.Game()
+    game.init_display()
+    return offscreen(game, (chess.SCREEN_WIDTH, chess.SCREEN_HEIGHT)).draw
+
+
+@case("render.cake")
+def bench_render_cake():
+    init_video()
+    import cake
+    return offscreen(cake.Game(4), (cake.SCREEN_SIZE, cake.SCREEN_SIZE)).draw
+
+
+@case("render.snail")
+def bench_render_snail():
+    init_video()
+    import snail
+    game = snail.SnailRace()
+    game.init_display()
+    game.snail_positions = [3, 1, 4, 1, 5, 2]
+    return offscreen(game, (snail.WIDTH, snail.HEIGHT)).draw
+
+
+@case("render.nine_lives")
+def bench_render_nine_lives():
+    init_video()
+    import nine_lives
+    game = nine_lives.NineLives()
+    game.init_display()
+    return offscreen(game, (nine_lives.SCREEN_WIDTH, nine_lives.SCREEN_HEIGHT)).draw
+
+
+def time_case(func, repeat):
+    """Median and best seconds per call of func, and the calls per repeat"""
+    func()  # Warm up caches and lazy loading
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_RUN_TIME:
+            break
+        number *= 2 if elapsed * 10 < MIN_RUN_TIME else 1 + int(MIN_RUN_TIME / max(elapsed, 1e-9))
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    return statistics.median(samples), min(samples), number
+
+
+def frame_timer(frames):
+    """A callable playing a generator function's frames through, and the list
+    it adds each call's slowest frame to"""
+    slowest = []
+
+    def play():
+        worst = 0.0
+        start = time.perf_counter()
+        for _ in frames():
+            now = time.perf_counter()
+            worst = max(worst, now - start)
+            start = now
+        slowest.append(worst)
+    return play, slowest
+
+
+def run_cases(patterns, repeat):
+    """Time every case matching one of patterns (all if none); print as they finish"""
+    results = {}
+    for name, setup in CASES.items():
+        if not matches(name, patterns):
+            continue
+        random.seed(SEED)
+        func, slowest = setup(), None
+        if inspect.isgeneratorfunction(func):
+            func, slowest = frame_timer(func)
+        median, best, number = time_case(func, repeat)
+        results[name] = {"median": median, "min": best, "number": number}
+        line = f"{name:<20} {format_time(median):>10}  (min {format_time(best)}, {number} calls x {repeat})"
+        if slowest:
+            worst = results[name]["worst_frame"] = statistics.median(slowest)
+            line += f"  worst frame {format_time(worst)}"
+            if worst > FRAME_BUDGET:
+                line += f" (over the {format_time(FRAME_BUDGET)} budget)"
+        print(line)
+    return results
+
+
+def matches(name, patterns):
+    return not patterns or any(fnmatch.fnmatch(name, f"*{p}*") for p in patterns)
+
+
+def format_time(seconds):
+    if seconds >= 1:
+        return f"{seconds:.3f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.3f} ms"
+    return f"{seconds * 1e6:.2f} us"
+
+
+def environment():
+    import numpy
+    import pygame
+    return {"date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "pygame": pygame.version.ver,
+            "numpy": numpy.__version__, "machine": platform.machine(),
+            "processor": platform.processor() or platform.machine()}
+
+
+def bench_run(args):
+    results = run_cases(args.cases, args.repeat)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+        print(f"Saved {len(results)} results to {args.save}")
+    return 0
+
+
+def bench_compare(args):
+    # Best times are compared: noise on a busy machine only ever adds time
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    baseline = {name: result for name, result in baseline.items() if matches(name, args.cases)}
+    if args.current:
+        with open(args.current) as f:
+            current = json.load(f)["results"]
+        current = {name: result for name, result in current.items() if matches(name, args.cases)}
+    else:
+        current = run_cases(args.cases, args.repeat)
+        print()
+
+    regressions = 0
+    print(f"{'case':<20} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name in sorted(set(baseline) | set(current)):
+        if name not in baseline or name not in current:
+            print(f"{name:<20} {'only in ' + ('baseline' if name in baseline else 'current'):>30}")
+            continue
+        before, after = baseline[name]["min"], current[name]["min"]
+        change = after / before - 1
+        flag = ""
+        if change > args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif change < -args.threshold:
+            flag = "  faster"
+        print(f"{name:<20} {format_time(before):>10} {format_time(after):>10} {change:+8.1%}{flag}")
+    if regressions:
+        print(f"{regressions} case(s) slower than the baseline by more than {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks for the old_py games')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    imports = commands.add_parser('imports', help='Cold import time of each game module')
+    imports.add_argument('--repeat', type=int, default=5,
+                         help='Fresh interpreters per module')
+    imports.set_defaults(func=bench_imports)
+
+    run = commands.add_parser('run', help='Time the hot-path cases')
+    run.add_argument('-k', dest='cases', action='append', default=[], metavar='PATTERN',
+                     help='Only cases whose name contains PATTERN (repeatable)')
+    run.add_argument('--repeat', type=int, default=5, help='Timed repeats per case')
+    run.add_argument('--save', metavar='PATH', help='Write the results as a JSON baseline')
+    run.set_defaults(func=bench_run)
+
+    compare = commands.add_parser('compare', help='Compare against a saved baseline')
+    compare.add_argument('baseline', help='JSON written by run --save')
+    compare.add_argument('--current', metavar='PATH',
+                         help='Compare this saved run instead of running the cases now')
+    compare.add_argument('-k', dest='cases', action='append', default=[], metavar='PATTERN',
+                         help='Only cases whose name contains PATTERN (repeatable)')
+    compare.add_argument('--repeat', type=int, default=5, help='Timed repeats per case')
+    compare.add_argument('--threshold', type=float, default=THRESHOLD,
+                         help='Relative slowdown that counts as a regression (0.10 = 10%%)')
+    compare.set_defaults(func=bench_compare)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
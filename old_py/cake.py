@@ -2,9 +2,16 @@ import pygame
 import random
 import sys
 import math
-
-# Initialize pygame
-pygame.init()
+import heapq
+import argparse
+import struct
+import numpy as np
+import gameloop
+import replay
+from assets import get_font
+import profiler
+from profiler import profiled
+from timestep import FixedTimestep, lerp
 
 # Game constants
 SCREEN_SIZE = 600
@@ -16,6 +23,31 @@ MAX_STAMINA = 500
 COIN_RADIUS = 8
 OBSTACLE_MIN_SIZE = 20
 OBSTACLE_MAX_SIZE = 60
+COIN_SPACING = COIN_RADIUS * 3  # Minimum distance between coin centers
+PLAYER_SPACING = PLAYER_RADIUS * 2
+OBSTACLE_GAP = PLAYER_SPACING + 1  # Pixels kept clear between obstacles, so a player fits between any two
+SPAWN_ATTEMPTS = 30  # Rejected Poisson-disk candidates in a row before giving up on the rest
+PLAYER_SPEED = 5  # Pixels per simulation step
+SIMULATION_RATE = 60  # Simulation steps per second
+SLIDE_ITERATIONS = 2  # Wall contacts resolved per move by sliding along them
+CONTACT_SKIN = 0.01  # Pixels kept between a player and the obstacle it touches
+INDEX_CELL = 64  # Obstacle spatial index cell size in pixels
+COIN_CELL = 32  # Coin lookup cell size; at least the player-coin pickup distance
+TEXT_CACHE_SIZE = 256  # Rendered HUD strings kept between frames
+NAV_CELL = 10  # Bot navigation grid cell size in pixels
+BOT_PLAN_CELLS = 2000  # Cells a bot's route planning may expand per step (~8 ms)
+CLUSTER_RADIUS = 4  # Cells around a coin counted as its neighbourhood
+CLUSTER_WEIGHT = 0.25  # Value of each nearby coin relative to the coin itself
+
+# Snapshot layout (see snapshot.py): a header of player, active player,
+# obstacle, coin, bot and held key counts and the timestep accumulator, then
+# the records below, the held keys and each bot's stuck count and route
+SNAPSHOT = struct.Struct("<BBHHBBd")
+PLAYER_RECORD = np.dtype([('x', '<f8'), ('y', '<f8'), ('prev_x', '<f8'), ('prev_y', '<f8'),
+                          ('stamina', '<f8'), ('score', '<u2')])
+OBSTACLE_RECORD = np.dtype([('x', '<i2'), ('y', '<i2'), ('w', '<i2'), ('h', '<i2')])
+COIN_RECORD = np.dtype([('x', '<i2'), ('y', '<i2'), ('color', 'u1'), ('collected', 'u1')])
+BOT_HEADER = struct.Struct("<BH")  # Stuck count, route length; then x, y i16 pairs
 
 # Colors
 BLACK = (0, 0, 0)
@@ -30,33 +62,29 @@ PLAYER_COLORS = [
     (0, 255, 255)   # Cyan (for extra players)
 ]
 
-# Create screen
-screen = pygame.display.set_mode((SCREEN_SIZE, SCREEN_SIZE))
-pygame.display.set_caption("N-Player Collection Game")
-clock = pygame.time.Clock()
-
 class Player:
-    def __init__(self, idx):
+    def __init__(self, idx, x, y):
         self.idx = idx
         self.color = PLAYER_COLORS[idx % len(PLAYER_COLORS)]
-        self.reset_position()
+        self.place(x, y)
         self.score = 0
         self.stamina = MAX_STAMINA
     
-    def reset_position(self):
-        # Place player at random position (ensuring not on obstacles)
-        placed = False
-        while not placed:
-            self.x = random.randint(PLAYER_RADIUS, SCREEN_SIZE - PLAYER_RADIUS)
-            self.y = random.randint(PLAYER_RADIUS, SCREEN_SIZE - PLAYER_RADIUS)
-            placed = True  # Will be set to False if colliding with obstacles
+    def place(self, x, y):
+        # Standing still, so the position before the last step is this one too
+        self.x = self.prev_x = x
+        self.y = self.prev_y = y
     
-    def draw(self, is_active):
-        pygame.draw.circle(screen, self.color, (self.x, self.y), PLAYER_RADIUS)
+    def draw(self, surface, is_active, alpha=1.0):
+        # Drawn alpha of the way from the previous step's position to the current one
+        x = lerp(self.prev_x, self.x, alpha)
+        y = lerp(self.prev_y, self.y, alpha)
+        pygame.draw.circle(surface, self.color, (x, y), PLAYER_RADIUS)
         if is_active:
-            pygame.draw.circle(screen, WHITE, (self.x, self.y), PLAYER_RADIUS + 3, 2)
+            pygame.draw.circle(surface, WHITE, (x, y), PLAYER_RADIUS + 3, 2)
     
-    def move(self, dx, dy, obstacles):
+    @profiled("cake.move")
+    def move(self, dx, dy, obstacles, index=None):
         if self.stamina <= 0:
             return False
         
@@ -66,44 +94,64 @@ class Player:
             # Scale down movement if it would exceed stamina
             dx = dx * self.stamina / distance
             dy = dy * self.stamina / distance
-            distance = self.stamina
-        
-        # Check if move is valid (not hitting obstacles)
-        new_x = self.x + dx
-        new_y = self.y + dy
         
         # Ensure player stays on screen
-        if new_x < PLAYER_RADIUS:
-            new_x = PLAYER_RADIUS
-        elif new_x > SCREEN_SIZE - PLAYER_RADIUS:
-            new_x = SCREEN_SIZE - PLAYER_RADIUS
+        dx = min(max(self.x + dx, PLAYER_RADIUS), SCREEN_SIZE - PLAYER_RADIUS) - self.x
+        dy = min(max(self.y + dy, PLAYER_RADIUS), SCREEN_SIZE - PLAYER_RADIUS) - self.y
+        if dx == 0 and dy == 0:
+            return False
         
-        if new_y < PLAYER_RADIUS:
-            new_y = PLAYER_RADIUS
-        elif new_y > SCREEN_SIZE - PLAYER_RADIUS:
-            new_y = SCREEN_SIZE - PLAYER_RADIUS
+        # Obstacles near the swept path, from the spatial index when there is
+        # one. Sliding can turn the path, but never takes it further from the
+        # start than the length of the move
+        if index is not None:
+            reach = math.hypot(dx, dy)
+            boxes = index.query(self.x - reach, self.y - reach, self.x + reach, self.y + reach, PLAYER_RADIUS)
+        else:
+            boxes = obstacle_boxes(obstacles)
         
-        # Check for obstacle collisions
-        for obstacle in obstacles:
-            if obstacle.collides_with_point(new_x, new_y, PLAYER_RADIUS):
-                return False  # Can't move into an obstacle
+        # Sweep toward the target; on contact, stop just short of the obstacle
+        # and slide along its surface with the rest of the motion
+        x, y = self.x, self.y
+        for _ in range(SLIDE_ITERATIONS + 1):
+            length = math.hypot(dx, dy)
+            if length < 1e-6:
+                break
+            t, nx, ny = sweep_circle(x, y, dx, dy, PLAYER_RADIUS, boxes)
+            if t >= 1:
+                x += dx
+                y += dy
+                break
+            travel = max(0.0, t - CONTACT_SKIN / length)
+            x += dx * travel
+            y += dy * travel
+            dx, dy = dx * (1 - travel), dy * (1 - travel)
+            along = dx * nx + dy * ny
+            dx, dy = dx - along * nx, dy - along * ny
+        
+        moved = math.hypot(x - self.x, y - self.y)
+        if moved < 1e-6:
+            return False  # Can't move into an obstacle
         
         # Update position
-        self.x = new_x
-        self.y = new_y
-        self.stamina -= distance
+        self.stamina -= min(self.stamina, moved)
+        self.x = x
+        self.y = y
         return True
 
 class Obstacle:
     def __init__(self):
         self.width = random.randint(OBSTACLE_MIN_SIZE, OBSTACLE_MAX_SIZE)
         self.height = random.randint(OBSTACLE_MIN_SIZE, OBSTACLE_MAX_SIZE)
-        self.x = random.randint(0, SCREEN_SIZE - self.width)
-        self.y = random.randint(0, SCREEN_SIZE - self.height)
+        self.place(0, 0)  # Until SpawnMap.place_obstacles finds it a spot
+    
+    def place(self, x, y):
+        self.x = x
+        self.y = y
         self.rect = pygame.Rect(self.x, self.y, self.width, self.height)
     
-    def draw(self):
-        pygame.draw.rect(screen, GRAY, self.rect)
+    def draw(self, surface):
+        pygame.draw.rect(surface, GRAY, self.rect)
     
     def collides_with_point(self, x, y, radius):
         # Check if a circle collides with this obstacle
@@ -112,17 +160,135 @@ class Obstacle:
         distance = math.sqrt((x - closest_x) ** 2 + (y - closest_y) ** 2)
         return distance < radius
 
+def obstacle_boxes(obstacles):
+    # (N, 4) array of obstacle bounds as x0, y0, x1, y1
+    boxes = [(o.x, o.y, o.x + o.width, o.y + o.height) for o in obstacles]
+    return np.array(boxes, dtype=float).reshape(-1, 4)
+
+def sweep_circle(x, y, dx, dy, radius, boxes):
+    """Time of impact of a circle moving by (dx, dy) against many boxes at once.
+
+    Returns (t, nx, ny): the fraction of the move completed before first
+    contact and the contact normal, or (1.0, 0.0, 0.0) if nothing is hit.
+    Each box is treated as its Minkowski sum with the circle, a rounded
+    rectangle: a ray/slab test against the box grown by the radius, then a
+    ray/circle test at the corner when the slab hit lands in a corner region.
+    A circle that already overlaps a box hits it at t = 0 if it moves further in.
+    """
+    if not len(boxes):
+        return 1.0, 0.0, 0.0
+    x0, y0, x1, y1 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if dx != 0:
+            tx0 = (x0 - radius - x) / dx
+            tx1 = (x1 + radius - x) / dx
+            tx_near, tx_far = np.minimum(tx0, tx1), np.maximum(tx0, tx1)
+        else:
+            inside = (x0 - radius < x) & (x < x1 + radius)
+            tx_near = np.where(inside, -np.inf, np.inf)
+            tx_far = np.where(inside, np.inf, -np.inf)
+        if dy != 0:
+            ty0 = (y0 - radius - y) / dy
+            ty1 = (y1 + radius - y) / dy
+            ty_near, ty_far = np.minimum(ty0, ty1), np.maximum(ty0, ty1)
+        else:
+            inside = (y0 - radius < y) & (y < y1 + radius)
+            ty_near = np.where(inside, -np.inf, np.inf)
+            ty_far = np.where(inside, np.inf, -np.inf)
+    t_near = np.maximum(tx_near, ty_near)
+    t_far = np.minimum(tx_far, ty_far)
+    
+    # Face normals: the slab entered last is the face that was hit
+    x_face = tx_near > ty_near
+    nx = np.where(x_face, -math.copysign(1.0, dx), 0.0)
+    ny = np.where(x_face, 0.0, -math.copysign(1.0, dy))
+    
+    # Boxes the ray never enters are out of the running from here on
+    t_near = np.where(t_near <= t_far, t_near, np.inf)
+    finite = np.isfinite(t_near)
+    
+    # Hits in a corner region are against the rounded corner instead
+    hx = x + np.where(finite, t_near, 0.0) * dx
+    hy = y + np.where(finite, t_near, 0.0) * dy
+    corner_x = np.where(hx < x0, x0, x1)
+    corner_y = np.where(hy < y0, y0, y1)
+    in_corner = finite & ((hx < x0) | (hx > x1)) & ((hy < y0) | (hy > y1))
+    if in_corner.any():
+        ox, oy = x - corner_x, y - corner_y
+        a = dx * dx + dy * dy
+        b = ox * dx + oy * dy
+        c = ox * ox + oy * oy - radius * radius
+        disc = b * b - a * c
+        t_corner = (-b - np.sqrt(np.maximum(disc, 0.0))) / a
+        t_corner = np.where(disc >= 0, t_corner, np.inf)
+        nx = np.where(in_corner, (ox + np.where(disc >= 0, t_corner, 0.0) * dx) / radius, nx)
+        ny = np.where(in_corner, (oy + np.where(disc >= 0, t_corner, 0.0) * dy) / radius, ny)
+        t_near = np.where(in_corner, t_corner, t_near)
+    
+    # A circle already overlapping a box is in contact with it now, with the
+    # normal pushing it out: away from the nearest point of the box, or out
+    # through the nearest face when its centre is inside
+    px, py = x - np.clip(x, x0, x1), y - np.clip(y, y0, y1)
+    distance = np.hypot(px, py)
+    overlap = distance < radius
+    if overlap.any():
+        faces = np.argmin(np.stack([x - x0, x1 - x, y - y0, y1 - y]), axis=0)
+        outside = distance > 0
+        scale = np.where(outside, distance, 1.0)
+        nx = np.where(overlap, np.where(outside, px / scale, np.choose(faces, [-1.0, 1.0, 0.0, 0.0])), nx)
+        ny = np.where(overlap, np.where(outside, py / scale, np.choose(faces, [0.0, 0.0, -1.0, 1.0])), ny)
+        t_near = np.where(overlap, 0.0, t_near)
+    
+    # Only count contacts ahead of us (within the skin, as a fraction of the
+    # move) that we are moving into, so a circle can always move out of or
+    # along a box it touches but never further in
+    skin = CONTACT_SKIN / math.hypot(dx, dy)
+    hit = (t_near >= -skin) & (t_near <= 1) & (nx * dx + ny * dy < 0)
+    if not hit.any():
+        return 1.0, 0.0, 0.0
+    first = np.flatnonzero(hit)[np.argmin(t_near[hit])]
+    return max(0.0, float(t_near[first])), float(nx[first]), float(ny[first])
+
+class ObstacleIndex:
+    """Uniform grid of obstacle bounds, so movement only tests nearby obstacles"""
+    def __init__(self, obstacles, cell=INDEX_CELL):
+        self.cell = cell
+        self.boxes = obstacle_boxes(obstacles)
+        buckets = {}
+        for i, (x0, y0, x1, y1) in enumerate(self.boxes):
+            for cx in range(int(x0) // cell, int(x1) // cell + 1):
+                for cy in range(int(y0) // cell, int(y1) // cell + 1):
+                    buckets.setdefault((cx, cy), []).append(i)
+        self.buckets = {key: np.array(ids) for key, ids in buckets.items()}
+    
+    def query(self, x0, y0, x1, y1, margin=0):
+        # Boxes in every cell touched by the (margin-grown) rectangle
+        found = []
+        for cx in range(int(x0 - margin) // self.cell, int(x1 + margin) // self.cell + 1):
+            for cy in range(int(y0 - margin) // self.cell, int(y1 + margin) // self.cell + 1):
+                ids = self.buckets.get((cx, cy))
+                if ids is not None:
+                    found.append(ids)
+        if not found:
+            return self.boxes[:0]
+        return self.boxes[np.unique(np.concatenate(found))]
+
 class Coin:
-    def __init__(self, color_idx):
+    def __init__(self, color_idx, x, y):
         self.color_idx = color_idx
         self.color = PLAYER_COLORS[color_idx % len(PLAYER_COLORS)]
-        self.x = random.randint(COIN_RADIUS, SCREEN_SIZE - COIN_RADIUS)
-        self.y = random.randint(COIN_RADIUS, SCREEN_SIZE - COIN_RADIUS)
+        self.x = x
+        self.y = y
         self.collected = False
     
-    def draw(self):
+    def draw(self, surface):
         if not self.collected:
-            pygame.draw.circle(screen, self.color, (self.x, self.y), COIN_RADIUS)
+            pygame.draw.circle(surface, self.color, (self.x, self.y), COIN_RADIUS)
+    
+    def get_rect(self):
+        # Area covered by the drawn coin, with a pixel of slack for antialiasing
+        return pygame.Rect(self.x - COIN_RADIUS - 1, self.y - COIN_RADIUS - 1,
+                           2 * COIN_RADIUS + 3, 2 * COIN_RADIUS + 3)
     
     def check_collision(self, player):
         if not self.collected and player.idx == self.color_idx:
@@ -133,77 +299,474 @@ class Coin:
                 return True
         return False
 
+class SpawnMap:
+    """Free-space masks over the board used to place obstacles, coins and players.
+
+    Each mask marks the integer positions where a circle of the given radius
+    fits on screen without touching any obstacle, so valid spawn points are
+    drawn directly instead of re-rolled until they miss every obstacle.
+    Masks are indexed [x, y] like the tank terrain grid.
+    """
+    def __init__(self, obstacles, size=SCREEN_SIZE):
+        self.size = size
+        self.obstacles = obstacles
+        self.masks = {}
+        self.free_points = {}
+    
+    @staticmethod
+    def place_obstacles(obstacles, size=SCREEN_SIZE, gap=OBSTACLE_GAP, clear=()):
+        """Place obstacles without overlap; returns (placed, dropped).
+
+        Obstacles are kept at least gap pixels apart, so with the default
+        gap a player always fits between two. That caps how much of the
+        board they can cover (about a fifth of it). A gap of 0 packs them
+        edge to edge from the top-left corner instead, which covers up to
+        about 90% of the board. No obstacle is put inside the circles in
+        clear, given as (x, y, radius).
+        """
+        # A summed-area table of the occupied pixels gives every free
+        # top-left corner for an obstacle in one array operation; obstacles
+        # that no longer fit are shrunk, and once the minimum size does not
+        # fit the rest are dropped, so setup time stays bounded.
+        # The table counts how many (gap-grown) obstacles cover each pixel, so
+        # adding one is an outer product of two clipped ramps, not a new cumsum.
+        table = np.zeros((size + 1, size + 1), dtype=np.int32)
+        ramp = np.arange(1, size + 1, dtype=np.int32)
+        
+        def occupy(x0, y0, x1, y1):
+            x0, x1 = max(0, x0), min(size, x1)
+            y0, y1 = max(0, y0), min(size, y1)
+            if x0 < x1 and y0 < y1:
+                table[x0 + 1:, y0 + 1:] += np.outer(np.minimum(ramp[:size - x0], x1 - x0),
+                                                    np.minimum(ramp[:size - y0], y1 - y0))
+        
+        for x, y, radius in clear:
+            occupy(x - radius, y - radius, x + radius, y + radius)
+        placed = []
+        for obstacle in obstacles:
+            while True:
+                w, h = obstacle.width, obstacle.height
+                window = table[w:, h:] - table[:-w, h:]
+                window -= table[w:, :-h]
+                window += table[:-w, :-h]
+                free = window == 0
+                if not gap:
+                    # Packing: only corners pushed as far up and left as they go
+                    free[1:, :] &= ~free[:-1, :]
+                    free[:, 1:] &= ~free[:, :-1]
+                free = np.flatnonzero(free)
+                if len(free) or (w <= OBSTACLE_MIN_SIZE and h <= OBSTACLE_MIN_SIZE):
+                    break
+                obstacle.width = max(OBSTACLE_MIN_SIZE, w // 2)
+                obstacle.height = max(OBSTACLE_MIN_SIZE, h // 2)
+            if not len(free):
+                break  # Nothing smaller than the minimum size fits either
+            if not gap:
+                # ...and of those, the eighth nearest the top-left corner, so
+                # the field fills in from there without leaving holes behind
+                xs, ys = np.unravel_index(free, window.shape)
+                free = free[np.argsort(xs + ys, kind='stable')[:max(1, len(free) // 8)]]
+            x, y = np.unravel_index(free[random.randrange(len(free))], window.shape)
+            obstacle.place(int(x), int(y))
+            occupy(obstacle.x - gap, obstacle.y - gap, obstacle.x + w + gap, obstacle.y + h + gap)
+            placed.append(obstacle)
+        return placed, len(obstacles) - len(placed)
+    
+    def free_mask(self, radius):
+        # Positions where a circle of this radius is on screen and clear of
+        # every obstacle (each obstacle dilated by the radius)
+        if radius in self.masks:
+            return self.masks[radius]
+        mask = np.zeros((self.size, self.size), dtype=bool)
+        mask[radius:self.size - radius + 1, radius:self.size - radius + 1] = True
+        for obstacle in self.obstacles:
+            x0 = max(0, obstacle.x - radius)
+            x1 = min(self.size, obstacle.x + obstacle.width + radius + 1)
+            y0 = max(0, obstacle.y - radius)
+            y1 = min(self.size, obstacle.y + obstacle.height + radius + 1)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            xs = np.arange(x0, x1)
+            ys = np.arange(y0, y1)
+            # Same test as Obstacle.collides_with_point, for a whole window at once
+            dx = np.maximum(np.maximum(obstacle.x - xs, 0), xs - (obstacle.x + obstacle.width))
+            dy = np.maximum(np.maximum(obstacle.y - ys, 0), ys - (obstacle.y + obstacle.height))
+            blocked = dx[:, None] ** 2 + dy[None, :] ** 2 < radius * radius
+            mask[x0:x1, y0:y1] &= ~blocked
+        self.masks[radius] = mask
+        self.free_points[radius] = np.flatnonzero(mask)
+        return mask
+    
+    def sample(self, radius, count, spacing=0):
+        """Draw up to count free positions, at least spacing apart; fewer if they do not fit"""
+        self.free_mask(radius)
+        free = self.free_points[radius]
+        if not len(free):
+            return []
+        
+        def draw_point():
+            x, y = divmod(int(free[random.randrange(len(free))]), self.size)
+            return x, y
+        
+        if spacing <= 0:
+            return [draw_point() for _ in range(count)]
+        
+        # Poisson-disk dart throwing with a background grid: a cell of side
+        # spacing/sqrt(2) holds at most one point, so each candidate only
+        # checks its 5x5 cell neighbourhood.
+        cell = spacing / math.sqrt(2)
+        grid = {}
+        points = []
+        misses = 0
+        while len(points) < count and misses < SPAWN_ATTEMPTS:
+            x, y = draw_point()
+            cx, cy = int(x / cell), int(y / cell)
+            clear = True
+            for gx in range(cx - 2, cx + 3):
+                for gy in range(cy - 2, cy + 3):
+                    other = grid.get((gx, gy))
+                    if other and (other[0] - x) ** 2 + (other[1] - y) ** 2 < spacing * spacing:
+                        clear = False
+                        break
+                if not clear:
+                    break
+            if clear:
+                grid[(cx, cy)] = (x, y)
+                points.append((x, y))
+                misses = 0
+            else:
+                misses += 1
+        # A board too crowded for the spacing leaves the rest out
+        return points
+
+class NavGrid:
+    """Coarse walkability grid over the player free-space mask for bot planning"""
+    def __init__(self, spawn_map, cell=NAV_CELL):
+        self.cell = cell
+        self.expanded = 0  # Cells expanded by search() so far, the planners' work budget
+        self.w = spawn_map.size // cell
+        self.h = spawn_map.size // cell
+        # A cell is walkable only if a player fits everywhere inside it, so the
+        # straight line between two neighbouring walkable cell centres is clear
+        mask = spawn_map.free_mask(PLAYER_RADIUS)[:self.w * cell, :self.h * cell]
+        walkable = mask.reshape(self.w, cell, self.h, cell).all(axis=(1, 3))
+        self.walkable = walkable.ravel().tolist()
+        
+        # Neighbour lists with edge costs in pixels; diagonals may not cut corners
+        diagonal = cell * math.sqrt(2)
+        self.neighbours = []
+        for idx in range(self.w * self.h):
+            cx, cy = divmod(idx, self.h)
+            edges = []
+            for ox in (-1, 0, 1):
+                for oy in (-1, 0, 1):
+                    nx, ny = cx + ox, cy + oy
+                    if (ox == 0 and oy == 0) or not (0 <= nx < self.w and 0 <= ny < self.h):
+                        continue
+                    if not self.walkable[nx * self.h + ny]:
+                        continue
+                    if ox and oy:
+                        if not (self.walkable[nx * self.h + cy] and self.walkable[cx * self.h + ny]):
+                            continue
+                        edges.append((nx * self.h + ny, diagonal))
+                    else:
+                        edges.append((nx * self.h + ny, cell))
+            self.neighbours.append(edges)
+    
+    def cell_of(self, x, y):
+        cx = min(self.w - 1, max(0, int(x) // self.cell))
+        cy = min(self.h - 1, max(0, int(y) // self.cell))
+        return cx * self.h + cy
+    
+    def center(self, idx):
+        cx, cy = divmod(idx, self.h)
+        return cx * self.cell + self.cell // 2, cy * self.cell + self.cell // 2
+    
+    def coins_by_cell(self, coins):
+        # Map each walkable cell to the coins collected by standing at its centre
+        if not coins:
+            return {}
+        reach = PLAYER_RADIUS + COIN_RADIUS - 1
+        xs = np.array([coin.x for coin in coins])
+        ys = np.array([coin.y for coin in coins])
+        walkable = np.array(self.walkable)
+        span = reach // self.cell + 1
+        by_cell = {}
+        for ox in range(-span, span + 1):
+            for oy in range(-span, span + 1):
+                cx = xs // self.cell + ox
+                cy = ys // self.cell + oy
+                centre_x = cx * self.cell + self.cell // 2
+                centre_y = cy * self.cell + self.cell // 2
+                ok = ((0 <= cx) & (cx < self.w) & (0 <= cy) & (cy < self.h)
+                      & ((centre_x - xs) ** 2 + (centre_y - ys) ** 2 < reach * reach))
+                idxs = np.where(ok, cx * self.h + cy, 0)
+                ok &= walkable[idxs]
+                for i in np.flatnonzero(ok):
+                    by_cell.setdefault(int(idxs[i]), []).append(coins[i])
+        return by_cell
+    
+    def search(self, start, budget, gain):
+        # Dijkstra from start, bounded by the stamina budget. Cells are scored by
+        # gain per pixel travelled; the search stops as soon as no farther cell
+        # could beat the best score, so dense coin fields need tiny searches.
+        max_gain = gain(None)
+        dist = {start: 0.0}
+        parent = {start: None}
+        heap = [(0.0, start)]
+        best, best_score = None, 0.0
+        while heap:
+            d, idx = heapq.heappop(heap)
+            if d > dist[idx]:
+                continue
+            self.expanded += 1
+            if best is not None and max_gain / (d + self.cell) <= best_score:
+                break
+            value = gain(idx)
+            if value and value / (d + self.cell) > best_score:
+                best, best_score = idx, value / (d + self.cell)
+            for neighbour, cost in self.neighbours[idx]:
+                nd = d + cost
+                if nd <= budget and nd < dist.get(neighbour, budget + 1):
+                    dist[neighbour] = nd
+                    parent[neighbour] = idx
+                    heapq.heappush(heap, (nd, neighbour))
+        if best is None:
+            return None, 0.0, []
+        path = []
+        idx = best
+        while idx is not None:
+            path.append(idx)
+            idx = parent[idx]
+        path.reverse()
+        return best, dist[best], path
+
+class Bot:
+    """Computer player that routes through the obstacle field to its coins"""
+    def __init__(self, player, nav, coins):
+        self.player = player
+        self.nav = nav
+        self.coins_by_cell = nav.coins_by_cell([c for c in coins if c.color_idx == player.idx])
+        self.route = []
+        self.stuck = 0
+    
+    def start_turn(self):
+        self.route = []
+        self.stuck = 0
+    
+    @profiled("cake.plan")
+    def plan(self, work_budget=BOT_PLAN_CELLS):
+        # Greedy orienteering: repeatedly head for the cell with the best
+        # (coins there + weighted coins nearby) per pixel of travel, until the
+        # stamina or the per-step work budget runs out. A partial route is
+        # fine; the bot plans again from wherever it ends up. The budget counts
+        # expanded cells rather than seconds so replays plan identical routes.
+        nav = self.nav
+        work_limit = nav.expanded + work_budget
+        player = self.player
+        counts = np.zeros((nav.w, nav.h), dtype=np.int32)
+        for idx, coins in self.coins_by_cell.items():
+            counts.flat[idx] = sum(1 for coin in coins if not coin.collected)
+        if not counts.any():
+            return
+        
+        # Coins within CLUSTER_RADIUS cells of each cell, via a summed-area table
+        r = CLUSTER_RADIUS
+        padded = np.pad(counts, r + 1)
+        table = padded.cumsum(axis=0).cumsum(axis=1)
+        size = 2 * r + 1
+        nearby = (table[size:, size:] - table[:-size, size:]
+                  - table[size:, :-size] + table[:-size, :-size])[:nav.w, :nav.h]
+        nearby = nearby.ravel().tolist()
+        max_gain = counts.max() + CLUSTER_WEIGHT * max(nearby)
+        
+        taken = set()
+        
+        def gain(idx):
+            if idx is None:
+                return max_gain
+            coins = self.coins_by_cell.get(idx)
+            if not coins:
+                return 0
+            here = sum(1 for coin in coins if not coin.collected and id(coin) not in taken)
+            return here + CLUSTER_WEIGHT * nearby[idx] if here else 0
+        
+        current = nav.cell_of(player.x, player.y)
+        cx, cy = nav.center(current)
+        budget = player.stamina - math.hypot(cx - player.x, cy - player.y)
+        while budget > 0 and nav.expanded < work_limit:
+            target, cost, path = nav.search(current, budget, gain)
+            if target is None:
+                break
+            for idx in path:
+                taken.update(id(coin) for coin in self.coins_by_cell.get(idx, ()))
+            self.route.extend(nav.center(idx) for idx in path[1:] or path)
+            budget -= cost
+            current = target
+    
+    def update(self, obstacles, index=None):
+        # Returns False once the bot has nothing left to do this turn
+        player = self.player
+        if player.stamina <= 0 or self.stuck > 3:
+            return False
+        if not self.route:
+            self.plan()
+            if not self.route:
+                return False
+        tx, ty = self.route[0]
+        dx, dy = tx - player.x, ty - player.y
+        distance = math.hypot(dx, dy)
+        if distance > PLAYER_SPEED:
+            dx, dy = dx * PLAYER_SPEED / distance, dy * PLAYER_SPEED / distance
+        if distance == 0 or player.move(dx, dy, obstacles, index):
+            if math.hypot(tx - player.x, ty - player.y) < 0.5:
+                self.route.pop(0)
+        else:
+            # Blocked (e.g. clipping a corner on the way to the first cell centre)
+            self.route = []
+            self.stuck += 1
+        return True
+
 class Game:
-    def __init__(self, n_players=N_PLAYERS):
+    def __init__(self, n_players=N_PLAYERS, obstacle_count=OBSTACLE_COUNT, obstacle_gap=OBSTACLE_GAP,
+                 n_bots=0, screen=None):
+        # Screen is set by main(), so a Game can be built and played headless
+        self.screen = screen
         self.n_players = n_players
         self.active_player = 0
-        self.players = [Player(i) for i in range(n_players)]
         
-        # Create obstacles
-        self.obstacles = []
-        for _ in range(OBSTACLE_COUNT):
-            self.obstacles.append(Obstacle())
+        # The players' spots are drawn first and kept clear of obstacles, so
+        # however crowded the board gets everyone has somewhere to stand
+        spots = SpawnMap([]).sample(PLAYER_RADIUS, n_players, PLAYER_SPACING)
+        
+        # Create obstacles; those that do not fit are counted, not placed
+        self.obstacles, self.dropped_obstacles = SpawnMap.place_obstacles(
+            [Obstacle() for _ in range(obstacle_count)], gap=obstacle_gap,
+            clear=[(x, y, PLAYER_RADIUS) for x, y in spots])
+        self.report_dropped("obstacles", obstacle_count, self.dropped_obstacles)
+        self.spawn_map = SpawnMap(self.obstacles)
         
-        # Create coins (equal number for each player)
-        self.coins = []
-        for i in range(n_players):
-            for _ in range(COIN_COUNT // n_players):
-                self.coins.append(Coin(i))
+        # Create coins (equal number for each player) and players where they
+        # do not overlap any obstacle
+        self.validate_positions(spots)
         
-        # Ensure no overlaps between game elements
-        self.validate_positions()
+        self.build_lookups(min(n_bots, self.n_players))
         
-        self.font = pygame.font.SysFont(None, 24)
+        self.font = None  # Loaded on first draw
+        self.running = True
+        self.held_keys = set()  # Keys currently down, tracked from events
+        self.text_cache = {}
         
-    def validate_positions(self):
-        # Make sure coins don't spawn on obstacles
+        # Movement runs at a fixed rate, independent of the frame rate
+        self.timestep = FixedTimestep(SIMULATION_RATE)
+        
+    def build_lookups(self, n_bots):
+        # Everything derived from where the obstacles and coins are
+        self.obstacle_index = ObstacleIndex(self.obstacles)
+        
+        # The last n_bots players are controlled by the computer
+        self.bots = {}
+        if n_bots:
+            nav = NavGrid(self.spawn_map)
+            for player in self.players[self.n_players - n_bots:]:
+                self.bots[player.idx] = Bot(player, nav, self.coins)
+        
+        # Coins bucketed by position so only those near a player are checked
+        self.coin_cells = {}
+        self.coin_order = {id(coin): i for i, coin in enumerate(self.coins)}
         for coin in self.coins:
-            placed = False
-            while not placed:
-                coin.x = random.randint(COIN_RADIUS, SCREEN_SIZE - COIN_RADIUS)
-                coin.y = random.randint(COIN_RADIUS, SCREEN_SIZE - COIN_RADIUS)
-                placed = True
-                for obstacle in self.obstacles:
-                    if obstacle.collides_with_point(coin.x, coin.y, COIN_RADIUS):
-                        placed = False
-                        break
+            key = (coin.x // COIN_CELL, coin.y // COIN_CELL)
+            self.coin_cells.setdefault(key, []).append(coin)
         
-        # Make sure players don't spawn on obstacles
-        for player in self.players:
-            placed = False
-            while not placed:
-                player.x = random.randint(PLAYER_RADIUS, SCREEN_SIZE - PLAYER_RADIUS)
-                player.y = random.randint(PLAYER_RADIUS, SCREEN_SIZE - PLAYER_RADIUS)
-                placed = True
-                for obstacle in self.obstacles:
-                    if obstacle.collides_with_point(player.x, player.y, PLAYER_RADIUS):
-                        placed = False
-                        break
+        # Obstacles and uncollected coins never move, so they are drawn once
+        # into a background layer that is patched when a coin is collected
+        self.static_layer = None
+        
+    def validate_positions(self, spots):
+        # Draw coins straight from the free-space mask so none of them spawn
+        # on obstacles, and make each one where it was drawn. Coins with no
+        # room left are dropped, as many for every player so the race stays fair
+        per_player = COIN_COUNT // self.n_players
+        positions = self.spawn_map.sample(COIN_RADIUS, per_player * self.n_players, COIN_SPACING)
+        fit = len(positions) // self.n_players
+        colors = [i for i in range(self.n_players) for _ in range(fit)]
+        self.coins = [Coin(i, x, y) for i, (x, y) in zip(colors, positions)]
+        self.dropped_coins = (per_player - fit) * self.n_players
+        self.report_dropped("coins", per_player * self.n_players, self.dropped_coins)
+        
+        # Players go on the spots kept for them; only an absurd number of them
+        # can run out of spots
+        self.players = [Player(i, x, y) for i, (x, y) in enumerate(spots)]
+        self.dropped_players = self.n_players - len(self.players)
+        self.report_dropped("players", self.n_players, self.dropped_players)
+        self.n_players = len(self.players)
+    
+    @staticmethod
+    def report_dropped(what, wanted, dropped):
+        # Setup leaves out what does not fit rather than failing; say so
+        if dropped:
+            print(f"cake.py: only {wanted - dropped} of {wanted} {what} fit", file=sys.stderr)
     
     def next_player(self):
         self.active_player = (self.active_player + 1) % self.n_players
         self.players[self.active_player].stamina = MAX_STAMINA
+        if self.active_player in self.bots:
+            self.bots[self.active_player].start_turn()
     
     def draw(self):
-        # Draw background
-        screen.fill(BLACK)
-        
-        # Draw obstacles
-        for obstacle in self.obstacles:
-            obstacle.draw()
-        
-        # Draw coins
-        for coin in self.coins:
-            coin.draw()
+        # Draw background, obstacles and coins
+        if self.static_layer is None:
+            self.build_static_layer()
+        self.screen.blit(self.static_layer, (0, 0))
         
         # Draw players
         for i, player in enumerate(self.players):
-            player.draw(i == self.active_player)
+            player.draw(self.screen, i == self.active_player, self.timestep.alpha)
         
         # Draw HUD
         self.draw_hud()
-        
-        pygame.display.flip()
+    
+    def build_static_layer(self):
+        self.static_layer = pygame.Surface((SCREEN_SIZE, SCREEN_SIZE)).convert()
+        self.static_layer.fill(BLACK)
+        for obstacle in self.obstacles:
+            obstacle.draw(self.static_layer)
+        for coin in self.coins:
+            coin.draw(self.static_layer)
+    
+    def invalidate_coin(self, coin):
+        # Repaint only the collected coin's rect: background, the obstacles and
+        # the other coins that overlap it
+        if self.static_layer is None:
+            return
+        rect = coin.get_rect()
+        self.static_layer.set_clip(rect)
+        self.static_layer.fill(BLACK)
+        for x0, y0, x1, y1 in self.obstacle_index.query(rect.left, rect.top, rect.right, rect.bottom):
+            pygame.draw.rect(self.static_layer, GRAY, (x0, y0, x1 - x0, y1 - y0))
+        # Overlapping coins are stacked in the same order as a full redraw
+        for other in sorted(self.coins_near(coin.x, coin.y), key=lambda c: self.coin_order[id(c)]):
+            other.draw(self.static_layer)
+        self.static_layer.set_clip(None)
+    
+    def coins_near(self, x, y):
+        cx, cy = int(x) // COIN_CELL, int(y) // COIN_CELL
+        for gx in range(cx - 1, cx + 2):
+            for gy in range(cy - 1, cy + 2):
+                yield from self.coin_cells.get((gx, gy), ())
+    
+    def render_text(self, text, color):
+        # HUD strings rarely change between frames, so keep their surfaces
+        key = (text, color)
+        surface = self.text_cache.get(key)
+        if surface is None:
+            if self.font is None:
+                self.font = get_font(None, 24)
+            if len(self.text_cache) >= TEXT_CACHE_SIZE:
+                self.text_cache.clear()
+            surface = self.font.render(text, True, color)
+            self.text_cache[key] = surface
+        return surface
     
     def draw_hud(self):
         # Draw player scores and stamina
@@ -211,73 +774,207 @@ class Game:
         for i, player in enumerate(self.players):
             # Player label
             text = f"Player {i+1}: {player.score} coins"
-            text_surface = self.font.render(text, True, player.color)
-            screen.blit(text_surface, (10, y_offset))
+            text_surface = self.render_text(text, player.color)
+            self.screen.blit(text_surface, (10, y_offset))
             
             # Stamina bar
             if i == self.active_player:
                 # Draw stamina bar background
-                pygame.draw.rect(screen, WHITE, (200, y_offset, 100, 20), 1)
+                pygame.draw.rect(self.screen, WHITE, (200, y_offset, 100, 20), 1)
                 # Draw stamina bar fill
-                pygame.draw.rect(screen, player.color, (200, y_offset, player.stamina, 20))
+                pygame.draw.rect(self.screen, player.color, (200, y_offset, player.stamina, 20))
                 # Show stamina text
                 stamina_text = f"{int(player.stamina)}/{MAX_STAMINA}"
-                stamina_surface = self.font.render(stamina_text, True, WHITE)
-                screen.blit(stamina_surface, (310, y_offset))
+                stamina_surface = self.render_text(stamina_text, WHITE)
+                self.screen.blit(stamina_surface, (310, y_offset))
             
             y_offset += 30
         
         # Show whose turn it is
         turn_text = f"Player {self.active_player + 1}'s Turn - Press SPACE for next player"
-        turn_surface = self.font.render(turn_text, True, WHITE)
-        screen.blit(turn_surface, (10, SCREEN_SIZE - 30))
+        turn_surface = self.render_text(turn_text, WHITE)
+        self.screen.blit(turn_surface, (10, SCREEN_SIZE - 30))
+    
+    def handle_event(self, event):
+        if event.type == pygame.QUIT:
+            self.running = False
+        elif event.type == pygame.KEYDOWN:
+            self.held_keys.add(event.key)
+            if event.key == pygame.K_SPACE:
+                self.next_player()
+            elif event.key == pygame.K_ESCAPE:
+                self.running = False
+        elif event.type == pygame.KEYUP:
+            self.held_keys.discard(event.key)
+    
+    def update(self, dt):
+        # Run however many fixed steps dt seconds of real time cover
+        for _ in range(self.timestep.advance(dt)):
+            self.step()
+    
+    def step(self):
+        # One fixed simulation step: remember where players were, then move
+        for player in self.players:
+            player.prev_x, player.prev_y = player.x, player.y
+        self.handle_input()
+        self.collect_coins()
     
-    def update(self):
+    def collect_coins(self):
         # Check for coin collisions with active player
-        for coin in self.coins:
-            coin.check_collision(self.players[self.active_player])
+        player = self.players[self.active_player]
+        for coin in self.coins_near(player.x, player.y):
+            if coin.check_collision(player):
+                self.invalidate_coin(coin)
     
+    def is_animating(self):
+        # Players only move while a key is held or a bot is playing its turn
+        return bool(self.held_keys) or self.active_player in self.bots
+    
+    def state_key(self):
+        # Everything a replay must reproduce, as plain data. Positions and
+        # stamina start out whole and become fractional with movement; they
+        # are floats here either way, as a snapshot stores them
+        return ([(float(p.x), float(p.y), p.score, float(p.stamina)) for p in self.players],
+                [coin.collected for coin in self.coins],
+                self.active_player)
+
+    def snapshot(self):
+        players = np.array([(p.x, p.y, p.prev_x, p.prev_y, p.stamina, p.score) for p in self.players],
+                           dtype=PLAYER_RECORD)
+        obstacles = np.array([(o.x, o.y, o.width, o.height) for o in self.obstacles],
+                             dtype=OBSTACLE_RECORD)
+        coins = np.array([(c.x, c.y, c.color_idx, c.collected) for c in self.coins], dtype=COIN_RECORD)
+        parts = [SNAPSHOT.pack(self.n_players, self.active_player, len(self.obstacles), len(self.coins),
+                               len(self.bots), len(self.held_keys), self.timestep.accumulator),
+                 players.tobytes(), obstacles.tobytes(), coins.tobytes(),
+                 np.array(sorted(self.held_keys), dtype='<i4').tobytes()]
+        for idx in sorted(self.bots):
+            bot = self.bots[idx]
+            parts.append(BOT_HEADER.pack(bot.stuck, len(bot.route)))
+            parts.append(np.array(bot.route, dtype='<i2').tobytes())
+        return b"".join(parts)
+
+    def restore(self, data):
+        n_players, active, n_obstacles, n_coins, n_bots, n_keys, accumulator = SNAPSHOT.unpack_from(data)
+        offset = SNAPSHOT.size
+
+        def records(dtype, count):
+            nonlocal offset
+            array = np.frombuffer(data, dtype, count, offset)
+            offset += array.nbytes
+            return array
+
+        players = records(PLAYER_RECORD, n_players)
+        obstacles = records(OBSTACLE_RECORD, n_obstacles)
+        coins = records(COIN_RECORD, n_coins)
+        held_keys = records(np.dtype('<i4'), n_keys)
+
+        # Objects are made with __new__ so restoring draws no random numbers.
+        # Obstacle and coin lookups (and the bots' navigation grid) are kept
+        # when the layout is the one already loaded, as in undo within a game
+        same_layout = (getattr(self, 'n_players', None) == n_players and len(self.bots) == n_bots
+                       and len(self.obstacles) == n_obstacles and len(self.coins) == n_coins
+                       and all((o.x, o.y, o.width, o.height) == tuple(r)
+                               for o, r in zip(self.obstacles, obstacles.tolist()))
+                       and all((c.x, c.y, c.color_idx) == r[:3] for c, r in zip(self.coins, coins.tolist())))
+        if not same_layout:
+            self.screen = getattr(self, 'screen', None)
+            self.n_players = n_players
+            self.players = []
+            for idx in range(n_players):
+                player = Player.__new__(Player)
+                player.idx = idx
+                player.color = PLAYER_COLORS[idx % len(PLAYER_COLORS)]
+                self.players.append(player)
+            self.obstacles = []
+            for x, y, w, h in obstacles.tolist():
+                obstacle = Obstacle.__new__(Obstacle)
+                obstacle.width, obstacle.height = w, h
+                obstacle.place(x, y)
+                self.obstacles.append(obstacle)
+            self.spawn_map = SpawnMap(self.obstacles)
+            self.coins = []
+            for x, y, color_idx, _ in coins.tolist():
+                coin = Coin.__new__(Coin)
+                coin.color_idx = color_idx
+                coin.color = PLAYER_COLORS[color_idx % len(PLAYER_COLORS)]
+                coin.x, coin.y = x, y
+                self.coins.append(coin)
+            self.build_lookups(n_bots)
+            self.font = None
+            self.text_cache = {}
+        elif any(coin.collected != bool(r[3]) for coin, r in zip(self.coins, coins.tolist())):
+            self.static_layer = None  # Coins reappear; redraw the background
+
+        for player, (x, y, prev_x, prev_y, stamina, score) in zip(self.players, players.tolist()):
+            player.x, player.y, player.prev_x, player.prev_y = x, y, prev_x, prev_y
+            player.stamina, player.score = stamina, score
+        for coin, collected in zip(self.coins, coins['collected'].tolist()):
+            coin.collected = bool(collected)
+        for idx in sorted(self.bots):
+            bot = self.bots[idx]
+            bot.stuck, length = BOT_HEADER.unpack_from(data, offset)
+            offset += BOT_HEADER.size
+            route = records(np.dtype('<i2'), 2 * length).tolist()
+            bot.route = list(zip(route[::2], route[1::2]))
+
+        self.active_player = active
+        self.held_keys = set(held_keys.tolist())
+        self.running = getattr(self, 'running', True)
+        self.timestep = FixedTimestep(SIMULATION_RATE)
+        self.timestep.accumulator = accumulator
+
     def handle_input(self):
-        keys = pygame.key.get_pressed()
+        # Bots steer themselves and end their own turn
+        bot = self.bots.get(self.active_player)
+        if bot:
+            if not bot.update(self.obstacles, self.obstacle_index):
+                self.next_player()
+            return
+        
+        keys = self.held_keys
         player = self.players[self.active_player]
         
         # Movement keys
         dx, dy = 0, 0
-        speed = 5  # Speed per frame
+        speed = PLAYER_SPEED
         
-        if keys[pygame.K_LEFT] or keys[pygame.K_a]:
+        if pygame.K_LEFT in keys or pygame.K_a in keys:
             dx -= speed
-        if keys[pygame.K_RIGHT] or keys[pygame.K_d]:
+        if pygame.K_RIGHT in keys or pygame.K_d in keys:
             dx += speed
-        if keys[pygame.K_UP] or keys[pygame.K_w]:
+        if pygame.K_UP in keys or pygame.K_w in keys:
             dy -= speed
-        if keys[pygame.K_DOWN] or keys[pygame.K_s]:
+        if pygame.K_DOWN in keys or pygame.K_s in keys:
             dy += speed
         
         if dx != 0 or dy != 0:
-            player.move(dx, dy, self.obstacles)
+            player.move(dx, dy, self.obstacles, self.obstacle_index)
+
+def main(n_players=N_PLAYERS, n_bots=0, seed=None, record=None):
+    seed = replay.seed_session(seed)
+    pygame.init()
+    # Another game may have resized the shared window since it last ran
+    screen = pygame.display.set_mode((SCREEN_SIZE, SCREEN_SIZE))
+    pygame.display.set_caption("N-Player Collection Game")
+    game = Game(n_players, n_bots=n_bots, screen=screen)
+    recorder = None
+    if record:
+        recorder = replay.Recorder(record, "cake", seed, {"n_players": n_players, "n_bots": n_bots})
+    gameloop.run(game, 60, recorder)
 
-def main():
-    game = Game(N_PLAYERS)
-    running = True
-    
-    while running:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_SPACE:
-                    game.next_player()
-                elif event.key == pygame.K_ESCAPE:
-                    running = False
-        
-        game.handle_input()
-        game.update()
-        game.draw()
-        clock.tick(60)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='N-Player Collection Game')
+    parser.add_argument('--players', '-p', type=int, default=N_PLAYERS,
+                        help='Number of players')
+    parser.add_argument('--bots', '-b', type=int, default=0,
+                        help='How many of the players are computer controlled')
+    replay.add_arguments(parser)
+    profiler.add_arguments(parser)
+    args = parser.parse_args()
+    profiler.PROFILER.configure(args.profile)
     
+    n_players = max(1, args.players)
+    main(n_players, max(0, min(n_players, args.bots)), args.seed, args.record)
     pygame.quit()
     sys.exit()
-
-if __name__ == "__main__":
-    main()
@@ -1,11 +1,15 @@
 import pygame
 import os
+import random
 import sys
-import copy
+import struct
 from enum import Enum, auto
-
-# Initialize pygame
-pygame.init()
+import chess_eval
+import gameloop
+import replay
+from assets import get_font
+import profiler
+from profiler import profiled
 
 # Constants
 SQUARE_SIZE = 50
@@ -41,6 +45,28 @@ class PieceType(Enum):
     QUEEN = auto()
     KING = auto()
 
+# Board.pack() layout: a byte per square, 0 when empty, otherwise the piece
+# type's value, (player value - 1) << 3 and has_moved << 5
+BOARD_BYTES = 16 * 16
+PIECE_TYPES = {piece_type.value: piece_type for piece_type in PieceType}
+PLAYERS = list(Player)
+
+# Snapshot layout (see snapshot.py) after the board: player to move, selected
+# square (255 for none), history length and the computer players (bit
+# value - 1 of each); then each history entry's board and player to move
+SNAPSHOT = struct.Struct("<BBHB")
+
+# Zobrist hashing: a random 64-bit number per piece code (type and player, as
+# packed by Board.pack) and square and per player to move, XORed together.
+# The seed is fixed so keys, and the opening books keyed by them, are the
+# same in every run
+ZOBRIST_SEED = 0x4C4B43485353
+_zobrist = struct.unpack(f"<{32 * BOARD_BYTES + len(PLAYERS)}Q",
+                         random.Random(ZOBRIST_SEED).randbytes(8 * (32 * BOARD_BYTES + len(PLAYERS))))
+ZOBRIST_PIECES = [list(_zobrist[code * BOARD_BYTES:(code + 1) * BOARD_BYTES]) for code in range(32)]
+ZOBRIST_TO_MOVE = dict(zip(PLAYERS, _zobrist[32 * BOARD_BYTES:]))
+del _zobrist
+
 class Piece:
     def __init__(self, piece_type, player, row, col):
         self.type = piece_type
@@ -49,6 +75,11 @@ class Piece:
         self.col = col
         self.has_moved = False
         self.character = self.get_character()
+        # Where this piece's score lives in Board.scores, and its score and
+        # Zobrist keys by square
+        self.player_index = player.value - 1
+        self.square_values = chess_eval.SQUARE_VALUES[self.player_index][piece_type.value]
+        self.zobrist = ZOBRIST_PIECES[piece_type.value | self.player_index << 3]
     
     def get_character(self):
         # Simple letter representation of chess pieces
@@ -67,6 +98,7 @@ class Piece:
         self.col = col
         self.has_moved = True
     
+    @profiled("chess.moves")
     def get_valid_moves(self, board):
         # Get valid moves based on piece type
         valid_moves = []
@@ -252,15 +284,29 @@ class Piece:
         
         return valid_moves
 
+def next_player(player):
+    """The player who moves after player, clockwise"""
+    if player == Player.NORTH:
+        return Player.EAST
+    elif player == Player.EAST:
+        return Player.SOUTH
+    elif player == Player.SOUTH:
+        return Player.WEST
+    return Player.NORTH
+
 class GameState:
     def __init__(self, board, current_player):
-        self.board_grid = copy.deepcopy(board.grid)
+        self.board_data = board.pack()
         self.current_player = current_player
 
 class Board:
     def __init__(self):
         self.grid = [[None for _ in range(16)] for _ in range(16)]
         self.setup_pieces()
+        # Each player's evaluation (see chess_eval) and the Zobrist key of the
+        # pieces, kept up to date by make_move
+        self.scores = chess_eval.scores(self)
+        self.key = self.compute_key()
     
     def setup_pieces(self):
         # North player (red)
@@ -364,39 +410,131 @@ class Board:
         return None
     
     def move_piece(self, from_row, from_col, to_row, to_col):
-        piece = self.get_piece(from_row, from_col)
-        if piece:
-            self.grid[to_row][to_col] = piece
-            self.grid[from_row][from_col] = None
-            piece.move(to_row, to_col)
+        if self.get_piece(from_row, from_col):
+            self.make_move(from_row, from_col, to_row, to_col)
             return True
         return False
     
-    def copy_from_grid(self, grid):
-        """Create a new board state from a grid"""
-        self.grid = copy.deepcopy(grid)
-        
-        # Update the row and col attributes of each piece to match their position in the grid
-        for row in range(len(self.grid)):
-            for col in range(len(self.grid[row])):
-                piece = self.grid[row][col]
+    def make_move(self, from_row, from_col, to_row, to_col):
+        """Move a piece in place and return what unmake_move needs to take it back"""
+        piece = self.grid[from_row][from_col]
+        captured = self.grid[to_row][to_col]
+        undo = (piece, from_row, from_col, to_row, to_col, captured, piece.has_moved)
+        self.grid[to_row][to_col] = piece
+        self.grid[from_row][from_col] = None
+        piece.move(to_row, to_col)
+        from_square, to_square = from_row * 16 + from_col, to_row * 16 + to_col
+        values = piece.square_values
+        self.scores[piece.player_index] += values[to_square] - values[from_square]
+        self.key ^= piece.zobrist[from_square] ^ piece.zobrist[to_square]
+        if captured:
+            self.scores[captured.player_index] -= captured.square_values[to_square]
+            self.key ^= captured.zobrist[to_square]
+        return undo
+    
+    def unmake_move(self, undo):
+        """Take back a move made with make_move"""
+        piece, from_row, from_col, to_row, to_col, captured, has_moved = undo
+        self.grid[from_row][from_col] = piece
+        self.grid[to_row][to_col] = captured
+        piece.row, piece.col = from_row, from_col
+        piece.has_moved = has_moved
+        from_square, to_square = from_row * 16 + from_col, to_row * 16 + to_col
+        values = piece.square_values
+        self.scores[piece.player_index] -= values[to_square] - values[from_square]
+        self.key ^= piece.zobrist[from_square] ^ piece.zobrist[to_square]
+        if captured:
+            self.scores[captured.player_index] += captured.square_values[to_square]
+            self.key ^= captured.zobrist[to_square]
+    
+    def generate_moves(self, player):
+        """All (from_row, from_col, to_row, to_col) moves for player's pieces"""
+        moves = []
+        for row in self.grid:
+            for piece in row:
+                if piece and piece.player == player:
+                    moves.extend((piece.row, piece.col, to_row, to_col)
+                                 for to_row, to_col in piece.get_valid_moves(self))
+        return moves
+    
+    def perft(self, player, depth):
+        """Count the move sequences of length depth, players moving in turn order"""
+        if depth == 0:
+            return 1
+        moves = self.generate_moves(player)
+        if depth == 1:
+            return len(moves)
+        following = next_player(player)
+        nodes = 0
+        for move in moves:
+            undo = self.make_move(*move)
+            nodes += self.perft(following, depth - 1)
+            self.unmake_move(undo)
+        return nodes
+    
+    def compute_key(self):
+        """Zobrist key of the pieces from scratch, as self.key should hold it"""
+        key = 0
+        for row, line in enumerate(self.grid):
+            for col, piece in enumerate(line):
                 if piece:
-                    piece.row = row
-                    piece.col = col
+                    key ^= piece.zobrist[row * 16 + col]
+        return key
+    
+    def zobrist_key(self, player):
+        """Zobrist hash of the position with player to move"""
+        return self.key ^ ZOBRIST_TO_MOVE[player]
+    
+    def copy(self):
+        """An independent board with the same pieces"""
+        board = Board.__new__(Board)
+        board.unpack(self.pack())
+        return board
+    
+    def pack(self):
+        """The board as BOARD_BYTES bytes, one per square in row order"""
+        data = bytearray(BOARD_BYTES)
+        for row, line in enumerate(self.grid):
+            for col, piece in enumerate(line):
+                if piece:
+                    data[row * 16 + col] = (piece.type.value | (piece.player.value - 1) << 3
+                                            | piece.has_moved << 5)
+        return bytes(data)
+    
+    def unpack(self, data):
+        """Replace every piece with those packed into data by pack()"""
+        self.grid = grid = [[None] * 16 for _ in range(16)]
+        for square, code in enumerate(data):
+            if code:
+                row, col = divmod(square, 16)
+                piece = Piece(PIECE_TYPES[code & 7], PLAYERS[code >> 3 & 3], row, col)
+                piece.has_moved = bool(code & 32)
+                grid[row][col] = piece
+        self.scores = chess_eval.scores(self)
+        self.key = self.compute_key()
 
 class Game:
-    def __init__(self):
-        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        pygame.display.set_caption("4-Player Chess")
-        self.clock = pygame.time.Clock()
+    def __init__(self, bots=()):
+        # Display and fonts are set up by run(), so a Game can be built headless
+        self.screen = None
+        self.running = True
         self.board = Board()
         self.current_player = Player.NORTH
         self.selected_piece = None
         self.valid_moves = []
         self.move_history = []  # Store game state history
         
+        # Players moved by the computer, by name ("east") in the arguments
+        self.bots = {Player[name.upper()] for name in bots}
+        self.engine = None
+        
         # Save initial state
         self.save_game_state()
+    
+    def init_display(self):
+        pygame.init()
+        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        pygame.display.set_caption("4-Player Chess")
         
         # Try to find a font that supports Unicode chess symbols
         # If you want to attempt Unicode again, try these fonts instead of Arial
@@ -410,11 +548,11 @@ class Game:
                 break
         
         if chosen_font:
-            self.font = pygame.font.SysFont(chosen_font, 40)  # Font for chess pieces
+            self.font = get_font(chosen_font, 40)  # Font for chess pieces
         else:
-            self.font = pygame.font.SysFont('Arial', 40)  # Fallback to Arial
+            self.font = get_font('Arial', 40)  # Fallback to Arial
         
-        self.ui_font = pygame.font.SysFont('Arial', 24)  # Font for UI
+        self.ui_font = get_font('Arial', 24)  # Font for UI
         
     def save_game_state(self):
         """Save the current game state to history"""
@@ -431,7 +569,7 @@ class Game:
             previous_state = self.move_history[-1]
             
             # Restore the board
-            self.board.copy_from_grid(previous_state.board_grid)
+            self.board.unpack(previous_state.board_data)
             
             # Restore the current player
             self.current_player = previous_state.current_player
@@ -439,8 +577,9 @@ class Game:
             # Clear selection
             self.selected_piece = None
             self.valid_moves = []
+            self.ponder()
     
-    def draw_board(self):
+    def draw(self):
         self.screen.fill(BLACK)
         
         # Draw all squares that are part of the playable area
@@ -500,11 +639,9 @@ class Game:
         # Add UI for undo
         undo_text = self.ui_font.render("Press BACKSPACE to Undo", True, WHITE)
         self.screen.blit(undo_text, (BOARD_WIDTH + 10, 60))
-        
-        pygame.display.flip()
     
     def handle_click(self, row, col):
-        if not self.board.is_valid_position(row, col):
+        if not self.board.is_valid_position(row, col) or self.current_player in self.bots:
             return
         
         piece = self.board.get_piece(row, col)
@@ -521,6 +658,7 @@ class Game:
             
             # Save the state AFTER completing the move and changing the player
             self.save_game_state()
+            self.ponder()
         # If clicking on own piece, select it
         elif piece and piece.player == self.current_player:
             self.selected_piece = piece
@@ -532,37 +670,121 @@ class Game:
     
     def next_turn(self):
         # Cycle through players
-        if self.current_player == Player.NORTH:
-            self.current_player = Player.EAST
-        elif self.current_player == Player.EAST:
-            self.current_player = Player.SOUTH
-        elif self.current_player == Player.SOUTH:
-            self.current_player = Player.WEST
-        else:
-            self.current_player = Player.NORTH
-    
-    def run(self):
-        running = True
-        while running:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-                elif event.type == pygame.MOUSEBUTTONDOWN:
-                    if event.button == 1:  # Left mouse button
-                        mouse_pos = pygame.mouse.get_pos()
-                        col = mouse_pos[0] // SQUARE_SIZE
-                        row = mouse_pos[1] // SQUARE_SIZE
-                        self.handle_click(row, col)
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_BACKSPACE:
-                        self.undo_move()
-            
-            self.draw_board()
-            self.clock.tick(60)  # 60 FPS
-        
-        pygame.quit()
-        sys.exit()
+        self.current_player = next_player(self.current_player)
+    
+    def handle_event(self, event):
+        if event.type == pygame.QUIT:
+            self.running = False
+        elif event.type == pygame.MOUSEBUTTONDOWN:
+            if event.button == 1:  # Left mouse button
+                col = event.pos[0] // SQUARE_SIZE
+                row = event.pos[1] // SQUARE_SIZE
+                self.handle_click(row, col)
+        elif event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_BACKSPACE:
+                self.undo_move()
+    
+    def update(self, dt):
+        # Nothing moves between clicks, except the computer players' pieces
+        if self.current_player in self.bots:
+            self.play_bot_move()
+    
+    def get_engine(self):
+        """The engine that plays the computer players, started on first use"""
+        if self.engine is None:
+            import chess_engine
+            self.engine = chess_engine.Engine(book=chess_engine.open_book(),
+                                              tablebases=chess_engine.open_tablebases())
+        return self.engine
+    
+    def play_bot_move(self):
+        """Let the engine move for the computer player whose turn it is"""
+        move = self.get_engine().choose_move(self.board, self.current_player)
+        if move:
+            self.board.move_piece(*move)
+        self.next_turn()
+        self.save_game_state()
+        self.ponder()
+    
+    def ponder(self):
+        """While a person is to move, let the engine think ahead for the next computer player"""
+        if not self.bots or self.current_player in self.bots:
+            return
+        bot = next_player(self.current_player)
+        while bot not in self.bots:
+            bot = next_player(bot)
+        self.get_engine().ponder(self.board, self.current_player, bot)
+    
+    def is_animating(self):
+        # Keep the loop running while a computer player is to move
+        return self.current_player in self.bots
+    
+    def state_key(self):
+        """Board, player to move and history length as plain data, for replays"""
+        pieces = [(row, col, piece.type.name, piece.player.name)
+                  for row, line in enumerate(self.board.grid)
+                  for col, piece in enumerate(line) if piece]
+        return pieces, self.current_player.name, len(self.move_history)
+
+    def snapshot(self):
+        selected = 255
+        if self.selected_piece:
+            selected = self.selected_piece.row * 16 + self.selected_piece.col
+        bots = sum(1 << player.value - 1 for player in self.bots)
+        parts = [self.board.pack(),
+                 SNAPSHOT.pack(self.current_player.value, selected, len(self.move_history), bots)]
+        for state in self.move_history:
+            parts.append(state.board_data)
+            parts.append(bytes([state.current_player.value]))
+        return b"".join(parts)
+
+    def restore(self, data):
+        self.screen = getattr(self, 'screen', None)
+        self.running = getattr(self, 'running', True)
+        if not hasattr(self, 'board'):
+            self.board = Board.__new__(Board)
+        self.board.unpack(data[:BOARD_BYTES])
+        player, selected, history, bots = SNAPSHOT.unpack_from(data, BOARD_BYTES)
+        self.current_player = Player(player)
+        self.bots = {player for player in PLAYERS if bots >> player.value - 1 & 1}
+        self.engine = getattr(self, 'engine', None)
+        self.move_history = []
+        offset = BOARD_BYTES + SNAPSHOT.size
+        for _ in range(history):
+            state = GameState.__new__(GameState)
+            state.board_data = bytes(data[offset:offset + BOARD_BYTES])
+            state.current_player = Player(data[offset + BOARD_BYTES])
+            self.move_history.append(state)
+            offset += BOARD_BYTES + 1
+        self.selected_piece = None
+        self.valid_moves = []
+        if selected != 255:
+            self.selected_piece = self.board.get_piece(*divmod(selected, 16))
+            self.valid_moves = self.selected_piece.get_valid_moves(self.board)
+
+    def run(self, recorder=None):
+        self.init_display()
+        self.ponder()
+        gameloop.run(self, 60, recorder)
+        if self.engine:
+            self.engine.stop()
+
+def main(seed=None, record=None, bots=()):
+    seed = replay.seed_session(seed)
+    game = Game(bots)
+    recorder = replay.Recorder(record, "chess", seed, {"bots": list(bots)}) if record else None
+    game.run(recorder)
 
 if __name__ == "__main__":
-    game = Game()
-    game.run()
+    import argparse
+    parser = argparse.ArgumentParser(description='4-Player Chess')
+    parser.add_argument('--bot', dest='bots', action='append', default=[],
+                        choices=[player.name.lower() for player in Player],
+                        help='Let the computer play this side (repeatable)')
+    replay.add_arguments(parser)
+    profiler.add_arguments(parser)
+    args = parser.parse_args()
+    profiler.PROFILER.configure(args.profile)
+    main(args.seed, args.record, args.bots)
+    pygame.quit()
+    sys.exit()
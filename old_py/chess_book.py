@@ -0,0 +1,263 @@
+"""Opening book for the computer players in chess.py.
+
+    book = OpeningBook("chess_book.bin")
+    book.moves(key)     # [((from_row, from_col, to_row, to_col), weight), ...]
+    book.pick(key)      # one of those moves, in proportion to weight, or None
+
+    python chess_book.py add chess_book.bin --self-play 100 --plies 12
+    python chess_book.py add chess_book.bin curated.txt
+    python chess_book.py info chess_book.bin
+
+Positions are looked up by Board.zobrist_key with the player to move. The
+file is a header, every entry's key in ascending order, then every entry's
+move in the same order:
+
+    b"KBOK", format version u8, 3 pad bytes, entry count u32, 4 pad bytes
+    count x key u64
+    count x (from square u8, to square u8, weight u16)
+
+with squares numbered row * 16 + col, all little-endian. A position with
+several book moves has one entry per move, next to each other. The book is
+memory-mapped and the keys binary-searched in place, so opening it reads
+nothing up front and a lookup touches a handful of pages, however big the
+book gets.
+
+add merges games into the book (creating it if needed): each position in
+the first --plies moves of a game adds one to the weight of the move played
+from it. Games come from self-play by the engine, starting with a random
+move for each player so the games differ, or from text files with one game
+per line, moves written like h15h13 (columns a-p from the west, rows 1-16
+from the south) and # starting a comment. The merged book is written to a
+temporary file and moved over the old one, so a running game never sees a
+half-written book.
+"""
+import argparse
+import bisect
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+
+import chess
+from assets import asset_path
+
+MAGIC = b"KBOK"
+VERSION = 1
+HEADER = struct.Struct("<4sBxxxIxxxx")
+KEY = struct.Struct("<Q")
+MOVE = struct.Struct("<BBH")
+MAX_WEIGHT = 0xFFFF
+
+BOOK_PATH = asset_path("chess_book.bin")
+BOOK_PLIES = 12  # Moves of each game, counting every player's, added to the book
+RANDOM_PLIES = 4  # Random moves that start each self-play game, one per player
+BOOK_DEPTH = 3  # Search depth of the self-play engine
+COLUMNS = "abcdefghijklmnop"
+
+
+class BookError(Exception):
+    pass
+
+
+class OpeningBook:
+    """A book file, memory-mapped"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size:
+            raise BookError(f"{path} is truncated")
+        magic, version, self.count = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise BookError(f"{path} is not an opening book")
+        if version != VERSION:
+            raise BookError(f"{path} has book format version {version} (expected {VERSION})")
+        self.moves_offset = HEADER.size + KEY.size * self.count
+        if len(self.map) < self.moves_offset + MOVE.size * self.count:
+            raise BookError(f"{path} is truncated")
+        # The keys as a sequence of ints bisect can search without copying
+        # them out (the cast is native order, which is little-endian here as
+        # everywhere pygame runs)
+        self.keys = memoryview(self.map)[HEADER.size:self.moves_offset].cast('Q')
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.keys.release()
+        self.map.close()
+
+    def moves(self, key):
+        """The book moves from the position with this key, with their weights"""
+        keys = self.keys
+        index = bisect.bisect_left(keys, key)
+        found = []
+        while index < self.count and keys[index] == key:
+            from_square, to_square, weight = MOVE.unpack_from(self.map, self.moves_offset + MOVE.size * index)
+            found.append((divmod(from_square, 16) + divmod(to_square, 16), weight))
+            index += 1
+        return found
+
+    def pick(self, key):
+        """A book move from the position with this key, chosen in proportion to weight, or None"""
+        found = self.moves(key)
+        if not found:
+            return None
+        moves, weights = zip(*found)
+        return random.choices(moves, weights)[0]
+
+    def entries(self):
+        """Every (key, from square, to square, weight) in the book, in key order"""
+        for index in range(self.count):
+            yield (self.keys[index],) + MOVE.unpack_from(self.map, self.moves_offset + MOVE.size * index)
+
+
+def read_entries(path):
+    """{(key, from square, to square): weight} of the book at path, or empty if there is none"""
+    if not os.path.exists(path):
+        return {}
+    book = OpeningBook(path)
+    try:
+        return {(key, from_square, to_square): weight
+                for key, from_square, to_square, weight in book.entries()}
+    finally:
+        book.close()
+
+
+def write_book(path, entries):
+    """Write {(key, from square, to square): weight} as a book file, replacing path atomically"""
+    ordered = sorted(entries.items())
+    temporary = f"{path}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(ordered)))
+        f.write(b"".join(KEY.pack(key) for (key, _, _), _ in ordered))
+        f.write(b"".join(MOVE.pack(from_square, to_square, weight)
+                         for (_, from_square, to_square), weight in ordered))
+    os.replace(temporary, path)
+
+
+def add_game(entries, moves, plies=BOOK_PLIES, skip=0):
+    """Count the first plies moves of a game from the start, after the first skip, into entries"""
+    board = chess.Board()
+    player = chess.Player.NORTH
+    for ply, move in enumerate(moves[:plies]):
+        if ply >= skip:
+            from_row, from_col, to_row, to_col = move
+            entry = (board.zobrist_key(player), from_row * 16 + from_col, to_row * 16 + to_col)
+            entries[entry] = min(MAX_WEIGHT, entries.get(entry, 0) + 1)
+        board.make_move(*move)
+        player = chess.next_player(player)
+
+
+def parse_square(text):
+    """(row, col) of a square name like h15"""
+    col = COLUMNS.index(text[0])
+    row = 16 - int(text[1:])
+    if not 0 <= row < 16:
+        raise ValueError(text)
+    return row, col
+
+
+def parse_game(line):
+    """Moves of a game written like "h15h13 p8n8 ...", checked against the rules"""
+    board = chess.Board()
+    player = chess.Player.NORTH
+    moves = []
+    for word in line.split():
+        split = next(i for i in range(2, len(word)) if word[i].isalpha())
+        move = parse_square(word[:split]) + parse_square(word[split:])
+        if move not in board.generate_moves(player):
+            raise ValueError(f"{word} is not a legal move for {player.name.lower()}")
+        board.make_move(*move)
+        moves.append(move)
+        player = chess.next_player(player)
+    return moves
+
+
+def read_games(path):
+    """Games in a text file, one per line"""
+    games = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.split('#')[0].strip()
+            if line:
+                try:
+                    games.append(parse_game(line))
+                except (ValueError, StopIteration) as e:
+                    raise BookError(f"{path}:{number}: {e}") from None
+    return games
+
+
+def self_play(rng, plies, depth):
+    """Moves of an engine-vs-engine opening, after one random move by each player"""
+    import chess_engine  # Which imports this module
+    engine = chess_engine.Engine(depth)
+    board = chess.Board()
+    player = chess.Player.NORTH
+    moves = []
+    for ply in range(plies):
+        if ply < RANDOM_PLIES:
+            move = rng.choice(board.generate_moves(player))
+        else:
+            move = engine.choose_move(board, player)
+        if move is None:
+            break
+        board.make_move(*move)
+        moves.append(move)
+        player = chess.next_player(player)
+    return moves
+
+
+def cmd_add(args):
+    entries = read_entries(args.book)
+    before = len(entries)
+    for path in args.games:
+        for moves in read_games(path):
+            add_game(entries, moves, args.plies)
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    for game in range(args.self_play):
+        add_game(entries, self_play(rng, args.plies, args.depth), args.plies, RANDOM_PLIES)
+        print(f"{game + 1}/{args.self_play} games ({time.perf_counter() - start:.0f} s)", file=sys.stderr)
+    write_book(args.book, entries)
+    print(f"{args.book}: {len(entries)} entries ({len(entries) - before} new)")
+    return 0
+
+
+def cmd_info(args):
+    book = OpeningBook(args.book)
+    positions = len({key for key, _, _, _ in book.entries()})
+    print(f"{args.book}: {len(book)} entries, {positions} positions, "
+          f"{os.path.getsize(args.book)} bytes")
+    book.close()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and inspect chess opening books')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help='Merge games into a book, creating it if needed')
+    add.add_argument('book', help='Book file')
+    add.add_argument('games', nargs='*', help='Text files of curated games, one per line')
+    add.add_argument('--self-play', type=int, default=0, help='Engine-vs-engine games to play and add')
+    add.add_argument('--plies', type=int, default=BOOK_PLIES, help='Moves of each game to add')
+    add.add_argument('--depth', type=int, default=BOOK_DEPTH, help='Search depth of the self-play engine')
+    add.add_argument('--seed', type=int, default=0, help='Seed for the self-play games')
+    add.set_defaults(func=cmd_add)
+
+    info = commands.add_parser('info', help='Count the entries in a book')
+    info.add_argument('book', help='Book file')
+    info.set_defaults(func=cmd_info)
+
+    args = parser.parse_args()
+    try:
+        sys.exit(args.func(args))
+    except BookError as e:
+        sys.exit(f"chess_book.py: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""Move search for the computer players in chess.py.
+
+    engine = Engine(depth=3, book=open_book())
+    move = engine.choose_move(board, player)   # (from_row, from_col, to_row, to_col)
+    engine.ponder(board, player, bot)          # think ahead while player (a person) moves
+    engine.stop()                              # stop thinking; choose_move also does
+
+With four players there is no single opponent to minimize against, so the
+search is paranoid: the player to move assumes the other three are playing
+together against it. That turns the game back into two sides and lets
+ordinary alpha-beta pruning work. Depth counts single moves, every
+player's, so the default of 3 is the bot's move and the next two players'
+replies before the position is judged by chess_eval.
+
+In the opening the search is skipped whenever the book (chess_book.py) has
+a move for the position, and in the endings the tablebases
+(chess_tablebase.py) cover it plays their move instead. They are only
+probed for the position on the board, not inside the search, where finding
+out which table applies would cost more than searching.
+
+Searched positions go into a transposition table per bot, and the move
+each search chose is remembered, both outliving single searches. While
+people are choosing their moves, ponder() works on a background thread
+through the moves they might make, likeliest first by the engine's own move
+ordering, and searches the bot's reply to each, filling its table as it
+goes. When a move is made the thread is stopped within a node (the game
+then ponders the new position, or it is the bot's turn and choose_move
+searches in earnest). If the move was one already pondered, the bot's
+reply is ready; otherwise it starts from whatever its table knows.
+
+A table entry only cuts a search short when it was searched to exactly the
+depth wanted, and the bot's own moves are always tried in the same order,
+so the move chosen is the same however long the engine pondered first and
+recorded games replay the same.
+"""
+import os
+import threading
+
+import chess_book
+import chess_eval
+import chess_tablebase
+from chess import ZOBRIST_TO_MOVE, next_player
+from chess_eval import PIECE_VALUES
+
+DEPTH = 3  # Moves searched ahead, counting every player's
+INFINITY = 10 ** 9
+TABLE_SIZE = 1000000  # Entries a bot's table holds before it is cleared
+
+# Transposition table entry flags: the score is exact, at least or at most
+# the position's value
+EXACT, LOWER, UPPER = range(3)
+
+
+def open_book(path=chess_book.BOOK_PATH):
+    """The opening book at path, or None if there is no book file"""
+    if os.path.exists(path):
+        return chess_book.OpeningBook(path)
+    return None
+
+
+def open_tablebases(folder=chess_tablebase.TABLE_DIR):
+    """The endgame tables in folder, or None if there are none"""
+    return chess_tablebase.Tablebases.open(folder)
+
+
+class Stopped(Exception):
+    """Raised inside a search when stop() has been called"""
+
+
+class Engine:
+    def __init__(self, depth=DEPTH, book=None, tablebases=None):
+        self.depth = depth
+        self.book = book
+        self.tablebases = tablebases
+        self.nodes = 0  # Positions searched by the last choose_move
+        # Per bot, position key -> (depth, flag, score, best move); the scores
+        # are from that bot's point of view
+        self.tables = {}
+        self.replies = {}  # Position key, bot to move -> the move search() chose
+        self.thread = None
+        self.stopping = False
+
+    def choose_move(self, board, player):
+        """The move player should make, or None if it has none"""
+        self.stop()
+        self.nodes = 0
+        moves = board.generate_moves(player)
+        if not moves:
+            return None
+        if self.book:
+            # Only trust a book move that is legal here, in case of a hash collision
+            move = self.book.pick(board.zobrist_key(player))
+            if move in moves:
+                return move
+        if self.tablebases:
+            move = self.tablebases.best_move(board, player)
+            if move:
+                return move
+        return self.search(board, player, moves)
+
+    def search(self, board, player, moves):
+        """Best of moves for player by paranoid alpha-beta search"""
+        key = board.zobrist_key(player)
+        if key in self.replies:
+            return self.replies[key]
+        self.start(player)
+        self.order_moves(board, moves)
+        following = next_player(player)
+        best, alpha = moves[0], -INFINITY
+        for move in moves:
+            undo = board.make_move(*move)
+            score = self._search(board, following, self.depth - 1, alpha, INFINITY)
+            board.unmake_move(undo)
+            if score > alpha:
+                best, alpha = move, score
+        self.replies[key] = best
+        return best
+
+    def ponder(self, board, player, root):
+        """Search in the background from player's move towards root's next turn, until stopped"""
+        self.stop()
+        self.thread = threading.Thread(target=self._ponder, args=(board.copy(), player, root), daemon=True)
+        self.thread.start()
+
+    def _ponder(self, board, player, root):
+        try:
+            self._ponder_line(board, player, root)
+        except Stopped:
+            pass
+
+    def _ponder_line(self, board, player, root):
+        # Search root's reply to every line of moves until its turn
+        moves = board.generate_moves(player)
+        if player == root:
+            if moves:
+                self.search(board, root, moves)
+            return
+        following = next_player(player)
+        if not moves:
+            self._ponder_line(board, following, root)
+            return
+        self.order_moves(board, moves)
+        for move in moves:
+            if self.stopping:
+                raise Stopped
+            undo = board.make_move(*move)
+            self._ponder_line(board, following, root)
+            board.unmake_move(undo)
+
+    def stop(self):
+        """Stop pondering, waiting for the search to unwind"""
+        if self.thread:
+            self.stopping = True
+            self.thread.join()
+            self.thread = None
+            self.stopping = False
+
+    def start(self, root):
+        """Set up to search for root, with its table"""
+        self.root = root
+        self.table = self.tables.setdefault(root, {})
+        if len(self.table) > TABLE_SIZE:
+            self.table.clear()
+        if len(self.replies) > TABLE_SIZE:
+            self.replies.clear()
+
+    def _search(self, board, player, depth, alpha, beta):
+        # Score of the position for self.root, which maximizes while the
+        # other players minimize. Scores outside alpha..beta are clamped to
+        # the nearer bound.
+        if self.stopping:
+            raise Stopped
+        self.nodes += 1
+        if depth == 0:
+            return chess_eval.evaluate(board, self.root)
+        key = board.key ^ ZOBRIST_TO_MOVE[player]
+        entry = self.table.get(key)
+        best = None
+        if entry:
+            stored_depth, flag, score, best = entry
+            if stored_depth == depth:
+                if flag == EXACT:
+                    return max(alpha, min(beta, score))
+                if flag == LOWER and score >= beta:
+                    return beta
+                if flag == UPPER and score <= alpha:
+                    return alpha
+        following = next_player(player)
+        moves = board.generate_moves(player)
+        if not moves:
+            return self._search(board, following, depth - 1, alpha, beta)
+        self.order_moves(board, moves, best)
+        maximizing = player == self.root
+        start_alpha, start_beta = alpha, beta
+        for move in moves:
+            undo = board.make_move(*move)
+            score = self._search(board, following, depth - 1, alpha, beta)
+            board.unmake_move(undo)
+            if maximizing:
+                if score > alpha:
+                    alpha, best = score, move
+            elif score < beta:
+                beta, best = score, move
+            if alpha >= beta:
+                break
+        if maximizing:
+            score = alpha
+            flag = LOWER if alpha >= beta else UPPER if alpha == start_alpha else EXACT
+        else:
+            score = beta
+            flag = UPPER if beta <= alpha else LOWER if beta == start_beta else EXACT
+        # Keep the deeper search of a position
+        if not entry or entry[0] <= depth:
+            self.table[key] = (depth, flag, score, best)
+        return score
+
+    @staticmethod
+    def order_moves(board, moves, first=None):
+        """Sort moves in place: first, then captures by most valuable victim and least valuable attacker"""
+        grid = board.grid
+
+        def priority(move):
+            if move == first:
+                return INFINITY
+            victim = grid[move[2]][move[3]]
+            if victim is None:
+                return 0
+            return PIECE_VALUES[victim.type.value] * 64 - PIECE_VALUES[grid[move[0]][move[1]].type.value] // 64
+        moves.sort(key=priority, reverse=True)
@@ -0,0 +1,85 @@
+"""Static evaluation for the chess engine: material plus piece-square tables.
+
+Every player's score is the sum, over its pieces, of SQUARE_VALUES for the
+piece on its square: the piece's material value plus a positional bonus.
+Board keeps the four scores in Board.scores and adjusts them in make_move
+and unmake_move (a few table lookups per move), so evaluating a position is
+a handful of additions instead of a walk over all 256 squares.
+
+The positional bonuses are written once from a player's own point of view,
+in terms of how far a square is from the player's home edge (advance) and
+where it lies across the board (file), and turned to face each player:
+North's pawns advance down the rows, East's left along the columns, South's
+up the rows and West's right along the columns, as in Piece._get_pawn_moves.
+
+This module knows pieces by the numbers Board.pack uses (PieceType values
+1-6, player value - 1 as 0-3), so chess.py can import it.
+"""
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(1, 7)
+PLAYERS = 4
+
+# Material value of each piece type; the king's is high enough that losing
+# it outweighs everything else
+PIECE_VALUES = [0, 100, 300, 320, 500, 900, 20000]
+
+
+def orient(player, row, col):
+    """(advance, file) of a square from player's side: rows from its home edge, and across"""
+    if player == 0:  # North
+        return row, col
+    if player == 1:  # East
+        return 15 - col, row
+    if player == 2:  # South
+        return 15 - row, 15 - col
+    return col, 15 - row  # West
+
+
+def positional(piece_type, advance, file):
+    """Bonus for a piece on a square, from its owner's point of view"""
+    # Chebyshev distance to the middle of the board, 0.5 to 7.5
+    centre = max(abs(advance - 7.5), abs(file - 7.5))
+    if piece_type == PAWN:
+        # Forward, and towards the middle files
+        return 5 * (advance - 1) + 3 * max(0.0, 4 - abs(file - 7.5))
+    if piece_type == KNIGHT:
+        return 30 - 6 * centre
+    if piece_type == BISHOP:
+        return 20 - 4 * centre
+    if piece_type == ROOK:
+        return 3 * min(advance, 8)
+    if piece_type == QUEEN:
+        return 10 - 2 * centre
+    # The king keeps back behind its pawns
+    return -20 * min(advance, 4)
+
+
+# [piece type][advance * 16 + file] -> material plus positional bonus
+_OWN_VIEW = [None] + [[PIECE_VALUES[piece_type] + round(positional(piece_type, advance, file))
+                       for advance in range(16) for file in range(16)]
+                      for piece_type in range(1, 7)]
+
+# [player][row * 16 + col] -> advance * 16 + file
+_VIEWS = [[advance * 16 + file for advance, file in
+           (orient(player, row, col) for row in range(16) for col in range(16))]
+          for player in range(PLAYERS)]
+
+# [player][piece type][row * 16 + col] -> material plus positional bonus
+SQUARE_VALUES = [[[own[square] for square in view] if own else None for own in _OWN_VIEW]
+                 for view in _VIEWS]
+
+
+def scores(board):
+    """Each player's score from scratch, as Board.scores should hold them"""
+    totals = [0] * PLAYERS
+    for row, line in enumerate(board.grid):
+        for col, piece in enumerate(line):
+            if piece:
+                totals[piece.player_index] += piece.square_values[row * 16 + col]
+    return totals
+
+
+def evaluate(board, player):
+    """Player's score minus the average of the others', from Board.scores"""
+    totals = board.scores
+    own = totals[player.value - 1]
+    return own - (totals[0] + totals[1] + totals[2] + totals[3] - own) // 3
@@ -0,0 +1,442 @@
+"""Endgame tablebases for the computer players in chess.py.
+
+    python chess_tablebase.py build KQK KRK      # into the tablebases folder
+    python chess_tablebase.py build KRK --jobs 4 --out /tmp/tables
+    python chess_tablebase.py info tablebases/KQK.ktb
+
+    tables = Tablebases.open()
+    tables.probe(board, player)        # plies until a king falls, or None
+    tables.best_move(board, player)    # a move that keeps to perfect play, or None
+
+Late in a game often only two players have pieces left, and the other two
+just pass. A table covers one such ending: a king and one other piece
+(queen, rook, bishop or knight) against a lone king, on the 192 squares
+Board.is_valid_position allows, plus king against king, which the others
+turn into when the lone king takes the piece. The game has no check, so
+play ends when a king is taken, and perfect play means taking the other
+king as soon as possible, or putting off losing one's own as long as
+possible. A table holds, for every placement of the pieces and either side
+to move, the number of moves (counting both players') until that happens:
+odd if the side to move takes the other king, even if it loses its own, 0
+if neither can be forced.
+
+Tables are built by retrograde analysis. A scan over every position (split
+over a process pool) counts each position's moves and finds the ones where
+a king can be taken at once, or where taking the piece reaches a known king
+against king result. From there the results spread backwards a move at a
+time: the pieces only move in ways they can move back, so the positions a
+move came from are found by moving the pieces from the newly settled
+positions. A position where the mover wins once any of its moves reaches a
+loss for the other side, and loses once all of its moves reach wins.
+Everything left over is a draw.
+
+A table file is a header, then each side's results in index order packed
+into as few bits apiece as the longest result needs:
+
+    b"KTBL", format version u8, piece count u8, bits per result u8, pad u8,
+    table name (b"KQK") padded to 8 bytes
+    results with the stronger side to move, then with the lone king to move
+
+where the index of a position is its squares' numbers (0-191, counted over
+the playable squares in row order) as digits in base 192, stronger king
+first and lone king last. Bits are taken low first from little-endian
+bytes. The files are memory-mapped and a probe reads the three bytes
+holding one result.
+"""
+import argparse
+import glob
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+from assets import asset_path
+from chess import Board, PieceType, next_player
+
+MAGIC = b"KTBL"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBx8s")
+TABLE_DIR = asset_path("tablebases")
+
+# The playable squares, and each square's number among them (-1 off the board)
+_board = Board.__new__(Board)
+SQUARES = [(row, col) for row in range(16) for col in range(16) if _board.is_valid_position(row, col)]
+SQUARE_INDEX = [-1] * 256
+for _number, (_row, _col) in enumerate(SQUARES):
+    SQUARE_INDEX[_row * 16 + _col] = _number
+del _board, _number, _row, _col
+N = len(SQUARES)
+OFF = N  # Square number meaning "off the board" in the move tables
+
+# How each piece moves: the steps it takes, and whether it keeps stepping
+ORTHOGONAL = ((-1, 0), (1, 0), (0, -1), (0, 1))
+DIAGONAL = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+KNIGHT_JUMPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+MOVES = {
+    'K': (ORTHOGONAL + DIAGONAL, False),
+    'Q': (ORTHOGONAL + DIAGONAL, True),
+    'R': (ORTHOGONAL, True),
+    'B': (DIAGONAL, True),
+    'N': (KNIGHT_JUMPS, False),
+}
+LETTERS = {PieceType.KING: 'K', PieceType.QUEEN: 'Q', PieceType.ROOK: 'R',
+           PieceType.BISHOP: 'B', PieceType.KNIGHT: 'N'}
+TABLES = ('KK', 'KQK', 'KRK', 'KBK', 'KNK')
+
+
+def _step_table(step):
+    # Square number after one step from each square, OFF when it leaves the board
+    table = np.full(N + 1, OFF, dtype=np.int32)
+    for number, (row, col) in enumerate(SQUARES):
+        row, col = row + step[0], col + step[1]
+        if 0 <= row < 16 and 0 <= col < 16 and SQUARE_INDEX[row * 16 + col] >= 0:
+            table[number] = SQUARE_INDEX[row * 16 + col]
+    return table
+
+
+STEPS = {step: _step_table(step) for step in ORTHOGONAL + DIAGONAL + KNIGHT_JUMPS}
+
+
+class TablebaseError(Exception):
+    pass
+
+
+class Layout:
+    """The pieces of a table, who owns them and where their squares sit in an index"""
+
+    def __init__(self, name):
+        if name not in TABLES:
+            raise TablebaseError(f"No table {name}; tables are {', '.join(TABLES)}")
+        self.name = name
+        self.pieces = name  # Stronger side's king, its piece if any, lone king
+        self.sides = [0] * (len(name) - 1) + [1]
+        self.count = len(name)
+        self.size = N ** self.count
+        self.strides = [N ** (self.count - 1 - i) for i in range(self.count)]
+
+    def squares(self, index):
+        """Each piece's square number for an array of indexes"""
+        return [index // stride % N for stride in self.strides]
+
+
+def _scan(name, start, stop, kk):
+    """Moves of every position in start..stop-1 for each side to move, from the pool
+
+    Returns, per side, the number of moves whose outcome is still open, the
+    positions where a king can be taken at once, and for moves taking the
+    piece into a king against king position its outcome as (the longest
+    loss it leads to, the quickest win)."""
+    layout = Layout(name)
+    index = np.arange(start, stop, dtype=np.int64)
+    squares = [s.astype(np.int32) for s in layout.squares(index)]
+    legal = np.ones(len(index), dtype=bool)
+    for i in range(layout.count):
+        for j in range(i + 1, layout.count):
+            legal &= squares[i] != squares[j]
+    results = []
+    for side in (0, 1):
+        count = np.zeros(len(index), dtype=np.int16)
+        takes_king = np.zeros(len(index), dtype=bool)
+        longest_loss = np.zeros(len(index), dtype=np.int16)
+        quickest_win = np.zeros(len(index), dtype=np.int16)
+        for mover in range(layout.count):
+            if layout.sides[mover] != side:
+                continue
+            steps, slides = MOVES[layout.pieces[mover]]
+            for step in steps:
+                table = STEPS[step]
+                square = squares[mover]
+                alive = legal.copy()
+                while alive.any():
+                    square = table[square]
+                    alive &= square != OFF
+                    empty = alive.copy()
+                    for other in range(layout.count):
+                        if other == mover:
+                            continue
+                        hit = alive & (square == squares[other])
+                        empty &= ~hit
+                        if layout.sides[other] == side:
+                            pass
+                        elif other == 0 or other == layout.count - 1:
+                            takes_king |= hit
+                        elif hit.any():
+                            # The lone king takes the piece: king against king,
+                            # the stronger side to move
+                            after = kk[0][squares[0][hit] * N + square[hit]]
+                            longest_loss[hit] = np.where(after % 2 == 1, after, 0)
+                            quickest_win[hit] = np.where((after > 0) & (after % 2 == 0), after, 0)
+                            count[hit] += after == 0
+                        alive &= ~hit
+                    count += empty
+                    if not slides:
+                        break
+        results.append((count, takes_king, longest_loss, quickest_win))
+    return start, stop, legal, results
+
+
+def _unmoves(layout, positions, side):
+    """Positions side could have moved from to reach positions, one per move, without capturing"""
+    squares = [s.astype(np.int32) for s in layout.squares(positions)]
+    found = []
+    for mover in range(layout.count):
+        if layout.sides[mover] != side:
+            continue
+        steps, slides = MOVES[layout.pieces[mover]]
+        stride = layout.strides[mover]
+        for step in steps:
+            table = STEPS[step]
+            square = squares[mover]
+            alive = np.ones(len(positions), dtype=bool)
+            while alive.any():
+                square = table[square]
+                alive &= square != OFF
+                for other in range(layout.count):
+                    if other != mover:
+                        alive &= square != squares[other]
+                found.append(positions[alive] + (square[alive] - squares[mover][alive]).astype(np.int64) * stride)
+                if not slides:
+                    break
+    return np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+
+
+def generate(name, kk=None, pool=None, chunks=16, log=None):
+    """Results of table name for each side to move, as two int16 arrays"""
+    layout = Layout(name)
+    values = [np.zeros(layout.size, dtype=np.int16) for _ in (0, 1)]
+    count = [np.zeros(layout.size, dtype=np.int16) for _ in (0, 1)]
+    longest_loss = [np.zeros(layout.size, dtype=np.int16) for _ in (0, 1)]
+    pending = {}  # Moves until a king falls -> per side, the positions that may settle there
+
+    def push(level, side, positions):
+        if len(positions):
+            pending.setdefault(int(level), ([], []))[side].append(positions)
+
+    kk = kk if kk is not None else [np.zeros(N * N, dtype=np.int16)] * 2
+    bounds = np.linspace(0, layout.size, chunks + 1).astype(np.int64)
+    jobs = [(name, int(start), int(stop), kk) for start, stop in zip(bounds[:-1], bounds[1:])]
+    scans = pool.starmap(_scan, jobs) if pool else [_scan(*job) for job in jobs]
+    for start, stop, legal, results in scans:
+        for side, (moves, takes_king, loss, win) in enumerate(results):
+            count[side][start:stop] = moves
+            longest_loss[side][start:stop] = loss
+            index = np.arange(start, stop, dtype=np.int64)
+            push(1, side, index[takes_king])
+            # Taking the piece into a won king against king position
+            for level in np.unique(win[win > 0]):
+                push(level + 1, side, index[win == level])
+            # Every move already known to lose (no moves at all cannot happen,
+            # as a king always has a square to go to)
+            lost = legal & ~takes_king & (moves == 0) & (loss > 0)
+            for level in np.unique(loss[lost]):
+                push(level + 1, side, index[lost & (loss == level)])
+    if log:
+        log(f"{name}: scanned {2 * layout.size} positions")
+
+    while pending:
+        level = min(pending)
+        settled = []
+        for side in (0, 1):
+            positions = pending[level][side]
+            positions = np.unique(np.concatenate(positions)) if positions else np.zeros(0, dtype=np.int64)
+            positions = positions[values[side][positions] == 0]
+            values[side][positions] = level
+            settled.append(positions)
+        del pending[level]
+        for side in (0, 1):
+            mover = 1 - side  # Who moved into the settled positions
+            before = _unmoves(layout, settled[side], mover)
+            before = before[values[mover][before] == 0]
+            if level % 2 == 0:
+                # The side to move there loses, so moving there wins
+                push(level + 1, mover, before)
+            else:
+                np.subtract.at(count[mover], before, 1)
+                before = np.unique(before)
+                lost = before[count[mover][before] == 0]
+                levels = np.maximum(longest_loss[mover][lost], level) + 1
+                for lost_level in np.unique(levels):
+                    push(lost_level, mover, lost[levels == lost_level])
+        if log and any(len(s) for s in settled):
+            log(f"{name}: {len(settled[0])} + {len(settled[1])} positions end in {level}")
+    return values
+
+
+def write_table(path, name, values):
+    """Bit-pack the results for both sides into a table file"""
+    bits = max(1, int(max(v.max() for v in values)).bit_length())
+    streams = []
+    for side_values in values:
+        as_bits = np.unpackbits(side_values.astype('<u2').view(np.uint8).reshape(-1, 2), axis=1,
+                                bitorder='little')[:, :bits]
+        # Two spare bytes so a probe can always read three
+        streams.append(np.packbits(as_bits.reshape(-1), bitorder='little').tobytes() + b"\0\0")
+    temporary = f"{path}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(name), bits, name.encode()))
+        for stream in streams:
+            f.write(stream)
+    os.replace(temporary, path)
+
+
+class Tablebase:
+    """One table file, memory-mapped"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size:
+            raise TablebaseError(f"{path} is truncated")
+        magic, version, count, self.bits, name = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise TablebaseError(f"{path} is not a tablebase")
+        if version != VERSION:
+            raise TablebaseError(f"{path} has tablebase format version {version} (expected {VERSION})")
+        self.name = name.rstrip(b"\0").decode()
+        self.layout = Layout(self.name)
+        self.stream_size = -(-self.layout.size * self.bits // 8) + 2
+        if len(self.map) < HEADER.size + 2 * self.stream_size:
+            raise TablebaseError(f"{path} is truncated")
+        self.mask = (1 << self.bits) - 1
+
+    def close(self):
+        self.map.close()
+
+    def value(self, side, index):
+        """Result of position index with side to move (0 the stronger side)"""
+        bit = index * self.bits
+        offset = HEADER.size + side * self.stream_size + (bit >> 3)
+        return int.from_bytes(self.map[offset:offset + 3], 'little') >> (bit & 7) & self.mask
+
+    def values(self, side):
+        """Every result with side to move, unpacked, for checking and info"""
+        start = HEADER.size + side * self.stream_size
+        packed = np.frombuffer(self.map, dtype=np.uint8, count=self.stream_size - 2, offset=start)
+        as_bits = np.unpackbits(packed, bitorder='little')[:self.layout.size * self.bits]
+        weights = (1 << np.arange(self.bits)).astype(np.int32)
+        return as_bits.reshape(-1, self.bits).astype(np.int32) @ weights
+
+
+class Tablebases:
+    """The tables in a folder, by name"""
+
+    def __init__(self, tables):
+        self.tables = {table.name: table for table in tables}
+
+    @classmethod
+    def open(cls, folder=TABLE_DIR):
+        """Every table file in folder, or None if there are none"""
+        tables = [Tablebase(path) for path in sorted(glob.glob(os.path.join(folder, "*.ktb")))]
+        return cls(tables) if tables else None
+
+    def probe(self, board, player):
+        """Moves until a king is taken with player to move (odd: player takes it), 0 for a draw,
+        or None when no table covers the position"""
+        sides = {}
+        for row, line in enumerate(board.grid):
+            for col, piece in enumerate(line):
+                if piece:
+                    sides.setdefault(piece.player, []).append((piece.type, SQUARE_INDEX[row * 16 + col]))
+        if len(sides) != 2 or player not in sides:
+            return None
+        strong, weak = sorted(sides, key=lambda owner: -len(sides[owner]))
+        if len(sides[weak]) != 1 or len(sides[strong]) > 2:
+            return None
+        pieces = sorted(sides[strong], key=lambda piece: piece[0] != PieceType.KING) + sides[weak]
+        if pieces[0][0] != PieceType.KING or pieces[-1][0] != PieceType.KING or not all(
+                piece_type in LETTERS for piece_type, _ in pieces):
+            return None
+        table = self.tables.get("".join(LETTERS[piece_type] for piece_type, _ in pieces))
+        if table is None:
+            return None
+        index = 0
+        for _, square in pieces:
+            index = index * N + square
+        return table.value(0 if player == strong else 1, index)
+
+    def best_move(self, board, player):
+        """The move perfect play makes for player, or None when no table covers the position"""
+        if self.probe(board, player) is None:
+            return None
+        # The other side with pieces, which moves next as the rest pass
+        opponent = next_player(player)
+        while not any(piece and piece.player == opponent for line in board.grid for piece in line):
+            opponent = next_player(opponent)
+        best, best_rank = None, None
+        for move in board.generate_moves(player):
+            target = board.grid[move[2]][move[3]]
+            if target and target.type == PieceType.KING:
+                return move
+            undo = board.make_move(*move)
+            after = self.probe(board, opponent)
+            board.unmake_move(undo)
+            if not after:
+                rank = (1, 0)  # A draw
+            elif after % 2 == 0:
+                rank = (2, -after)  # The opponent loses; the sooner the better
+            else:
+                rank = (0, after)  # The opponent wins; the later the better
+            if best_rank is None or rank > best_rank:
+                best, best_rank = move, rank
+        return best
+
+
+def cmd_build(args):
+    os.makedirs(args.out, exist_ok=True)
+    names = ['KK'] + [name for name in args.tables if name != 'KK']
+    for name in names:
+        Layout(name)  # Reject unknown names before any work
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.jobs) as pool:
+        kk = None
+        for name in names:
+            values = generate(name, kk, pool, chunks=max(1, args.jobs) * 4,
+                              log=lambda line: print(line, file=sys.stderr))
+            if name == 'KK':
+                kk = values
+            path = os.path.join(args.out, f"{name}.ktb")
+            write_table(path, name, values)
+            print(f"{path}: {os.path.getsize(path)} bytes ({time.perf_counter() - start:.1f} s)")
+    return 0
+
+
+def cmd_info(args):
+    for path in args.tables:
+        table = Tablebase(path)
+        print(f"{path}: {table.name}, {table.bits} bits per result")
+        for side, label in ((0, "stronger side to move"), (1, "lone king to move")):
+            values = table.values(side)
+            wins, losses = values % 2 == 1, (values > 0) & (values % 2 == 0)
+            print(f"  {label}: {wins.sum()} won, {losses.sum()} lost, "
+                  f"longest {values.max()} moves")
+        table.close()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and inspect chess endgame tablebases')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='Generate tables (king against king always comes first)')
+    build.add_argument('tables', nargs='+', choices=TABLES, help='Tables to build')
+    build.add_argument('--out', default=TABLE_DIR, help='Folder for the table files')
+    build.add_argument('--jobs', type=int, default=os.cpu_count(), help='Worker processes for the scans')
+    build.set_defaults(func=cmd_build)
+
+    info = commands.add_parser('info', help='Summarize table files')
+    info.add_argument('tables', nargs='+', help='Table files')
+    info.set_defaults(func=cmd_info)
+
+    args = parser.parse_args()
+    try:
+        sys.exit(args.func(args))
+    except TablebaseError as e:
+        sys.exit(f"chess_tablebase.py: {e}")
+
+
+if __name__ == "__main__":
+    main()
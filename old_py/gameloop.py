@@ -0,0 +1,75 @@
+"""The main loop shared by every game.
+
+A game object provides:
+
+    running            False once the game wants to stop
+    handle_event(e)    react to one input event
+    update(dt)         advance by dt seconds of real time
+    draw()             render a frame to its screen (the loop flips it)
+    is_animating()     True while anything moves without input
+    state_key()        plain-data summary of the game state, for replays
+
+While a game is not animating, the loop sleeps in pygame.event.wait()
+instead of redrawing at the frame rate, so a board waiting minutes for a
+click costs no CPU. The frame that wakes up hands the game dt = 0: nothing
+was moving, so no game time passed, and a held key or a new spin starts
+counting from the next frame rather than catching up on the idle time.
+
+Input goes through the loop rather than being polled inside games, so a
+session can be recorded and replayed exactly (see replay.py). F3 is kept by
+the loop to toggle the profiler overlay (see profiler.py).
+"""
+import pygame
+
+from profiler import PROFILER
+
+# The only events games react to; everything else is dropped before recording
+INPUT_EVENTS = (pygame.QUIT, pygame.KEYDOWN, pygame.KEYUP,
+                pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP)
+
+IDLE_TIMEOUT = 1000  # Milliseconds an idle game sleeps before redrawing anyway
+
+
+def run(game, fps=60, recorder=None):
+    """Run game until it stops, optionally recording every frame"""
+    clock = pygame.time.Clock()
+    clock.tick(fps)
+    while game.running:
+        if game.is_animating():
+            dt = clock.tick(fps) / 1000
+            woken_by = []
+        else:
+            # Block until something happens. Any event but a bare mouse move
+            # (input, the window being exposed or resized) wakes the loop for
+            # one redraw
+            event = pygame.event.wait(IDLE_TIMEOUT)
+            while event.type == pygame.MOUSEMOTION:
+                event = pygame.event.wait(IDLE_TIMEOUT)
+            woken_by = [event] if event.type != pygame.NOEVENT else []
+            clock.tick()
+            dt = 0.0
+        PROFILER.begin_frame()
+        events = []
+        for event in woken_by + pygame.event.get():
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                PROFILER.toggle_overlay()
+            elif event.type in INPUT_EVENTS:
+                events.append(event)
+        if recorder:
+            dt = recorder.frame(dt, events)
+
+        with PROFILER.scope("events"):
+            for event in events:
+                game.handle_event(event)
+        with PROFILER.scope("update"):
+            game.update(dt)
+
+        with PROFILER.scope("draw"):
+            game.draw()
+        PROFILER.draw_overlay(pygame.display.get_surface())
+        with PROFILER.scope("flip"):
+            pygame.display.flip()
+        PROFILER.end_frame()
+    if recorder:
+        recorder.finish(game)
+    PROFILER.finish()
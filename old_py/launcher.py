@@ -0,0 +1,200 @@
+"""Kiosk launcher: one process that runs every game in old_py.
+
+pygame, the display and the font cache are initialized once. Games are
+imported the first time they are picked and then stay loaded, so switching
+games only re-runs the game's own setup. Closing a game returns to the menu.
+
+    python launcher.py            # menu
+    python launcher.py --benchmark  # launch every game twice and report timings
+"""
+import argparse
+import importlib
+import sys
+import time
+
+_started = time.perf_counter()
+
+import pygame
+
+from assets import get_font
+
+MENU_WIDTH = 800
+MENU_HEIGHT = 600
+BLACK = (0, 0, 0)
+WHITE = (255, 255, 255)
+GREY = (128, 128, 128)
+HIGHLIGHT = (255, 215, 0)
+
+# (menu title, module name); each module has a main() that returns when the game ends
+GAMES = [
+    ("Tank Battle", "tank"),
+    ("4-Player Chess", "chess"),
+    ("Collection Game", "cake"),
+    ("Snail Race", "snail"),
+    ("9 Lives", "nine_lives"),
+]
+
+
+class FirstFrameTimer:
+    """Times how long a game takes to show its first frame.
+
+    Wraps pygame.display.flip for one call, then puts it back. With
+    quit_after_first_frame the game is asked to close as soon as the frame
+    is shown, which is how --benchmark runs every game unattended.
+    """
+    def __init__(self, quit_after_first_frame=False):
+        self.quit_after_first_frame = quit_after_first_frame
+        self.first_frame = None
+        self._flip = None
+
+    def __enter__(self):
+        self._flip = pygame.display.flip
+
+        def flip():
+            self._flip()
+            if self.first_frame is None:
+                self.first_frame = time.perf_counter()
+                pygame.display.flip = self._flip
+                if self.quit_after_first_frame:
+                    pygame.event.post(pygame.event.Event(pygame.QUIT))
+
+        pygame.display.flip = flip
+        return self
+
+    def __exit__(self, *exc):
+        pygame.display.flip = self._flip
+        return False
+
+
+class Launcher:
+    def __init__(self):
+        self.timings = []  # (phase, seconds)
+        self.launches = []  # (title, import seconds or None, seconds to first frame)
+
+        start = time.perf_counter()
+        pygame.init()
+        self.timings.append(("pygame.init", time.perf_counter() - start))
+
+        start = time.perf_counter()
+        self.screen = pygame.display.set_mode((MENU_WIDTH, MENU_HEIGHT))
+        self.timings.append(("display", time.perf_counter() - start))
+
+        # The first SysFont call scans the system fonts; do it once, up front
+        start = time.perf_counter()
+        self.title_font = get_font('Arial', 48)
+        self.font = get_font('Arial', 32)
+        self.timings.append(("font scan", time.perf_counter() - start))
+
+        self.modules = {}
+        self.selected = 0
+
+    def show_menu(self):
+        self.screen = pygame.display.set_mode((MENU_WIDTH, MENU_HEIGHT))
+        pygame.display.set_caption("Kids Games")
+
+    def draw_menu(self):
+        self.screen.fill(BLACK)
+        title = self.title_font.render("Pick a game", True, WHITE)
+        self.screen.blit(title, title.get_rect(center=(MENU_WIDTH // 2, 80)))
+        for i, (name, _) in enumerate(GAMES):
+            color = HIGHLIGHT if i == self.selected else WHITE
+            text = self.font.render(f"{i + 1}. {name}", True, color)
+            self.screen.blit(text, text.get_rect(center=(MENU_WIDTH // 2, 180 + i * 60)))
+        hint = self.font.render("Arrows + ENTER, or 1-5.  ESC quits", True, GREY)
+        self.screen.blit(hint, hint.get_rect(center=(MENU_WIDTH // 2, MENU_HEIGHT - 50)))
+        pygame.display.flip()
+
+    def item_at(self, pos):
+        for i in range(len(GAMES)):
+            if abs(pos[1] - (180 + i * 60)) < 30:
+                return i
+        return None
+
+    def launch(self, index, quit_after_first_frame=False):
+        """Run one game to completion and record how long it took to start"""
+        name, module_name = GAMES[index]
+        requested = time.perf_counter()
+
+        import_time = None
+        module = self.modules.get(module_name)
+        if module is None:
+            module = importlib.import_module(module_name)
+            self.modules[module_name] = module
+            import_time = time.perf_counter() - requested
+
+        with FirstFrameTimer(quit_after_first_frame) as timer:
+            module.main()
+        if timer.first_frame is not None:
+            self.launches.append((name, import_time, timer.first_frame - requested))
+
+        # Games may leave events (their own QUIT) behind; don't let them close the menu
+        pygame.event.clear()
+        self.show_menu()
+
+    def run(self):
+        self.show_menu()
+        self.timings.append(("menu ready", time.perf_counter() - _started))
+        running = True
+        while running:
+            # The menu is static, so sleep until there is input
+            for event in [pygame.event.wait()] + pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_ESCAPE:
+                        running = False
+                    elif event.key in (pygame.K_UP, pygame.K_w):
+                        self.selected = (self.selected - 1) % len(GAMES)
+                    elif event.key in (pygame.K_DOWN, pygame.K_s):
+                        self.selected = (self.selected + 1) % len(GAMES)
+                    elif event.key in (pygame.K_RETURN, pygame.K_SPACE):
+                        self.launch(self.selected)
+                    elif pygame.K_1 <= event.key < pygame.K_1 + len(GAMES):
+                        self.selected = event.key - pygame.K_1
+                        self.launch(self.selected)
+                elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                    index = self.item_at(event.pos)
+                    if index is not None:
+                        self.selected = index
+                        self.launch(index)
+            self.draw_menu()
+
+    def benchmark(self, rounds=2):
+        """Start every game rounds times, closing each after its first frame"""
+        self.show_menu()
+        self.timings.append(("menu ready", time.perf_counter() - _started))
+        for _ in range(rounds):
+            for index in range(len(GAMES)):
+                self.launch(index, quit_after_first_frame=True)
+
+    def report(self, out=sys.stdout):
+        print("Startup", file=out)
+        for phase, seconds in self.timings:
+            print(f"  {phase:<16} {seconds * 1000:8.1f} ms", file=out)
+        if self.launches:
+            print("Game switches (request to first frame)", file=out)
+            for name, import_time, seconds in self.launches:
+                note = f"  (import {import_time * 1000:.1f} ms)" if import_time is not None else ""
+                print(f"  {name:<16} {seconds * 1000:8.1f} ms{note}", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Kids games launcher')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='Start every game twice without a human and report timings')
+    parser.add_argument('--report', action='store_true',
+                        help='Print the startup-time report on exit')
+    args = parser.parse_args()
+
+    launcher = Launcher()
+    if args.benchmark:
+        launcher.benchmark()
+    else:
+        launcher.run()
+    if args.report or args.benchmark:
+        launcher.report()
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,14 @@
 import pygame
 import random
+import struct
 import sys
 import argparse
 from pygame.locals import *
-
-# Initialize pygame
-pygame.init()
+import gameloop
+import replay
+from assets import get_font, load_image, asset_path
+import profiler
+from profiler import profiled
 
 # Constants
 SCREEN_WIDTH = 800
@@ -28,35 +31,52 @@ LIGHT_BLUE = (173, 216, 230)
 LIGHT_GREEN = (144, 238, 144)
 LIGHT_RED = (255, 182, 193)
 
+OPERATIONS = ['+', '-', '×', '(', ')', '⚔️']
+
+# Snapshot layout (see snapshot.py): round, total rounds, flags, open
+# parentheses, selected cat count and the cat, dog and expression lengths;
+# then the records below and a byte per expression item (numbers as they
+# are, operations as 128 + their index in OPERATIONS)
+SNAPSHOT = struct.Struct("<8B")
+CAT = struct.Struct("<B6hB")  # Number, rect, original and target position, flags
+DOG = struct.Struct("<BhhB")  # Number, rect position, alive
+BOSS = struct.Struct("<hhHHB")  # Rect position, max and current HP, alive
+FLAG_GAME_OVER, FLAG_WIN, FLAG_BOSS_ROUND, FLAG_BOSS = 1, 2, 4, 8
+CAT_FLAGS = ('alive', 'selected', 'advancing', 'used')
+
 # Game class
 class NineLives:
-    def __init__(self):
+    def __init__(self, start_round=1):
+        # Window, fonts and images are set up by run(), so the game logic can
+        # be used headless
+        self.screen = None
+        self.running = True
+        
+        # Initialize game variables
+        self.total_rounds = 9
+        self.current_round = start_round
+        self.reset_round()
+    
+    def init_display(self):
+        pygame.init()
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
         pygame.display.set_caption("9 Lives - Math Game")
         
         # Load fonts
-        self.font = pygame.font.SysFont(None, FONT_SIZE)
-        self.small_font = pygame.font.SysFont(None, SMALL_FONT_SIZE)
+        self.font = get_font(None, FONT_SIZE)
+        self.small_font = get_font(None, SMALL_FONT_SIZE)
         
         # Load images
         try:
-            cat_image = pygame.image.load("cat.jpg")
-            self.cat_img = pygame.transform.scale(cat_image, (CAT_SIZE, CAT_SIZE))
-            
-            dog_image = pygame.image.load("dog.jpg")
-            self.dog_img = pygame.transform.scale(dog_image, (DOG_SIZE, DOG_SIZE))
-        except pygame.error:
+            self.cat_img = load_image(asset_path("cat.jpg"), (CAT_SIZE, CAT_SIZE), smooth=False)
+            self.dog_img = load_image(asset_path("dog.jpg"), (DOG_SIZE, DOG_SIZE), smooth=False)
+        except (pygame.error, OSError):
             # Fallback to colored rectangles if images can't be loaded
             self.cat_img = pygame.Surface((CAT_SIZE, CAT_SIZE))
             self.cat_img.fill(LIGHT_BLUE)
             self.dog_img = pygame.Surface((DOG_SIZE, DOG_SIZE))
             self.dog_img.fill(LIGHT_RED)
         
-        # Initialize game variables
-        self.total_rounds = 9
-        self.current_round = 1
-        self.reset_round()
-        
     def reset_round(self):
         # Initialize cats (3x3 grid)
         self.cats = []
@@ -111,10 +131,21 @@ class NineLives:
             # No boss in regular rounds
             self.boss = None
         
+        self.create_buttons()
+        
+        # Game state
+        self.current_expression = []
+        self.current_value = 0
+        self.expression_text = ""
+        self.game_over = False
+        self.win = False
+        self.open_parens = 0  # Track the number of open parentheses
+        self.selected_cats_count = 0  # Keep track of how many cats are selected for column positioning
+    
+    def create_buttons(self):
         # Initialize operation buttons
         self.buttons = []
-        operations = ['+', '-', '×', '(', ')', '⚔️']
-        for i, op in enumerate(operations):
+        for i, op in enumerate(OPERATIONS):
             x = (SCREEN_WIDTH // 7) * (i + 1) - BUTTON_SIZE // 2
             y = SCREEN_HEIGHT - BUTTON_SIZE - GAP
             button_rect = pygame.Rect(x, y, BUTTON_SIZE, BUTTON_SIZE)
@@ -123,16 +154,8 @@ class NineLives:
                 'operation': op,
                 'selected': False
             })
-        
-        # Game state
-        self.current_expression = []
-        self.current_value = 0
-        self.expression_text = ""
-        self.game_over = False
-        self.win = False
-        self.open_parens = 0  # Track the number of open parentheses
-        self.selected_cats_count = 0  # Keep track of how many cats are selected for column positioning
     
+    @profiled("nine_lives.eval")
     def calculate_value(self):
         if not self.current_expression:
             return 0
@@ -218,6 +241,20 @@ class NineLives:
                         cat['rect'].y += move_y
     
     def handle_event(self, event):
+        if event.type == QUIT:
+            self.running = False
+        
+        if self.game_over:
+            if event.type == KEYDOWN or event.type == MOUSEBUTTONDOWN:
+                if self.current_round <= self.total_rounds:
+                    self.reset_round()
+                    self.game_over = False
+                else:
+                    self.running = False
+        else:
+            self.handle_click(event)
+    
+    def handle_click(self, event):
         if event.type == MOUSEBUTTONDOWN:
             # Check if a cat was clicked
             for i, cat in enumerate(self.cats):
@@ -480,34 +517,91 @@ class NineLives:
             self.screen.blit(result_text, result_rect)
             self.screen.blit(continue_text, continue_rect)
     
-    def run(self):
-        clock = pygame.time.Clock()
-        running = True
-        
-        while running:
-            for event in pygame.event.get():
-                if event.type == QUIT:
-                    running = False
-                
-                if self.game_over:
-                    if event.type == KEYDOWN or event.type == MOUSEBUTTONDOWN:
-                        if self.current_round <= self.total_rounds:
-                            self.reset_round()
-                            self.game_over = False
-                        else:
-                            running = False
-                else:
-                    self.handle_event(event)
-            
-            # Update cat positions for animation
-            self.update_cats()
-            
-            self.draw()
-            pygame.display.flip()
-            clock.tick(60)
+    def update(self, dt):
+        # Update cat positions for animation; cats move a fixed distance per frame
+        self.update_cats()
+    
+    def is_animating(self):
+        # Cats walking to or from the centre column
+        return any(cat['alive'] and cat['rect'].topleft != cat['target_pos'] for cat in self.cats)
+    
+    def state_key(self):
+        # Everything a replay must reproduce, as plain data
+        return (self.cats, self.dogs, self.boss, self.current_expression,
+                self.current_round, self.game_over)
+    
+    def snapshot(self):
+        flags = ((self.game_over and FLAG_GAME_OVER) | (self.win and FLAG_WIN)
+                 | (self.is_boss_round and FLAG_BOSS_ROUND) | (self.boss is not None and FLAG_BOSS))
+        parts = [SNAPSHOT.pack(self.current_round, self.total_rounds, flags, self.open_parens,
+                               self.selected_cats_count, len(self.cats), len(self.dogs),
+                               len(self.current_expression))]
+        for cat in self.cats:
+            cat_flags = sum(1 << i for i, name in enumerate(CAT_FLAGS) if cat[name])
+            parts.append(CAT.pack(cat['number'], *cat['rect'].topleft, *cat['original_pos'],
+                                  *cat['target_pos'], cat_flags))
+        for dog in self.dogs:
+            parts.append(DOG.pack(dog['number'], *dog['rect'].topleft, dog['alive']))
+        if self.boss:
+            parts.append(BOSS.pack(*self.boss['rect'].topleft, self.boss['max_hp'],
+                                   self.boss['current_hp'], self.boss['alive']))
+        parts.append(bytes(item if isinstance(item, int) else 128 + OPERATIONS.index(item)
+                           for item in self.current_expression))
+        return b"".join(parts)
+    
+    def restore(self, data):
+        (self.current_round, self.total_rounds, flags, self.open_parens, self.selected_cats_count,
+         n_cats, n_dogs, n_items) = SNAPSHOT.unpack_from(data)
+        offset = SNAPSHOT.size
+        self.screen = getattr(self, 'screen', None)
+        self.running = getattr(self, 'running', True)
+        self.game_over = bool(flags & FLAG_GAME_OVER)
+        self.win = bool(flags & FLAG_WIN)
+        self.is_boss_round = bool(flags & FLAG_BOSS_ROUND)
+        
+        self.cats = []
+        for _ in range(n_cats):
+            number, x, y, original_x, original_y, target_x, target_y, cat_flags = CAT.unpack_from(data, offset)
+            offset += CAT.size
+            cat = {'rect': pygame.Rect(x, y, CAT_SIZE, CAT_SIZE),
+                   'original_pos': (original_x, original_y),
+                   'target_pos': (target_x, target_y),
+                   'number': number}
+            for i, name in enumerate(CAT_FLAGS):
+                cat[name] = bool(cat_flags >> i & 1)
+            self.cats.append(cat)
+        self.cat_numbers = [cat['number'] for cat in self.cats]
+        
+        self.dogs = []
+        for _ in range(n_dogs):
+            number, x, y, alive = DOG.unpack_from(data, offset)
+            offset += DOG.size
+            self.dogs.append({'rect': pygame.Rect(x, y, DOG_SIZE, DOG_SIZE),
+                              'number': number, 'alive': bool(alive)})
+        self.dog_numbers = [dog['number'] for dog in self.dogs]
         
-        pygame.quit()
-        sys.exit()
+        self.boss = None
+        if flags & FLAG_BOSS:
+            x, y, max_hp, current_hp, alive = BOSS.unpack_from(data, offset)
+            offset += BOSS.size
+            self.boss = {'rect': pygame.Rect(x, y, BOSS_SIZE, BOSS_SIZE),
+                         'max_hp': max_hp, 'current_hp': current_hp, 'alive': bool(alive)}
+        
+        self.current_expression = [item if item < 128 else OPERATIONS[item - 128]
+                                   for item in data[offset:offset + n_items]]
+        self.create_buttons()
+        self.update_expression_text()
+    
+    def run(self, recorder=None):
+        self.init_display()
+        gameloop.run(self, 60, recorder)
+
+def main(start_round=1, seed=None, record=None):
+    seed = replay.seed_session(seed)
+    # Set the starting round
+    game = NineLives(start_round)
+    recorder = replay.Recorder(record, "nine_lives", seed, {"start_round": start_round}) if record else None
+    game.run(recorder)
 
 # Run the game
 if __name__ == "__main__":
@@ -515,13 +609,14 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='9 Lives - Math Game')
     parser.add_argument('--round', '-r', type=int, default=1, 
                         help='Start at a specific round (1-9)')
+    replay.add_arguments(parser)
+    profiler.add_arguments(parser)
     args = parser.parse_args()
+    profiler.PROFILER.configure(args.profile)
     
     # Validate round number
     start_round = max(1, min(9, args.round))  # Clamp between 1 and 9
     
-    game = NineLives()
-    # Set the starting round
-    game.current_round = start_round
-    game.reset_round()
-    game.run() 
\ No newline at end of file
+    main(start_round, args.seed, args.record)
+    pygame.quit()
+    sys.exit()
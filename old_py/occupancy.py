@@ -0,0 +1,127 @@
+"""Multi-level occupancy summaries of a boolean grid.
+
+An OccupancyPyramid sits over a grid indexed [x, y] and records, for square
+blocks at a few sizes (say 8, 40 and 200 cells), whether any cell in each
+block is set and whether all of them are. Queries start at the coarsest
+level and only look closer where a block is mixed, so a long segment through
+open sky or a region deep underground is answered in a handful of lookups
+instead of one per cell.
+
+The grid is not copied: whoever changes it calls update() with the changed
+rectangle, and only the blocks over that rectangle are recomputed.
+"""
+import numpy as np
+
+BLOCK_SIZES = (8, 40, 200)  # Each size a multiple of the one before
+
+
+class OccupancyPyramid:
+    """Per-block "any set" and "all set" flags over a grid, at several block sizes"""
+
+    def __init__(self, grid, block_sizes=BLOCK_SIZES):
+        self.grid = grid
+        self.width, self.height = grid.shape
+        self.sizes = block_sizes
+        self.any = []  # Per level, [bx, by] -> some cell in the block is set
+        self.all = []  # Per level, [bx, by] -> every cell in the block is set
+        for size in block_sizes:
+            shape = (-(-self.width // size), -(-self.height // size))
+            self.any.append(np.zeros(shape, dtype=bool))
+            self.all.append(np.zeros(shape, dtype=bool))
+        # The any flags again as nested lists, which are much quicker than
+        # arrays to index one block at a time from Python
+        self.any_lists = [[[False] * shape[1] for _ in range(shape[0])] for shape in
+                          (flags.shape for flags in self.any)]
+        self.update(0, 0, self.width, self.height)
+
+    def update(self, x0, y0, x1, y1):
+        """Recompute the blocks over cells x0..x1-1, y0..y1-1 after the grid changed there"""
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(self.width, x1), min(self.height, y1)
+        if x0 >= x1 or y0 >= y1:
+            return
+        for level, size in enumerate(self.sizes):
+            bx0, by0 = x0 // size, y0 // size
+            bx1, by1 = -(-x1 // size), -(-y1 // size)
+            if level == 0:
+                ratio = size
+                src_any = src_all = self.grid[bx0 * size:bx1 * size, by0 * size:by1 * size]
+            else:
+                ratio = size // self.sizes[level - 1]
+                src_any = self.any[level - 1][bx0 * ratio:bx1 * ratio, by0 * ratio:by1 * ratio]
+                src_all = self.all[level - 1][bx0 * ratio:bx1 * ratio, by0 * ratio:by1 * ratio]
+            # Blocks hanging over the grid's edge only count what is inside it
+            w, h = bx1 - bx0, by1 - by0
+            any_set = self._pad(src_any, ratio, False).reshape(w, ratio, h, ratio)
+            all_set = self._pad(src_all, ratio, True).reshape(w, ratio, h, ratio)
+            self.any[level][bx0:bx1, by0:by1] = any_set.any(axis=(1, 3))
+            self.all[level][bx0:bx1, by0:by1] = all_set.all(axis=(1, 3))
+            rows = self.any_lists[level]
+            for bx, flags in enumerate(self.any[level][bx0:bx1, by0:by1].tolist(), bx0):
+                rows[bx][by0:by1] = flags
+
+    @staticmethod
+    def _pad(array, ratio, value):
+        """array grown to whole multiples of ratio in both axes, filled with value"""
+        w, h = array.shape
+        pad_w, pad_h = -w % ratio, -h % ratio
+        if pad_w or pad_h:
+            array = np.pad(array, ((0, pad_w), (0, pad_h)), constant_values=value)
+        return array
+
+    def empty_block(self, x, y):
+        """(x0, y0, x1, y1) of the largest block around cell (x, y) with nothing set, or None"""
+        for level in range(len(self.sizes) - 1, -1, -1):
+            size = self.sizes[level]
+            bx, by = x // size, y // size
+            if not self.any_lists[level][bx][by]:
+                return bx * size, by * size, bx * size + size, by * size + size
+        return None
+
+    def any_set(self, x0, y0, x1, y1):
+        """True if any cell in x0..x1-1, y0..y1-1 is set"""
+        return self._query(x0, y0, x1, y1, True)
+
+    def all_set(self, x0, y0, x1, y1):
+        """True if every cell in x0..x1-1, y0..y1-1 is set"""
+        return not self._query(x0, y0, x1, y1, False)
+
+    def _query(self, x0, y0, x1, y1, value):
+        # Whether some cell in the rectangle equals value. Blocks entirely
+        # inside the rectangle are settled by their flags; the ones on its
+        # border are opened up a level, down to the cells themselves.
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(self.width, x1), min(self.height, y1)
+        if x0 >= x1 or y0 >= y1:
+            return False
+        top = len(self.sizes) - 1
+        size = self.sizes[top]
+        pending = [(top, bx, by) for bx in range(x0 // size, -(-x1 // size))
+                   for by in range(y0 // size, -(-y1 // size))]
+        while pending:
+            level, bx, by = pending.pop()
+            size = self.sizes[level]
+            if value:
+                if not self.any[level][bx, by]:
+                    continue
+                uniform = self.all[level][bx, by]
+            else:
+                if self.all[level][bx, by]:
+                    continue
+                uniform = not self.any[level][bx, by]
+            bx0, by0 = bx * size, by * size
+            inside = (x0 <= bx0 and y0 <= by0 and min(bx0 + size, self.width) <= x1
+                      and min(by0 + size, self.height) <= y1)
+            if uniform or inside:
+                return True
+            # The block is mixed and only partly inside the rectangle
+            if level == 0:
+                cells = self.grid[max(x0, bx0):min(x1, bx0 + size), max(y0, by0):min(y1, by0 + size)]
+                if (cells.any() if value else not cells.all()):
+                    return True
+                continue
+            sub = self.sizes[level - 1]
+            for cx in range(max(bx0, x0) // sub, -(-min(bx0 + size, x1) // sub)):
+                for cy in range(max(by0, y0) // sub, -(-min(by0 + size, y1) // sub)):
+                    pending.append((level - 1, cx, cy))
+        return False
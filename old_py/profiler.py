@@ -0,0 +1,209 @@
+"""Frame-time profiling for the games.
+
+Named timing scopes mark out where a frame goes:
+
+    with PROFILER.scope("update"):
+        game.update(dt)
+
+    @profiled("tank.explosion")
+    def create_explosion(self, x, y, radius): ...
+
+The loop in gameloop.py wraps each frame and its event, update and draw
+phases. While the profiler is off a scope is a shared no-op context manager
+and a profiled function costs one attribute check, so the instrumentation
+can stay in the hot paths. Only the main thread's time is counted: frames
+are the main thread's, and work on other threads (the chess engine
+pondering, say) would otherwise be charged to whichever frame is open.
+
+Press F3 in any game to switch profiling on with an overlay showing frame
+time percentiles and the cost of each scope. Start a game with
+--profile out.csv (or out.json) to profile from the first frame and write
+every frame's timings there on exit.
+"""
+import collections
+import contextlib
+import csv
+import functools
+import json
+import threading
+import time
+
+import pygame
+
+from assets import get_font
+
+HISTORY = 600  # Frames kept for percentiles and the overlay: 10 s at 60 FPS
+PERCENTILES = (50, 95, 99)
+OVERLAY_BG = (0, 0, 0, 180)
+OVERLAY_TEXT = (255, 255, 255)
+BUDGET_MS = 1000 / 60  # Frame budget line on the overlay graph
+
+_NULL_SCOPE = contextlib.nullcontext()
+
+
+class _Scope:
+    """Adds the time spent inside it to one name in the current frame"""
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        totals = self.profiler.current
+        totals[self.name] = totals.get(self.name, 0.0) + elapsed
+        return False
+
+
+class Profiler:
+    """Collects per-frame totals for named scopes over a rolling window"""
+
+    def __init__(self, enabled=False, history=HISTORY):
+        self.enabled = enabled
+        self.overlay = False
+        self.output = None  # Path the full log is written to by finish()
+        self.frames = collections.deque(maxlen=history)  # Frame time per frame
+        self.scopes = {}  # Scope name -> deque of its total per frame
+        self.log = []  # Every frame's (time, scope totals), kept only with an output
+        self.current = {}
+        self.frame_start = 0.0
+        self.in_frame = False  # begin_frame ran with profiling on
+        self._scopes = {}
+
+    def configure(self, output=None):
+        """Profile from now on, writing the log to output (.csv or .json) on finish"""
+        if output:
+            self.output = output
+            self._set_enabled(True)
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        # The overlay needs numbers; a --profile run keeps collecting regardless
+        self._set_enabled(self.overlay or self.output is not None)
+
+    def _set_enabled(self, enabled):
+        # Switching on mid-frame leaves that frame unmeasured (end_frame skips
+        # it) and starts from empty totals
+        if enabled and not self.enabled:
+            self.current = {}
+        self.enabled = enabled
+
+    def scope(self, name):
+        if not self.enabled or threading.get_ident() != threading.main_thread().ident:
+            return _NULL_SCOPE
+        scope = self._scopes.get(name)
+        if scope is None:
+            scope = self._scopes[name] = _Scope(self, name)
+        return scope
+
+    def begin_frame(self):
+        self.in_frame = self.enabled
+        if self.enabled:
+            self.current = {}
+            self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        in_frame, self.in_frame = self.in_frame, False
+        if not self.enabled or not in_frame:
+            return
+        frame_time = time.perf_counter() - self.frame_start
+        self.frames.append(frame_time)
+        for name, total in self.current.items():
+            history = self.scopes.get(name)
+            if history is None:
+                history = self.scopes[name] = collections.deque(maxlen=self.frames.maxlen)
+            history.append(total)
+        if self.output:
+            self.log.append((frame_time, self.current))
+
+    def percentiles(self, samples=None):
+        """{percentile: seconds} over samples, by default the recent frame times"""
+        ordered = sorted(self.frames if samples is None else samples)
+        if not ordered:
+            return {p: 0.0 for p in PERCENTILES}
+        return {p: ordered[min(len(ordered) - 1, len(ordered) * p // 100)] for p in PERCENTILES}
+
+    def summary(self):
+        """Percentiles of the frame time and of each scope's per-frame total, in ms"""
+        def ms(samples):
+            return {f"p{p}": value * 1000 for p, value in self.percentiles(samples).items()}
+        return {"frames": len(self.frames), "frame": ms(self.frames),
+                "scopes": {name: ms(history) for name, history in sorted(self.scopes.items())}}
+
+    def draw_overlay(self, surface):
+        """Draw recent frame times and scope costs in the top-right corner"""
+        if not self.overlay or not self.frames:
+            return
+        font = get_font(None, 20)
+        stats = self.percentiles()
+        lines = ["frame  " + "  ".join(f"p{p} {stats[p] * 1000:5.2f}" for p in PERCENTILES)]
+        for name, history in sorted(self.scopes.items()):
+            lines.append(f"{name:<16} {sum(history) / len(history) * 1000:6.3f} ms")
+
+        graph_height = 40
+        width = 260
+        height = 8 + len(lines) * 18 + graph_height + 8
+        panel = pygame.Surface((width, height), pygame.SRCALPHA)
+        panel.fill(OVERLAY_BG)
+        for i, line in enumerate(lines):
+            panel.blit(font.render(line, True, OVERLAY_TEXT), (8, 8 + i * 18))
+
+        # Recent frame times as bars; the line is the 60 FPS budget
+        top = height - graph_height - 4
+        scale = graph_height / (2 * BUDGET_MS)
+        recent = list(self.frames)[-(width - 16):]
+        for x, frame_time in enumerate(recent):
+            bar = min(graph_height, frame_time * 1000 * scale)
+            color = (0, 200, 0) if frame_time * 1000 <= BUDGET_MS else (230, 60, 60)
+            pygame.draw.line(panel, color, (8 + x, top + graph_height), (8 + x, top + graph_height - bar))
+        budget_y = top + graph_height - BUDGET_MS * scale
+        pygame.draw.line(panel, OVERLAY_TEXT, (8, budget_y), (width - 8, budget_y))
+        surface.blit(panel, (surface.get_width() - width - 10, 10))
+
+    def finish(self):
+        """Write the log if an output was configured"""
+        if not self.output or not self.log:
+            return
+        names = sorted({name for _, totals in self.log for name in totals})
+        if self.output.endswith(".json"):
+            with open(self.output, "w") as f:
+                json.dump({"summary": self.summary(),
+                           "frames": [{"frame_ms": frame_time * 1000,
+                                       **{name: totals.get(name, 0.0) * 1000 for name in names}}
+                                      for frame_time, totals in self.log]}, f, indent=1)
+        else:
+            with open(self.output, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["frame", "frame_ms"] + [f"{name}_ms" for name in names])
+                for i, (frame_time, totals) in enumerate(self.log):
+                    writer.writerow([i, f"{frame_time * 1000:.4f}"]
+                                    + [f"{totals.get(name, 0.0) * 1000:.4f}" for name in names])
+        self.log = []
+
+
+# The one profiler every game and the loop report to
+PROFILER = Profiler()
+
+
+def profiled(name):
+    """Decorator timing every call of a function under name"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+            with PROFILER.scope(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def add_arguments(parser):
+    """Add the --profile option every game accepts"""
+    parser.add_argument('--profile', metavar='PATH',
+                        help='Profile every frame and write the timings to PATH (.csv or .json)')
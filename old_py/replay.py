@@ -0,0 +1,220 @@
+"""Deterministic recording and replay of game sessions.
+
+A recording holds everything that makes a session differ from another one:
+the seed of the global random module, the game's constructor arguments and,
+for every frame, its input events followed by its frame time. Games take no
+other input (no wall clock, no polled key or mouse state), so feeding the
+same stream back reproduces the session exactly. A digest of the final
+state is stored at the end and checked on replay.
+
+File layout (little endian), written append-only as the session runs:
+
+    header  b"KRPL", version u8, seed u64, meta length u16, meta JSON
+    0x01    end of frame, frame time in microseconds u32
+    0x02    key event: down u8, key i32, mod u16
+    0x03    mouse button event: down u8, button u8, x i16, y i16
+    0x04    quit event
+    0x05    end of session, state digest 16 bytes
+
+Replay headless, as fast as possible:
+
+    python replay.py session.krpl
+"""
+import argparse
+import hashlib
+import importlib
+import json
+import random
+import struct
+import sys
+import time
+
+import pygame
+
+MAGIC = b"KRPL"
+VERSION = 1
+
+HEADER = struct.Struct("<4sBQH")
+FRAME = struct.Struct("<BI")
+KEY = struct.Struct("<BBiH")
+MOUSE = struct.Struct("<BBBhh")
+END = struct.Struct("<B16s")
+
+TAG_FRAME = 0x01
+TAG_KEY = 0x02
+TAG_MOUSE = 0x03
+TAG_QUIT = 0x04
+TAG_END = 0x05
+
+FLUSH_FRAMES = 60  # Frames between flushes, so a crash loses at most a second
+
+# Game name -> (module, class); the class is built from the recorded arguments
+GAMES = {
+    "tank": ("tank", "Game"),
+    "chess": ("chess", "Game"),
+    "cake": ("cake", "Game"),
+    "snail": ("snail", "SnailRace"),
+    "nine_lives": ("nine_lives", "NineLives"),
+}
+
+
+class ReplayError(Exception):
+    pass
+
+
+def seed_session(seed=None):
+    """Seed the global random module for a session and return the seed used"""
+    if seed is None:
+        seed = random.getrandbits(63)
+    random.seed(seed)
+    return seed
+
+
+def create_game(game_name, args, seed):
+    """Seed the random module and build a game the way a recorded session did"""
+    module_name, class_name = GAMES[game_name]
+    game_class = getattr(importlib.import_module(module_name), class_name)
+    random.seed(seed)
+    return game_class(**args)
+
+
+def state_digest(game):
+    """16-byte digest of a game's state_key()"""
+    return hashlib.blake2b(repr(game.state_key()).encode(), digest_size=16).digest()
+
+
+def add_arguments(parser):
+    """Add the --record and --seed options every game accepts"""
+    parser.add_argument('--record', metavar='PATH',
+                        help='Record the session to PATH for replay.py')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed for the random number generator')
+
+
+class Recorder:
+    """Appends a session's seed, frame times and input events to a file"""
+
+    def __init__(self, path, game_name, seed, args=None, fps=60):
+        meta = json.dumps({"game": game_name, "args": args or {}, "fps": fps}).encode()
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, seed, len(meta)) + meta)
+        self.frames = 0
+
+    def frame(self, dt, events):
+        """Record one frame; returns dt as a replay of it will see it"""
+        micros = round(dt * 1_000_000)
+        write = self.file.write
+        for event in events:
+            if event.type in (pygame.KEYDOWN, pygame.KEYUP):
+                write(KEY.pack(TAG_KEY, event.type == pygame.KEYDOWN, event.key, event.mod))
+            elif event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
+                x, y = event.pos
+                write(MOUSE.pack(TAG_MOUSE, event.type == pygame.MOUSEBUTTONDOWN,
+                                 event.button, x, y))
+            elif event.type == pygame.QUIT:
+                write(bytes([TAG_QUIT]))
+        write(FRAME.pack(TAG_FRAME, micros))
+        self.frames += 1
+        if self.frames % FLUSH_FRAMES == 0:
+            self.file.flush()
+        return micros / 1_000_000
+
+    def finish(self, game):
+        self.file.write(END.pack(TAG_END, state_digest(game)))
+        self.file.close()
+
+
+class Recording:
+    """A recorded session read back from disk"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = f.read()
+        magic, version, self.seed, meta_len = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ReplayError(f"{path} is not a recording")
+        if version != VERSION:
+            raise ReplayError(f"{path} has unsupported version {version}")
+        meta = json.loads(self.data[HEADER.size:HEADER.size + meta_len])
+        self.game = meta["game"]
+        self.args = meta["args"]
+        self.fps = meta["fps"]
+        self.start = HEADER.size + meta_len
+        self.digest = None  # Known once frames() has reached the end
+
+    def frames(self):
+        """Yield (dt, events) per frame, with events rebuilt as pygame events"""
+        data = self.data
+        offset = self.start
+        events = []
+        while offset < len(data):
+            tag = data[offset]
+            if tag == TAG_FRAME:
+                _, micros = FRAME.unpack_from(data, offset)
+                offset += FRAME.size
+                yield micros / 1_000_000, events
+                events = []
+            elif tag == TAG_KEY:
+                _, down, key, mod = KEY.unpack_from(data, offset)
+                offset += KEY.size
+                events.append(pygame.event.Event(pygame.KEYDOWN if down else pygame.KEYUP,
+                                                  key=key, mod=mod))
+            elif tag == TAG_MOUSE:
+                _, down, button, x, y = MOUSE.unpack_from(data, offset)
+                offset += MOUSE.size
+                events.append(pygame.event.Event(
+                    pygame.MOUSEBUTTONDOWN if down else pygame.MOUSEBUTTONUP,
+                    button=button, pos=(x, y)))
+            elif tag == TAG_QUIT:
+                offset += 1
+                events.append(pygame.event.Event(pygame.QUIT))
+            elif tag == TAG_END:
+                _, self.digest = END.unpack_from(data, offset)
+                offset += END.size
+            else:
+                raise ReplayError(f"Corrupt recording at byte {offset}")
+
+    def create_game(self):
+        """Seed the random module and build the game exactly as the session did"""
+        return create_game(self.game, self.args, self.seed)
+
+
+def replay(path):
+    """Replay a recording headless; return (game, frames, matched digest or None)"""
+    recording = Recording(path)
+    game = recording.create_game()
+    frames = 0
+    for dt, events in recording.frames():
+        for event in events:
+            game.handle_event(event)
+        game.update(dt)
+        frames += 1
+    if recording.digest is None:
+        return game, frames, None  # Session was cut short; nothing to compare
+    return game, frames, state_digest(game) == recording.digest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a recorded game session headless')
+    parser.add_argument('path', help='Recording made with --record')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    game, frames, matched = replay(args.path)
+    elapsed = time.perf_counter() - start
+
+    recording_fps = Recording(args.path).fps
+    print(f"{frames} frames in {elapsed:.3f} s "
+          f"({frames / max(elapsed, 1e-9):.0f} frames/s, "
+          f"{frames / recording_fps / max(elapsed, 1e-9):.1f}x real time at {recording_fps} fps)")
+    if matched is None:
+        print("No final state recorded (session did not end cleanly)")
+    elif matched:
+        print("Final state matches the recording")
+    else:
+        print("Final state DIFFERS from the recording")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""Headless server hosting many game sessions in one process.
+
+    python server.py serve [--socket PATH] [--record-dir DIR]
+    python server.py load --sessions 200 --seconds 10     # scripted clients
+    python server.py bench --sessions 200 --seconds 10    # sessions per core
+
+Thin clients connect over a Unix socket, one connection per session, and
+talk newline-delimited JSON. A client opens with
+
+    {"type": "start", "game": "snail", "args": {}, "seed": 42}
+
+and then sends its input as it happens:
+
+    {"type": "key", "down": true, "key": 32, "mod": 0}
+    {"type": "mouse", "down": true, "button": 1, "pos": [120, 340]}
+    {"type": "quit"}
+
+The server answers {"session": id, "game": ..., "seed": ...} and from then
+on streams {"tick": n, "changes": {"i": part, ...}} whenever part i of the
+game's state_key() changed, and {"end": true} when the game stops. The
+first message after start carries every part.
+
+One scheduler task advances all sessions at FPS through the same protocol
+gameloop.py uses (handle_event, update, is_animating), so a session costs
+nothing on ticks where it has no input and nothing moves. A single process
+uses one core; run one server per core on separate sockets to use more.
+
+With --record-dir every session is recorded for replay.py. The games draw
+from the global random module, so recording also gives each session its
+own generator state, swapped in around its updates (about 25 us each).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import signal
+import sys
+import time
+
+import pygame
+
+import replay
+
+FPS = 60
+SOCKET_PATH = "/tmp/kids-games.sock"
+SEND_BUFFER_LIMIT = 1 << 20  # Bytes queued for a client before its deltas are held back
+
+
+def encode(value):
+    """JSON for a piece of game state; pygame Rects and the like become lists"""
+    return json.dumps(value, separators=(",", ":"), default=list)
+
+
+class Session:
+    """One game being played by one client"""
+
+    def __init__(self, session_id, game_name, args, seed, writer, record_dir=None):
+        self.id = session_id
+        self.game_name = game_name
+        self.writer = writer
+        self.events = []  # Input received since the last tick
+        self.parts = None  # Encoded state_key() parts last sent to the client
+        self.rng_state = None
+        self.recorder = None
+        if record_dir:
+            path = os.path.join(record_dir, f"{session_id:06d}-{game_name}.krpl")
+            self.recorder = replay.Recorder(path, game_name, seed, args, FPS)
+
+        self.game = replay.create_game(game_name, args, seed)
+        if self.recorder:
+            self.rng_state = random.getstate()
+
+    def step(self, dt):
+        """Advance by dt seconds if there is anything to do.
+
+        Returns None when the session was idle, else whether the game still runs.
+        """
+        if not self.events and not self.game.is_animating():
+            return None
+        events, self.events = self.events, []
+        if self.rng_state:
+            random.setstate(self.rng_state)
+        if self.recorder:
+            dt = self.recorder.frame(dt, events)
+        for event in events:
+            self.game.handle_event(event)
+        self.game.update(dt)
+        if self.rng_state:
+            self.rng_state = random.getstate()
+        return self.game.running
+
+    def delta(self, tick):
+        """Message with the state parts that changed since the last one sent, or None"""
+        parts = [encode(part) for part in self.game.state_key()]
+        if self.parts is None:
+            changed = range(len(parts))
+        else:
+            changed = [i for i, part in enumerate(parts) if part != self.parts[i]]
+        if not changed:
+            return None
+        self.parts = parts
+        body = ",".join(f'"{i}":{parts[i]}' for i in changed)
+        return f'{{"tick":{tick},"changes":{{{body}}}}}\n'.encode()
+
+    def close(self):
+        if self.recorder:
+            self.recorder.finish(self.game)
+            self.recorder = None
+
+
+def input_event(message):
+    """pygame event for a client input message"""
+    kind = message["type"]
+    if kind == "key":
+        return pygame.event.Event(pygame.KEYDOWN if message["down"] else pygame.KEYUP,
+                                  key=message["key"], mod=message.get("mod", 0))
+    if kind == "mouse":
+        return pygame.event.Event(pygame.MOUSEBUTTONDOWN if message["down"] else pygame.MOUSEBUTTONUP,
+                                  button=message["button"], pos=tuple(message["pos"]))
+    if kind == "quit":
+        return pygame.event.Event(pygame.QUIT)
+    raise ValueError(f"Unknown input type {kind!r}")
+
+
+class Server:
+    """Accepts clients and advances every session on one shared clock"""
+
+    def __init__(self, fps=FPS, record_dir=None):
+        self.fps = fps
+        self.record_dir = record_dir
+        self.sessions = {}
+        self.ids = itertools.count(1)
+        self.tick = 0
+        self.busy = 0.0  # Seconds spent advancing sessions, for stats
+        self.late_ticks = 0  # Ticks that started after the next one was due
+
+    async def handle_client(self, reader, writer):
+        session = None
+        try:
+            line = await reader.readline()
+            if not line:
+                return
+            start = json.loads(line)
+            if start.get("type") != "start" or start.get("game") not in replay.GAMES:
+                writer.write(b'{"error":"expected {\\"type\\": \\"start\\", \\"game\\": ...}"}\n')
+                return
+            seed = start.get("seed")
+            if seed is None:
+                seed = random.getrandbits(63)
+            session = Session(next(self.ids), start["game"], start.get("args", {}), seed,
+                              writer, self.record_dir)
+            self.sessions[session.id] = session
+            writer.write(encode({"session": session.id, "game": session.game_name,
+                                 "seed": seed}).encode() + b"\n")
+            async for line in reader:
+                session.events.append(input_event(json.loads(line)))
+        except (ValueError, KeyError, TypeError) as error:
+            writer.write(encode({"error": str(error)}).encode() + b"\n")
+        except ConnectionError:
+            pass
+        finally:
+            if session and self.sessions.pop(session.id, None):
+                session.close()
+            writer.close()
+
+    def advance(self, dt):
+        """One scheduler tick: step every session and send what changed"""
+        self.tick += 1
+        ended = []
+        for session in self.sessions.values():
+            running = session.step(dt)
+            if running is None and session.parts is not None:
+                continue  # Idle, and the client is up to date
+            transport = session.writer.transport
+            if transport.is_closing():
+                ended.append(session)
+                continue
+            if transport.get_write_buffer_size() > SEND_BUFFER_LIMIT:
+                # A stalled client gets the full state once it catches up
+                session.parts = None
+            else:
+                message = session.delta(self.tick)
+                if message:
+                    session.writer.write(message)
+            if running is False:
+                session.writer.write(b'{"end":true}\n')
+                ended.append(session)
+        for session in ended:
+            del self.sessions[session.id]
+            session.close()
+            session.writer.close()
+
+    async def scheduler(self):
+        period = 1 / self.fps
+        last = time.perf_counter()
+        deadline = last
+        while True:
+            deadline += period
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                self.late_ticks += 1
+                deadline = time.perf_counter()  # Don't try to catch up on missed ticks
+                await asyncio.sleep(0)
+            now = time.perf_counter()
+            dt, last = now - last, now
+            self.advance(dt)
+            self.busy += time.perf_counter() - now
+
+    async def serve(self, path):
+        """Serve on path until SIGINT or SIGTERM, then close every session"""
+        if os.path.exists(path):
+            os.unlink(path)
+        server = await asyncio.start_unix_server(self.handle_client, path)
+        scheduler = asyncio.create_task(self.scheduler())
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        try:
+            await stop.wait()
+        finally:
+            scheduler.cancel()
+            server.close()
+            for session in self.sessions.values():
+                session.close()
+                session.writer.close()
+            self.sessions.clear()
+            os.unlink(path)
+
+
+# Scripted input for load testing: keys and clicks each game reacts to
+LOAD_KEYS = [pygame.K_SPACE, pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN,
+             pygame.K_a, pygame.K_w, pygame.K_BACKSPACE, pygame.K_r]
+
+
+async def connect(path, game, seed):
+    """Open a session and wait until the server has accepted it"""
+    reader, writer = await asyncio.open_unix_connection(path)
+    writer.write(encode({"type": "start", "game": game, "seed": seed}).encode() + b"\n")
+    await reader.readline()
+    return reader, writer
+
+
+async def play(reader, writer, seed, until, rate, stats):
+    """One scripted client: random key taps and clicks at about rate per second"""
+    rng = random.Random(seed)
+
+    async def receive():
+        async for line in reader:
+            stats["messages"] += 1
+            stats["bytes"] += len(line)
+
+    receiver = asyncio.create_task(receive())
+    try:
+        while time.perf_counter() < until:
+            await asyncio.sleep(rng.expovariate(rate))
+            if rng.random() < 0.5:
+                key = rng.choice(LOAD_KEYS)
+                for down in (True, False):
+                    writer.write(encode({"type": "key", "down": down, "key": key}).encode() + b"\n")
+            else:
+                pos = [rng.randrange(800), rng.randrange(600)]
+                writer.write(encode({"type": "mouse", "down": True, "button": 1, "pos": pos}).encode() + b"\n")
+            stats["inputs"] += 1
+        writer.write(b'{"type":"quit"}\n')
+        await writer.drain()
+    finally:
+        receiver.cancel()
+        writer.close()
+
+
+async def run_load(args):
+    # Every session is open before the clock starts, so all play for the full time
+    games = args.games or list(replay.GAMES)
+    connections = [await connect(args.socket, games[i % len(games)], i) for i in range(args.sessions)]
+    until = time.perf_counter() + args.seconds
+    stats = {"inputs": 0, "messages": 0, "bytes": 0}
+    await asyncio.gather(*(play(reader, writer, i, until, args.rate, stats)
+                           for i, (reader, writer) in enumerate(connections)))
+    return stats
+
+
+def cmd_serve(args):
+    if args.record_dir:
+        os.makedirs(args.record_dir, exist_ok=True)
+    server = Server(args.fps, args.record_dir)
+    print(f"Serving {', '.join(replay.GAMES)} on {args.socket}")
+    asyncio.run(server.serve(args.socket))
+    return 0
+
+
+def cmd_load(args):
+    stats = asyncio.run(run_load(args))
+    print(f"{args.sessions} sessions: {stats['inputs']} inputs sent, "
+          f"{stats['messages']} messages ({stats['bytes'] / 1024:.0f} KiB) received")
+    return 0
+
+
+def cmd_bench(args):
+    """Serve in this process, drive it from a load process, and measure our CPU"""
+    server = Server(args.fps)
+    load = [sys.executable, os.path.abspath(__file__), "--socket", args.socket, "load",
+            "--sessions", str(args.sessions), "--seconds", str(args.seconds), "--rate", str(args.rate)]
+    for game in args.games:
+        load += ["--game", game]
+
+    async def bench():
+        serving = asyncio.create_task(server.serve(args.socket))
+        while not os.path.exists(args.socket):
+            await asyncio.sleep(0.01)
+        client = await asyncio.create_subprocess_exec(*load)
+        # Measure only once every session has connected
+        while len(server.sessions) < args.sessions and client.returncode is None:
+            await asyncio.sleep(0.05)
+        cpu, wall, ticks = time.process_time(), time.perf_counter(), server.tick
+        busy, late = server.busy, server.late_ticks
+        await client.wait()
+        cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+        serving.cancel()
+        return cpu, wall, server.tick - ticks, server.busy - busy, server.late_ticks - late
+
+    cpu, wall, ticks, busy, late = asyncio.run(bench())
+    load_fraction = cpu / wall
+    print(f"{args.sessions} sessions for {wall:.1f} s: {ticks} ticks ({ticks / wall:.1f}/s), "
+          f"{late} late")
+    print(f"server CPU {load_fraction:.1%} of a core, "
+          f"{busy / max(ticks, 1) * 1000:.2f} ms per tick advancing sessions")
+    if ticks < 0.9 * args.fps * wall:
+        print(f"saturated: {args.sessions} sessions are more than one core can tick at {args.fps} FPS")
+        return 1
+    print(f"~{args.sessions / max(load_fraction, 1e-9):.0f} sessions per core")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless multi-session game server')
+    parser.add_argument('--socket', default=SOCKET_PATH, help='Unix socket path')
+    parser.add_argument('--fps', type=int, default=FPS, help='Scheduler ticks per second')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help='Host sessions until interrupted')
+    serve.add_argument('--record-dir', metavar='DIR', help='Record every session into DIR')
+    serve.set_defaults(func=cmd_serve)
+
+    for name, func, help_text in (('load', cmd_load, 'Connect scripted clients to a server'),
+                                  ('bench', cmd_bench, 'Serve scripted clients and report sessions per core')):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('--sessions', type=int, default=100, help='Concurrent sessions')
+        command.add_argument('--seconds', type=float, default=10, help='How long the clients play')
+        command.add_argument('--rate', type=float, default=2, help='Inputs per second per client')
+        command.add_argument('--game', dest='games', action='append', default=[],
+                             choices=list(replay.GAMES), help='Game to play (repeatable; default all)')
+        command.set_defaults(func=func)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
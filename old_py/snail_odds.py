@@ -0,0 +1,126 @@
+"""Win probabilities for the snail race in snail.py.
+
+The race is a pure Markov chain: every spin picks one of the six snails
+uniformly and moves it one square, and the first snail to reach FINISH wins.
+The exact odds come from dynamic programming over the positions; a vectorized
+Monte Carlo simulator is included to cross-check them.
+
+    python snail_odds.py --races 2000000 --positions 3,1,0,4,2,0
+"""
+import argparse
+import time
+from functools import lru_cache
+
+import numpy as np
+
+LANES = 6
+FINISH = 9
+
+
+@lru_cache(maxsize=None)
+def _solve(positions):
+    """Win probability of each entry and expected remaining spins, for sorted positions"""
+    # Snails are interchangeable, so states are memoized on the sorted
+    # positions: only C(14, 6) = 3003 distinct states exist from the start.
+    wins = [0.0] * LANES
+    expected = 1.0
+    for i in range(LANES):
+        if positions[i] + 1 >= FINISH:
+            wins[i] += 1 / LANES
+            continue
+        moved = list(positions)
+        moved[i] += 1
+        order = sorted(range(LANES), key=moved.__getitem__)
+        sub_wins, sub_expected = _solve(tuple(moved[j] for j in order))
+        for k, j in enumerate(order):
+            wins[j] += sub_wins[k] / LANES
+        expected += sub_expected / LANES
+    return tuple(wins), expected
+
+
+def exact_odds(positions):
+    """Return (win probability per lane, expected spins left) for a race in progress"""
+    positions = list(positions)
+    finished = [i for i, p in enumerate(positions) if p >= FINISH]
+    if finished:
+        return [1.0 if i == finished[0] else 0.0 for i in range(LANES)], 0.0
+    order = sorted(range(LANES), key=positions.__getitem__)
+    sorted_wins, expected = _solve(tuple(positions[i] for i in order))
+    wins = [0.0] * LANES
+    for k, i in enumerate(order):
+        wins[i] = sorted_wins[k]
+    return wins, expected
+
+
+def win_probabilities(positions):
+    """Exact win probability of each lane"""
+    return exact_odds(positions)[0]
+
+
+def simulate(positions, races, rng=None, chunk=200_000):
+    """Monte Carlo estimate: (win probability per lane, mean race length in spins)"""
+    rng = np.random.default_rng() if rng is None else rng
+    need = FINISH - np.asarray(positions, dtype=np.int64)
+    if (need <= 0).any():
+        return exact_odds(positions)
+    # After this many spins some snail must have finished (pigeonhole)
+    max_spins = int((need - 1).sum()) + 1
+
+    # Each race's six move counters are packed into one uint32, five bits per
+    # lane, so a single cumsum advances every lane. Each field starts at
+    # 16 - need, so its top bit first sets on the spin that finishes that
+    # lane; until the race is over no field can carry into its neighbour.
+    steps = np.array([1 << (5 * lane) for lane in range(LANES)], dtype=np.uint32)
+    start = np.uint32(sum(int(16 - need[lane]) << (5 * lane) for lane in range(LANES)))
+    finished_bits = np.uint32(sum(1 << (5 * lane + 4) for lane in range(LANES)))
+
+    wins = np.zeros(LANES, dtype=np.int64)
+    total_spins = 0
+    done = 0
+    while done < races:
+        n = min(chunk, races - done)
+        rolls = rng.integers(0, LANES, size=(n, max_spins), dtype=np.uint8)
+        packed = steps[rolls]
+        packed[:, 0] += start
+        np.cumsum(packed, axis=1, out=packed)
+        packed &= finished_bits
+        length = np.argmax(packed != 0, axis=1)
+        # The lane rolled on the finishing spin is the winner
+        winners = rolls[np.arange(n), length]
+        wins += np.bincount(winners, minlength=LANES)
+        total_spins += int(length.sum()) + n
+        done += n
+    return list(wins / races), total_spins / races
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Snail race win probabilities')
+    parser.add_argument('--positions', default=','.join(['0'] * LANES),
+                        help='Comma-separated positions of the six snails')
+    parser.add_argument('--races', type=int, default=1_000_000,
+                        help='Monte Carlo races to simulate')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    positions = [int(p) for p in args.positions.split(',')]
+    if len(positions) != LANES:
+        parser.error(f"expected {LANES} positions")
+
+    start = time.perf_counter()
+    wins, expected = exact_odds(positions)
+    exact_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mc_wins, mc_length = simulate(positions, args.races, np.random.default_rng(args.seed))
+    mc_time = time.perf_counter() - start
+
+    print(f"{'lane':>4} {'exact':>8} {'monte carlo':>12}")
+    for i in range(LANES):
+        print(f"{i:>4} {wins[i]:>8.4f} {mc_wins[i]:>12.4f}")
+    print(f"expected spins: exact {expected:.3f}, monte carlo {mc_length:.3f}")
+    print(f"exact solve {exact_time * 1000:.1f} ms, "
+          f"{args.races / mc_time / 1e6:.2f} M races/s simulated")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Compact binary snapshots of a game's state.
+
+    data = snapshot.dumps(game)        # bytes
+    game = snapshot.loads(data)        # a new game, ready to play headless
+    snapshot.loads(data, into=game)    # or restore an existing one in place
+
+A snapshot is a small header followed by the game's own body:
+
+    b"KSNP", format version u8, game id u8, body
+
+Each game writes its body with snapshot() and reads it back with
+restore(body), using fixed little-endian struct and NumPy record layouts
+declared next to the game. Bodies are read straight out of the buffer
+(memoryview and np.frombuffer) without copying it first. Restoring sets
+every piece of state the game plays with, so restore() also works on an
+instance that was never constructed. Anything derived from that state (tank
+surface heights, cake's obstacle index and bot navigation grid) is rebuilt
+rather than stored; cake keeps its own when restoring the layout it already
+has.
+
+Bump VERSION whenever any game's body layout changes; older snapshots are
+then rejected instead of being misread.
+"""
+import importlib
+import struct
+
+import replay
+
+MAGIC = b"KSNP"
+VERSION = 6
+
+HEADER = struct.Struct("<4sBB")
+
+# Game id in the header -> name in replay.GAMES; ids are never reused
+GAME_IDS = {1: "tank", 2: "chess", 3: "cake", 4: "snail", 5: "nine_lives"}
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _game_class(name):
+    module_name, class_name = replay.GAMES[name]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def _game_id(game):
+    for game_id, name in GAME_IDS.items():
+        module_name, class_name = replay.GAMES[name]
+        cls = type(game)
+        if cls.__name__ == class_name and cls.__module__ in (module_name, "__main__"):
+            return game_id
+    raise SnapshotError(f"No snapshot format for {type(game).__name__}")
+
+
+def dumps(game):
+    """Snapshot of game as bytes"""
+    return HEADER.pack(MAGIC, VERSION, _game_id(game)) + game.snapshot()
+
+
+def loads(data, into=None):
+    """Game restored from a snapshot, either into an existing game or a new one"""
+    view = memoryview(data)
+    if len(view) < HEADER.size:
+        raise SnapshotError("Snapshot is truncated")
+    magic, version, game_id = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise SnapshotError("Not a game snapshot")
+    if version != VERSION:
+        raise SnapshotError(f"Snapshot format version {version} is not supported (expected {VERSION})")
+    if game_id not in GAME_IDS:
+        raise SnapshotError(f"Unknown game id {game_id}")
+    cls = _game_class(GAME_IDS[game_id])
+    if into is None:
+        into = cls.__new__(cls)
+    elif _game_id(into) != game_id:
+        raise SnapshotError(f"Snapshot of {GAME_IDS[game_id]} cannot be restored into {type(into).__name__}")
+    into.restore(view[HEADER.size:])
+    return into
@@ -2,44 +2,131 @@ import pygame
 import sys
 import math
 import random
+import hashlib
+import os
+import struct
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from typing import List, Tuple
-
-# Initialize pygame
-pygame.init()
+import gameloop
+import replay
+from assets import get_font
+import profiler
+from profiler import profiled
+from timestep import FixedTimestep, lerp
+from occupancy import OccupancyPyramid
 
 # Constants
 SCREEN_WIDTH = 1600  # Doubled from 800
 SCREEN_HEIGHT = 1200  # Doubled from 600
-FPS = 60
+FPS = 60  # Render rate cap
+SIMULATION_RATE = 60  # Physics steps per second; GRAVITY and speeds are per step
+FAST_FORWARD = 4  # Simulation speed while F is held during a shot
 GRAVITY = 0.5  # Keeping same physics feel
 GROUND_COLOR = (100, 80, 30)
 SKY_COLOR = (135, 206, 235)
 TANK_COLORS = [(255, 0, 0), (0, 0, 255), (0, 255, 0), (255, 255, 0)]
 PROJECTILE_SPEED = 20  # Doubled from 10
 EXPLOSION_RADIUS = 60  # Doubled from 30
+START_SHIELDS = 5  # Hits a tank takes before it is destroyed
 TERRAIN_RESOLUTION = 1600  # Doubled from 800
+CHUNK_WIDTH = 400  # Terrain columns generated, kept and evicted together
+KEEP_CHUNKS = 1  # Chunks either side of a tank, the shell or the view kept in memory
+CAVES_PER_SCREEN = 5  # Caves per SCREEN_WIDTH of battlefield
+CAMERA_SPEED = 40  # Pixels per step the view scrolls towards what it follows
+FALL_SPEED = 6  # Cells loose ground drops per step after an explosion
+BLAST_STEPS = 15  # Steps an explosion's flash stays on screen
+SHELL_RADIUS = 6  # Doubled from 3
+SHELL, MIRV = 0, 1  # Shell kinds
+WEAPON_NAMES = {SHELL: "Shell", MIRV: "MIRV"}
+MIRV_WARHEADS = 5  # Shells a MIRV splits into at the top of its arc
+MIRV_SPREAD = 3  # Horizontal speed between neighbouring warheads
+
+# Snapshot layout (see snapshot.py): players, current player, flags, winner
+# (0 for none), terrain width, height and seed, timestep accumulator and
+# speed, number of modified terrain chunks, of shells in flight and of
+# collapsing spans; then a TANK per player, a SHELL_RECORD per shell, each
+# collapsing span as its first and last + 1 columns u32 and each modified
+# chunk as its index u16 and cells packed 8 to a byte. The rest of the
+# terrain comes from the seed. Columns are 32-bit, as --width is unbounded
+SNAPSHOT = struct.Struct("<BBBBIHQddHHH")
+SPAN = struct.Struct("<II")
+TANK = struct.Struct("<ihhb")  # x, y, barrel angle, shields
+SHELL_RECORD = np.dtype([("x", "<f8"), ("y", "<f8"), ("vx", "<f8"), ("vy", "<f8"),
+                         ("prev_x", "<f8"), ("prev_y", "<f8"), ("color", "u1", 3), ("kind", "u1")])
+FLAG_WAITING, FLAG_GAME_OVER, FLAG_LEFT, FLAG_RIGHT, FLAG_MIRV = 1, 2, 4, 8, 16
+
+_worker = None
+
+
+def terrain_worker() -> ThreadPoolExecutor:
+    """The thread every Terrain hands its mutations to, started on first use"""
+    global _worker
+    if _worker is None:
+        _worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="terrain")
+    return _worker
+
 
 class Terrain:
-    def __init__(self, width: int, height: int):
+    """The ground as a grid indexed [x, y] (True = ground), in chunks.
+
+    The surface line and the caves are laid out for the whole width up front
+    from the terrain's seed, which is cheap: it is one number per column. The
+    cells themselves live in CHUNK_WIDTH-wide chunks that are only rasterized
+    from that layout when something first looks at them. retain() drops the
+    chunks far from anything in play; untouched ones are simply generated
+    again when needed, ones an explosion changed are written to a temporary
+    directory and read back. So a 20,000 px battlefield costs memory and
+    time only where the tanks, the shell and the camera are.
+
+    Each chunk in memory also has an OccupancyPyramid, kept up to date by
+    changed(), which lets first_solid(), any_solid() and all_solid() skip
+    whole blocks of sky or ground.
+    
+    In play, craters and falling ground are worked out on a worker thread:
+    begin() hands them over at the end of a step, the NumPy work runs while
+    the frame is drawn from the chunks as they were, and finish() swaps the
+    changed chunk buffers in at the start of the next step. The simulation
+    does not depend on how long the worker takes.
+    """
+    def __init__(self, width: int, height: int, seed: int = None):
         self.width = width
         self.height = height
-        self.grid = self.generate_terrain()
-        # Store surface heights for quick access
-        self.surface_heights = self.calculate_surface_heights()
+        # Drawn from the global random module, so a seeded session still
+        # reproduces its battlefield
+        self.seed = random.getrandbits(63) if seed is None else seed
+        rng = random.Random(self.seed)
+        self.heights = self.generate_heights(rng)
+        self.caves = self.plan_caves(rng)
+        # Highest row each column can ever have ground in: craters only take
+        # ground away and collapses only move it down
+        self.ceiling = self.height - self.heights
+        self.n_chunks = -(-width // CHUNK_WIDTH)
+        self.chunks = {}  # Resident chunk index -> its cells
+        self.modified = set()  # Chunks that differ from what the seed generates
+        self.spilled = {}  # Evicted modified chunk index -> file holding it
+        self.spill_dir = None
+        self.surfaces = {}  # Chunk index -> rendered surface, until it changes
+        self.digests = {}  # Modified chunk index -> digest of its cells
+        self.pyramids = {}  # Chunk index -> occupancy pyramid over its cells
+        self.collapsing = []  # [x0, x1] column spans where ground may still be falling
+        self.queued = []  # (x, y, radius) craters for the next begin()
+        self.pending = None  # Future of the worker's mutation, until finish()
+        self.spare = {}  # Chunk index -> back buffer the worker fills next
+        # Store surface heights for quick access; each chunk's columns are
+        # measured the first time it is rasterized (tunnels lower the surface)
+        self.surface_heights = self.heights.tolist()
+        self.surveyed = set()
     
-    def generate_terrain(self) -> np.ndarray:
-        """Generate terrain using biased Brownian motion"""
-        # Create empty 2D grid (False = air, True = ground)
-        grid = np.zeros((self.width, self.height), dtype=bool)
-        
-        # Generate surface heights using the same algorithm as before
+    def generate_heights(self, rng: random.Random) -> np.ndarray:
+        """Generate the surface line using biased Brownian motion"""
         heights = [int(self.height * 2/3)] * self.width
         current_height = heights[0]
         bias = 0
         
         for i in range(1, self.width):
-            step = random.randint(-41, 40) + bias
+            step = rng.randint(-41, 40) + bias
             current_height += step
             current_height = max(self.height // 4, min(current_height, self.height - 50))
             
@@ -53,154 +140,435 @@ class Terrain:
             heights[i] = current_height
             
         # Smooth the surface
-        heights = self.smooth_terrain(heights, passes=10)
-        
-        # Fill the grid based on the surface heights
-        for x in range(self.width):
-            # Everything below the surface is ground
-            for y in range(self.height - heights[x], self.height):
-                grid[x, y] = True
-        
-        # Optionally, create some tunnels/caves
-        self.create_caves(grid)
-        
-        return grid
+        return self.smooth_terrain(heights, passes=10)
+    
+    def smooth_terrain(self, heights: List[int], passes: int = 3) -> np.ndarray:
+        """Apply smoothing to the terrain"""
+        smoothed = np.array(heights)
+        for _ in range(passes):
+            # The right-hand side is built before the assignment, so every
+            # column averages its neighbours from the previous pass
+            smoothed[1:-1] = (smoothed[:-2] + smoothed[1:-1] + smoothed[2:]) // 3
+        return smoothed
     
-    def create_caves(self, grid: np.ndarray, num_caves: int = 5):
-        """Create random caves and tunnels in the terrain"""
-        for _ in range(num_caves):
+    def plan_caves(self, rng: random.Random) -> List[Tuple[int, int, int, int, bool]]:
+        """Place random caves, some with a tunnel to the surface, as (x, y, width, height, tunnel)"""
+        caves = []
+        for _ in range(max(1, round(CAVES_PER_SCREEN * self.width / SCREEN_WIDTH))):
             # Random starting point below the surface
-            x = random.randint(100, self.width - 100)  # Doubled from 50
-            max_y = np.argmax(grid[x, :])  # Find first solid point
-            y = random.randint(max_y + 40, self.height - 60)  # Doubled from 20, 30
+            x = rng.randint(100, self.width - 100)  # Doubled from 50
+            top = self.height - int(self.heights[x])
+            y = rng.randint(top + 40, self.height - 60)  # Doubled from 20, 30
             
             # Random size
-            cave_width = random.randint(20, 60)  # Doubled from 10, 30
-            cave_height = random.randint(10, 30)  # Doubled from 5, 15
-            
+            cave_width = rng.randint(20, 60)  # Doubled from 10, 30
+            cave_height = rng.randint(10, 30)  # Doubled from 5, 15
+            caves.append((x, y, cave_width, cave_height, rng.random() < 0.5))
+        return caves
+    
+    def generate_chunk(self, index: int) -> np.ndarray:
+        """Rasterize chunk index from the surface line and the caves"""
+        x0 = index * CHUNK_WIDTH
+        x1 = min(self.width, x0 + CHUNK_WIDTH)
+        # Everything below the surface is ground
+        grid = np.arange(self.height)[None, :] >= self.height - self.heights[x0:x1, None]
+        self.create_caves(grid, x0)
+        return grid
+    
+    def create_caves(self, grid: np.ndarray, x0: int):
+        """Carve the caves and tunnels crossing the columns of grid, which starts at column x0"""
+        x1 = x0 + grid.shape[0]
+        for x, y, cave_width, cave_height, tunnel in self.caves:
             # Carve out the cave (elliptical shape)
-            for dx in range(-cave_width, cave_width + 1):
-                for dy in range(-cave_height, cave_height + 1):
-                    nx, ny = x + dx, y + dy
-                    if (0 <= nx < self.width and 0 <= ny < self.height):
-                        # Elliptical shape check
-                        if (dx/cave_width)**2 + (dy/cave_height)**2 <= 1:
-                            grid[nx, ny] = False
+            left, right = max(x0, x - cave_width), min(x1, x + cave_width + 1)
+            if left < right:
+                top, bottom = max(0, y - cave_height), min(self.height, y + cave_height + 1)
+                dx = np.arange(left, right)[:, None] - x
+                dy = np.arange(top, bottom)[None, :] - y
+                inside = (dx / cave_width) ** 2 + (dy / cave_height) ** 2 <= 1
+                grid[left - x0:right - x0, top:bottom] &= ~inside
             
-            # Possibly add a tunnel to the surface
-            if random.random() < 0.5:  # 50% chance
-                tunnel_x = x
-                # Start at cave top
-                tunnel_y = y - cave_height
-                # Find surface
-                while tunnel_y > 0 and not grid[tunnel_x, tunnel_y]:
-                    tunnel_y -= 1
-                # Carve tunnel
-                for ty in range(tunnel_y, y - cave_height + 1):
-                    for tx in range(tunnel_x - 4, tunnel_x + 5):  # Doubled width from 2 to 4
-                        if 0 <= tx < self.width and 0 <= ty < self.height:
-                            grid[tx, ty] = False
-    
-    def smooth_terrain(self, heights: List[int], passes: int = 3) -> List[int]:
-        """Apply smoothing to the terrain"""
-        smoothed = heights.copy()
-        
-        for _ in range(passes):
-            new_heights = smoothed.copy()
-            for i in range(1, len(smoothed) - 1):
-                new_heights[i] = (smoothed[i-1] + smoothed[i] + smoothed[i+1]) // 3
-            smoothed = new_heights
-            
-        return smoothed
+            # Tunnel from the surface down into the top of the cave
+            left, right = max(x0, x - 4), min(x1, x + 5)  # Doubled width from 2 to 4
+            if tunnel and left < right:
+                grid[left - x0:right - x0, self.height - int(self.heights[x]):y - cave_height + 1] = False
     
-    def calculate_surface_heights(self) -> List[int]:
-        """Calculate heights of the surface for each x coordinate"""
-        heights = []
-        for x in range(self.width):
-            # Find the first solid ground cell from top to bottom
-            for y in range(self.height):
-                if self.grid[x, y]:
-                    heights.append(self.height - y)
-                    break
+    def chunk(self, index: int) -> np.ndarray:
+        """The cells of chunk index, generating or reading it back if it is not in memory"""
+        grid = self.chunks.get(index)
+        if grid is None:
+            path = self.spilled.get(index)
+            if path:
+                width = min(CHUNK_WIDTH, self.width - index * CHUNK_WIDTH)
+                with open(path, "rb") as f:
+                    cells = np.unpackbits(np.frombuffer(f.read(), np.uint8), count=width * self.height)
+                grid = cells.view(bool).reshape(width, self.height)
             else:
-                # No solid ground in this column
-                heights.append(0)
-        return heights
+                grid = self.generate_chunk(index)
+            self.chunks[index] = grid
+            if index not in self.surveyed:
+                self.surveyed.add(index)
+                self.calculate_surface_heights(index * CHUNK_WIDTH, index * CHUNK_WIDTH + grid.shape[0])
+        return grid
     
-    def draw(self, screen):
-        """Draw the terrain grid"""
-        # Create a surface with the exact size of the grid
-        terrain_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-        
+    def chunks_between(self, x0: int, x1: int):
+        """Yield (first column, cells) of each chunk overlapping columns x0 to x1 - 1"""
+        for index in range(max(0, x0) // CHUNK_WIDTH, (min(x1, self.width) - 1) // CHUNK_WIDTH + 1):
+            yield index * CHUNK_WIDTH, self.chunk(index)
+    
+    def pyramid(self, index: int) -> OccupancyPyramid:
+        """Occupancy pyramid over chunk index"""
+        grid = self.chunk(index)
+        pyramid = self.pyramids.get(index)
+        if pyramid is None or pyramid.grid is not grid:
+            pyramid = self.pyramids[index] = OccupancyPyramid(grid)
+        return pyramid
+    
+    def changed(self, x0: int, x1: int, y0: int = 0, y1: int = None):
+        """Record that the cells in columns x0 to x1 - 1, rows y0 to y1 - 1 were changed"""
+        y1 = self.height if y1 is None else y1
+        for index in range(max(0, x0) // CHUNK_WIDTH, (min(x1, self.width) - 1) // CHUNK_WIDTH + 1):
+            self.modified.add(index)  # No longer what the seed generates
+            self.spilled.pop(index, None)  # The file on disk is out of date
+            self.digests.pop(index, None)
+            start = index * CHUNK_WIDTH
+            surface = self.surfaces.get(index)
+            if surface is not None:
+                self.paint(surface, self.chunk(index), x0 - start, x1 - start, y0, y1)
+            pyramid = self.pyramids.get(index)
+            if pyramid is not None:
+                pyramid.update(x0 - start, y0, x1 - start, y1)
+    
+    def retain(self, xs):
+        """Evict every chunk further than KEEP_CHUNKS chunks from all the columns
+        in xs, keeping the ones where ground is still falling"""
+        keep = set()
+        for x0, x1 in self.collapsing:
+            keep.update(range(x0 // CHUNK_WIDTH, (x1 - 1) // CHUNK_WIDTH + 1))
+        for x in xs:
+            index = int(x) // CHUNK_WIDTH
+            keep.update(range(index - KEEP_CHUNKS, index + KEEP_CHUNKS + 1))
+        for index in [index for index in self.chunks if index not in keep]:
+            self.evict(index)
+    
+    def evict(self, index: int):
+        grid = self.chunks.pop(index)
+        self.surfaces.pop(index, None)
+        self.spare.pop(index, None)
+        self.pyramids.pop(index, None)
+        if index in self.modified and index not in self.spilled:
+            self.chunk_digest(index, grid)
+            if self.spill_dir is None:
+                self.spill_dir = tempfile.TemporaryDirectory(prefix="tank-terrain-")
+            path = os.path.join(self.spill_dir.name, f"{index}.bits")
+            with open(path, "wb") as f:
+                f.write(np.packbits(grid, axis=None).tobytes())
+            self.spilled[index] = path
+    
+    def chunk_digest(self, index: int, grid: np.ndarray = None) -> bytes:
+        digest = self.digests.get(index)
+        if digest is None:
+            grid = self.chunk(index) if grid is None else grid
+            digest = self.digests[index] = hashlib.blake2b(grid.tobytes(), digest_size=16).digest()
+        return digest
+    
+    def digest(self) -> str:
+        """Digest of every cell: the seed plus each chunk that differs from it"""
+        h = hashlib.blake2b(self.seed.to_bytes(8, "little"))
+        for index in sorted(self.modified):
+            h.update(index.to_bytes(4, "little") + self.chunk_digest(index))
+        return h.hexdigest()
+    
+    def calculate_surface_heights(self, x0: int = 0, x1: int = None):
+        """Recalculate surface heights for columns x0 to x1 - 1"""
+        x1 = self.width if x1 is None else x1
+        for start, grid in self.chunks_between(x0, x1):
+            left, right = max(x0, start), min(x1, start + grid.shape[0])
+            columns = grid[left - start:right - start]
+            # Find the first solid ground cell from top to bottom in every
+            # column; columns with no solid ground have height 0
+            has_ground = columns.any(axis=1)
+            first_solid = columns.argmax(axis=1)
+            self.surface_heights[left:right] = np.where(has_ground, self.height - first_solid, 0).tolist()
+    
+    def draw(self, screen, camera_x: int = 0):
+        """Draw the chunks in view, camera_x being the column at the left edge of screen"""
+        for start, _ in self.chunks_between(camera_x, camera_x + screen.get_width()):
+            index = start // CHUNK_WIDTH
+            surface = self.surfaces.get(index)
+            if surface is None:
+                surface = self.surfaces[index] = self.render_chunk(index)
+            screen.blit(surface, (start - camera_x, 0))
+    
+    def render_chunk(self, index: int):
+        grid = self.chunk(index)
+        terrain_surface = pygame.Surface(grid.shape, pygame.SRCALPHA)
+        self.paint(terrain_surface, grid, 0, grid.shape[0], 0, grid.shape[1])
+        return terrain_surface
+    
+    @staticmethod
+    def paint(surface, grid: np.ndarray, x0: int, x1: int, y0: int, y1: int):
+        """Redraw the cells in columns x0 to x1 - 1, rows y0 to y1 - 1 of a chunk's surface"""
+        x0, x1 = max(0, x0), min(grid.shape[0], x1)
+        cells = grid[x0:x1, y0:y1]
         # Use pygame.surfarray for faster drawing
-        if hasattr(pygame, 'surfarray'):
-            # Create an array representation of the terrain
-            pixels = np.zeros((self.width, self.height, 4), dtype=np.uint8)
-            # Set RGB and alpha values for solid cells
-            r, g, b = GROUND_COLOR
-            pixels[..., 0][self.grid] = r
-            pixels[..., 1][self.grid] = g
-            pixels[..., 2][self.grid] = b
-            pixels[..., 3][self.grid] = 255  # Solid
-            # Use surfarray.blit_array for efficient transfer
-            pygame_surface_array = pygame.surfarray.pixels_alpha(terrain_surface)
-            pygame_surface_array[...] = pixels[..., 3]
-            del pygame_surface_array
-            pygame_surface_array = pygame.surfarray.pixels3d(terrain_surface)
-            pygame_surface_array[...] = pixels[..., :3]
-            del pygame_surface_array
-        else:
-            # Fallback method
-            for x in range(self.width):
-                for y in range(self.height):
-                    if self.grid[x, y]:
-                        terrain_surface.set_at((x, y), GROUND_COLOR)
-        
-        # Blit the surface to the screen
-        screen.blit(terrain_surface, (0, 0))
+        pygame.surfarray.pixels_alpha(surface)[x0:x1, y0:y1] = cells * np.uint8(255)
+        pixels = pygame.surfarray.pixels3d(surface)
+        pixels[x0:x1, y0:y1][cells] = GROUND_COLOR
+        del pixels
     
     def create_explosion(self, x: int, y: int, radius: int):
         """Modify terrain to create an explosion crater"""
-        for dx in range(-radius, radius + 1):
-            for dy in range(-radius, radius + 1):
-                nx, ny = x + dx, y + dy
-                # Check bounds
-                if 0 <= nx < self.width and 0 <= ny < self.height:
-                    # Check if point is within the circular explosion radius
-                    if dx*dx + dy*dy <= radius*radius:
-                        self.grid[nx, ny] = False
+        self.create_explosions([(x, y, radius)])
 
-        # Slide the terrain down
-        self.slide_terrain()
-
-        # Update surface heights after explosion
-        self.surface_heights = self.calculate_surface_heights()
-
-    def slide_terrain(self):
-        """Slide the terrain down to fill in the crater"""
-        for x in range(self.width):
-            # count number of cells in column
-            count = 0
-            for y in range(self.height):
-                if self.grid[x, y]:
-                    count += 1
-            # reconstruct the column
-            for y in range(self.height):
-                if y >= self.height - count:
-                    self.grid[x, y] = True
-                else:
-                    self.grid[x, y] = False
+    @profiled("tank.explosion")
+    def create_explosions(self, craters):
+        """Carve every (x, y, radius) crater in craters now and let the ground above them fall"""
+        self.finish()
+        for x, y, radius in craters:
+            rect = self.carve(self.chunk, x, y, radius)
+            if rect is not None:
+                self.changed(*rect)
+                
+                # Update surface heights after explosion
+                self.calculate_surface_heights(rect[0], rect[1])
+                self.collapse(rect[0], rect[1])
+    
+    def carve(self, cells, x: int, y: int, radius: int):
+        """Cut a crater out of the chunks cells(index) returns; its (x0, x1, y0, y1)
+        bounds, or None if it misses the terrain"""
+        x0, x1 = max(0, x - radius), min(self.width, x + radius + 1)
+        y0, y1 = max(0, y - radius), min(self.height, y + radius + 1)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        for index in range(x0 // CHUNK_WIDTH, (x1 - 1) // CHUNK_WIDTH + 1):
+            grid = cells(index)
+            start = index * CHUNK_WIDTH
+            left, right = max(x0, start), min(x1, start + grid.shape[0])
+            dx = np.arange(left, right)[:, None] - x
+            dy = np.arange(y0, y1)[None, :] - y
+            # Check if point is within the circular explosion radius
+            grid[left - start:right - start, y0:y1] &= dx * dx + dy * dy > radius * radius
+        return x0, x1, y0, y1
+    
+    def collapse(self, x0: int, x1: int):
+        """Let the ground in columns x0 to x1 - 1 fall over the next steps"""
+        merged = []
+        for span in sorted(self.collapsing + [[x0, x1]]):
+            if merged and span[0] <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], span[1])
+            else:
+                merged.append(list(span))
+        self.collapsing = merged
+    
+    def queue_explosions(self, craters):
+        """Have the next begin() carve every (x, y, radius) crater in craters"""
+        self.queued.extend(craters)
+    
+    def busy(self) -> bool:
+        """True while craters are queued, ground is falling or the worker is on it"""
+        return bool(self.queued or self.collapsing or self.pending)
+    
+    def begin(self):
+        """Start the queued craters and the next collapse step on the worker thread.
+        
+        The worker fills a back buffer of each chunk involved from the chunk,
+        carves the craters into it and drops the loose ground in every
+        collapsing span by up to FALL_SPEED cells: ground on an unbroken
+        stack of cells down to the bottom stays put and every other cell
+        falls, overhangs and the roofs of caves under a crater included,
+        until each column is packed at the bottom. Meanwhile the chunks
+        themselves stay as they were, for drawing and for queries, until
+        finish() swaps the buffers.
+        """
+        if self.pending is not None or not (self.queued or self.collapsing):
+            return
+        craters, self.queued = self.queued, []
+        for x, y, radius in craters:
+            x0, x1 = max(0, x - radius), min(self.width, x + radius + 1)
+            if x0 < x1:
+                self.collapse(x0, x1)
+        # Every column a crater touches is in a collapsing span now. The tops
+        # come from the surface before the craters, which only lower it
+        drops = []
+        for n, (x0, x1) in enumerate(self.collapsing):
+            for start, grid in self.chunks_between(x0, x1):
+                left, right = max(x0, start), min(x1, start + grid.shape[0])
+                top = self.height - max(self.surface_heights[left:right])
+                drops.append((n, start // CHUNK_WIDTH, left - start, right - start, top))
+        fronts = {index: self.chunks[index] for _, index, _, _, _ in drops}
+        backs = {index: self.spare.pop(index, None) for index in fronts}
+        self.pending = terrain_worker().submit(self.mutate, fronts, backs, craters, drops)
+    
+    def mutate(self, fronts, backs, craters, drops):
+        """begin()'s work, on the worker thread. Touches nothing but its arguments,
+        and writes only to the back buffers; returns them with the changed
+        rectangles and the numbers of the spans where ground moved"""
+        for index, front in fronts.items():
+            if backs[index] is None or backs[index].shape != front.shape:
+                backs[index] = front.copy()
+            else:
+                np.copyto(backs[index], front)
+        rects = []
+        for x, y, radius in craters:
+            rect = self.carve(backs.__getitem__, x, y, radius)
+            if rect is not None:
+                rects.append(rect)
+        moved = set()
+        for n, index, left, right, top in drops:
+            rows = self.drop_loose(backs[index][left:right], top)
+            if rows is not None:
+                moved.add(n)
+                start = index * CHUNK_WIDTH
+                rects.append((start + left, start + right) + rows)
+        return backs, rects, moved
+    
+    def finish(self) -> bool:
+        """Wait for the worker and swap its back buffers in; False if it had nothing"""
+        if self.pending is None:
+            return False
+        backs, rects, moved = self.pending.result()
+        self.pending = None
+        for index, back in backs.items():
+            # The old chunk becomes the back buffer for next time
+            self.spare[index] = self.chunks[index]
+            self.chunks[index] = back
+            pyramid = self.pyramids.get(index)
+            if pyramid is not None:
+                pyramid.grid = back
+        for x0, x1, y0, y1 in rects:
+            self.changed(x0, x1, y0, y1)
+            self.calculate_surface_heights(x0, x1)
+        # A span is done once nothing in it moves
+        self.collapsing = [span for n, span in enumerate(self.collapsing) if n in moved]
+        return True
+    
+    @profiled("tank.collapse")
+    def settle(self) -> bool:
+        """Carve the queued craters and drop the loose ground one step, waiting
+        for the result; True while some ground is still falling"""
+        self.begin()
+        self.finish()
+        return bool(self.collapsing)
+    
+    @staticmethod
+    def drop_loose(columns: np.ndarray, top: int):
+        """Move every loose cell of columns (no ground above row top) down by up
+        to FALL_SPEED cells in place; returns the (first, last + 1) rows it may
+        have changed, or None if nothing was loose"""
+        height = columns.shape[1]
+        # The lowest empty cell of each column; the cells below it rest on the bottom
+        empty = ~columns[:, top:]
+        flipped = empty[:, ::-1]
+        has_gap = flipped.any(axis=1)
+        if not has_gap.any():
+            return None
+        lowest_gap = np.where(has_gap, height - 1 - flipped.argmax(axis=1), -1)
+        bottom = int(lowest_gap.max()) + 1
+        window = columns[:, top:bottom]
+        loose = window & (np.arange(top, bottom)[None, :] < lowest_gap[:, None])
+        falling = loose.any(axis=1)
+        if not falling.any():
+            return None
+        # Loose ground falls freely, but no further than the gap under its lowest cell
+        lowest_loose = bottom - 1 - loose[:, ::-1].argmax(axis=1)
+        drop = np.minimum(FALL_SPEED, lowest_gap - lowest_loose)
+        window &= ~loose
+        for d in np.unique(drop[falling]).tolist():
+            cols = np.flatnonzero(falling & (drop == d))
+            window[cols, d:] |= loose[cols, :-d]
+        return top, bottom
     
     def get_height_at(self, x: int) -> int:
         """Get the surface height at position x"""
         if 0 <= x < self.width:
+            if x // CHUNK_WIDTH not in self.surveyed:
+                self.chunk(x // CHUNK_WIDTH)
             return self.surface_heights[x]
         return 0
     
+    def first_solid(self, x0: float, y0: float, x1: float, y1: float, steps: int):
+        """First i in 1..steps where the point i/steps of the way from (x0, y0) to
+        (x1, y1), truncated to a cell, is solid; None if there is none.
+        
+        Gives the same answer as checking each point with is_solid(), but
+        runs of points inside an empty block are skipped in one go."""
+        dx, dy = x1 - x0, y1 - y0
+        index = pyramid = grid = None
+        i = 1
+        while i <= steps:
+            t = i / steps
+            x, y = int(x0 + dx * t), int(y0 + dy * t)
+            if not (0 <= x < self.width and 0 <= y < self.height):
+                i += 1
+                continue
+            if x // CHUNK_WIDTH != index:
+                index = x // CHUNK_WIDTH
+                pyramid = self.pyramid(index)
+                grid = pyramid.grid
+            start = index * CHUNK_WIDTH
+            block = pyramid.empty_block(x - start, y)
+            if block is None:
+                if grid[x - start, y]:
+                    return i
+                i += 1
+                continue
+            # The line leaves the block at parameter t_exit. Points are
+            # monotone along it, so once the last point before the exit is
+            # found to be in the block, so is every point up to it. (Points
+            # just above the top edge truncate into row 0, so the exit can
+            # come before the current point.)
+            bx0, by0, bx1, by1 = block
+            bx0, bx1 = bx0 + start, bx1 + start
+            t_exit = 1.0
+            if dx:
+                t_exit = min(t_exit, ((bx1 if dx > 0 else bx0) - x0) / dx)
+            if dy:
+                t_exit = min(t_exit, ((by1 if dy > 0 else by0) - y0) / dy)
+            last = min(steps, int(t_exit * steps))
+            while last > i:
+                t = last / steps
+                if bx0 <= int(x0 + dx * t) < bx1 and by0 <= int(y0 + dy * t) < by1:
+                    break
+                last -= 1
+            i = max(i, last) + 1
+        return None
+    
+    def any_solid(self, x0: int, y0: int, x1: int, y1: int) -> bool:
+        """True if any cell in columns x0 to x1 - 1, rows y0 to y1 - 1 is solid"""
+        return any(self.pyramid(start // CHUNK_WIDTH).any_set(x0 - start, y0, x1 - start, y1)
+                   for start, _ in self.chunks_between(x0, x1))
+    
+    def all_solid(self, x0: int, y0: int, x1: int, y1: int) -> bool:
+        """True if every cell in columns x0 to x1 - 1, rows y0 to y1 - 1 is solid"""
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(self.width, x1), min(self.height, y1)
+        if x0 >= x1 or y0 >= y1:
+            return False
+        return all(self.pyramid(start // CHUNK_WIDTH).all_set(x0 - start, y0, x1 - start, y1)
+                   for start, _ in self.chunks_between(x0, x1))
+    
+    def solid_at(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """is_solid() for arrays of integer points at once"""
+        solid = np.zeros(xs.shape, dtype=bool)
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        xs, ys = xs[inside], ys[inside]
+        index = xs // CHUNK_WIDTH
+        found = np.zeros(xs.shape, dtype=bool)
+        for i in np.unique(index).tolist():
+            here = index == i
+            found[here] = self.chunk(i)[xs[here] - i * CHUNK_WIDTH, ys[here]]
+        solid[inside] = found
+        return solid
+    
     def is_solid(self, x: int, y: int) -> bool:
         """Check if the point (x,y) is solid ground"""
         if 0 <= x < self.width and 0 <= y < self.height:
-            return self.grid[x, y]
+            index, column = divmod(x, CHUNK_WIDTH)
+            grid = self.chunks.get(index)
+            if grid is None:
+                grid = self.chunk(index)
+            return grid[column, y]
         return False
 
 class Tank:
@@ -208,7 +576,7 @@ class Tank:
         self.terrain = terrain
         self.color = color
         self.player_num = player_num
-        self.shields = 5
+        self.shields = START_SHIELDS
         self.width = 40  # Doubled from 20
         self.height = 20  # Doubled from 10
         self.barrel_length = 40  # Doubled from 20
@@ -243,24 +611,25 @@ class Tank:
         barrel_y = self.y - math.sin(angle_rad) * self.barrel_length
         return int(barrel_x), int(barrel_y)
     
-    def draw(self, screen):
+    def draw(self, screen, camera_x: int = 0):
         """Draw the tank"""
+        x = self.x - camera_x
         # Draw tank body
         pygame.draw.rect(screen, self.color, 
-                         (self.x - self.width // 2, self.y - self.height // 2, 
+                         (x - self.width // 2, self.y - self.height // 2, 
                           self.width, self.height))
         
         # Draw barrel
-        barrel_end = self.get_barrel_end()
-        pygame.draw.line(screen, self.color, (self.x, self.y), barrel_end, 3)
+        barrel_x, barrel_y = self.get_barrel_end()
+        pygame.draw.line(screen, self.color, (x, self.y), (barrel_x - camera_x, barrel_y), 3)
         
         # Draw shield indicator on the tank
-        font = pygame.font.SysFont(None, 20)
+        font = get_font(None, 20)
         shield_text = font.render(str(self.shields), True, (255, 255, 255))
-        screen.blit(shield_text, (self.x - 5, self.y - 25))
+        screen.blit(shield_text, (x - 5, self.y - 25))
     
-    def fire(self) -> 'Projectile':
-        """Fire a projectile from the tank barrel"""
+    def fire(self, shells: 'Shells', kind: int = SHELL):
+        """Fire a shell of the given kind from the tank barrel"""
         barrel_end = self.get_barrel_end()
         angle_rad = math.radians(self.barrel_angle)
         
@@ -268,147 +637,255 @@ class Tank:
         vx = math.cos(angle_rad) * PROJECTILE_SPEED
         vy = -math.sin(angle_rad) * PROJECTILE_SPEED
         
-        return Projectile(barrel_end[0], barrel_end[1], vx, vy, self.color)
+        shells.add(barrel_end[0], barrel_end[1], vx, vy, self.color, kind)
     
     def damage(self):
         """Reduce tank shields by 1"""
         self.shields -= 1
         return self.shields <= 0  # Return True if tank is destroyed
 
-class Projectile:
-    def __init__(self, x: float, y: float, vx: float, vy: float, color: Tuple[int, int, int]):
-        self.x = x
-        self.y = y
-        self.vx = vx
-        self.vy = vy
-        self.color = color
-        self.radius = 6  # Doubled from 3
-        self.active = True
+class Shells:
+    """Every shell in flight, as parallel NumPy arrays advanced together.
+
+    Slots 0 to count - 1 are in use. Each step applies gravity and the wall
+    bounces to all shells at once, checks their paths against the terrain in
+    one batch and resolves all of that step's impacts together: the craters
+    are carved and slid in one pass and each tank is damaged once per blast
+    it was caught in. MIRV shells split into MIRV_WARHEADS shells at the top
+    of their arc.
+    """
+    FIELDS = ("x", "y", "vx", "vy", "prev_x", "prev_y", "color", "kind", "active")
     
-    def update(self, terrain: Terrain, tanks: List[Tank]) -> bool:
-        """Update projectile position and check for collisions
-        Returns True if the projectile has exploded"""
-        if not self.active:
-            return False
-            
-        # Apply gravity
-        self.vy += GRAVITY
-        
-        # Store old position for collision detection
-        old_x, old_y = self.x, self.y
-        
-        # Update position
-        self.x += self.vx
-        self.y += self.vy
-        
-        # Check for wall/ceiling collisions
-        if self.x < 0:
-            self.x = 0
-            self.vx = -self.vx * 0.8  # Bounce with energy loss
-        elif self.x >= SCREEN_WIDTH:
-            self.x = SCREEN_WIDTH - 1
-            self.vx = -self.vx * 0.8  # Bounce with energy loss
-            
-        if self.y < 0:
-            self.y = 0
-            self.vy = -self.vy * 0.8  # Bounce with energy loss
-        
-        # Check for terrain collision
-        x_int, y_int = int(self.x), int(self.y)
-        
-        # Check if we've moved into solid terrain
-        if terrain.is_solid(x_int, y_int):
-            # Hit the terrain
-            self.explode(terrain, tanks)
-            return True
-        
-        # Check for line collision between old and new position
-        # This ensures fast-moving projectiles don't skip over thin terrain
-        if abs(self.vx) > 1 or abs(self.vy) > 1:
-            steps = int(max(abs(self.vx), abs(self.vy))) * 2
-            for i in range(1, steps + 1):
-                t = i / steps
-                check_x = int(old_x + (self.x - old_x) * t)
-                check_y = int(old_y + (self.y - old_y) * t)
-                if terrain.is_solid(check_x, check_y):
-                    self.x, self.y = check_x, check_y
-                    self.explode(terrain, tanks)
-                    return True
-                
-        return False
+    def __init__(self, capacity: int = 16):
+        self.count = 0
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.vx = np.zeros(capacity)
+        self.vy = np.zeros(capacity)
+        # Positions before the last step, for interpolated drawing
+        self.prev_x = np.zeros(capacity)
+        self.prev_y = np.zeros(capacity)
+        self.color = np.zeros((capacity, 3), dtype=np.uint8)
+        self.kind = np.zeros(capacity, dtype=np.uint8)
+        self.active = np.zeros(capacity, dtype=bool)
+    
+    def reserve(self, n: int) -> slice:
+        """Slots for n more shells, growing the arrays if needed"""
+        needed = self.count + n
+        capacity = len(self.x)
+        if needed > capacity:
+            while capacity < needed:
+                capacity *= 2
+            for name in self.FIELDS:
+                old = getattr(self, name)
+                new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+                new[:self.count] = old[:self.count]
+                setattr(self, name, new)
+        added = slice(self.count, needed)
+        self.count = needed
+        return added
     
-    def draw(self, screen):
-        """Draw the projectile"""
-        if self.active:
-            pygame.draw.circle(screen, self.color, (int(self.x), int(self.y)), self.radius)
+    def add(self, x, y, vx, vy, color, kind=SHELL, prev_x=None, prev_y=None):
+        """Add shells; every argument may be a single value or an array of them"""
+        n = max(np.size(x), np.size(vx))
+        added = self.reserve(n)
+        self.x[added], self.y[added] = x, y
+        self.vx[added], self.vy[added] = vx, vy
+        self.prev_x[added] = x if prev_x is None else prev_x
+        self.prev_y[added] = y if prev_y is None else prev_y
+        self.color[added] = color
+        self.kind[added] = kind
+        self.active[added] = True
     
-    def explode(self, terrain: Terrain, tanks: List[Tank]):
-        """Handle explosion when projectile hits terrain"""
-        self.active = False
+    def compact(self):
+        """Drop the inactive shells, keeping the others in order"""
+        keep = self.active[:self.count]
+        n = int(keep.sum())
+        if n < self.count:
+            for name in self.FIELDS:
+                array = getattr(self, name)
+                array[:n] = array[:self.count][keep]
+            self.count = n
+    
+    def step(self, terrain: Terrain, tanks: List[Tank]) -> int:
+        """Advance every shell one step and resolve the impacts; returns how many hit"""
+        n = self.count
+        if not n:
+            return 0
+        x, y, vx, vy = self.x[:n], self.y[:n], self.vx[:n], self.vy[:n]
+        old_x, old_y = self.prev_x[:n], self.prev_y[:n]
+        
+        # Apply gravity, remembering where each shell was
+        rising = vy < 0
+        vy += GRAVITY
+        old_x[:], old_y[:] = x, y
+        x += vx
+        y += vy
+        
+        # Wall and ceiling collisions bounce with energy loss
+        wall = (x < 0) | (x >= terrain.width)
+        if wall.any():
+            x[wall] = np.where(x[wall] < 0, 0, terrain.width - 1)
+            vx[wall] = -vx[wall] * 0.8
+        up = y < 0
+        if up.any():
+            y[up] = 0
+            vy[up] = -vy[up] * 0.8
+        
+        # Find the shells that hit the ground: those whose end point is solid,
+        # then the first solid point along the path of fast ones, so they
+        # don't skip over thin terrain. Every shell's points are laid out in
+        # one row, end point first and padded with it at the end, and only
+        # points below the highest ground their column ever had are looked up
+        # in the terrain.
+        speed = np.maximum(np.abs(vx), np.abs(vy))
+        steps = np.where(speed > 1, speed.astype(np.int64) * 2, 1)
+        t = np.minimum(np.arange(1, steps.max() + 1)[None, :] / steps[:, None], 1)
+        points_x = np.concatenate([x[:, None], old_x[:, None] + (x - old_x)[:, None] * t], axis=1).astype(np.int64)
+        points_y = np.concatenate([y[:, None], old_y[:, None] + (y - old_y)[:, None] * t], axis=1).astype(np.int64)
+        candidate = (points_y >= terrain.ceiling[points_x]) & (points_y < terrain.height)
+        impacts = np.zeros(0, dtype=np.int64)
+        if candidate.any():
+            solid = np.zeros(points_x.shape, dtype=bool)
+            solid[candidate] = terrain.solid_at(points_x[candidate], points_y[candidate])
+            impacts = np.flatnonzero(solid.any(axis=1))
+        if impacts.size:
+            # A solid end point explodes where the shell is, a path hit at the point
+            first = solid[impacts].argmax(axis=1)
+            hit_x = np.where(first > 0, points_x[impacts, first], x[impacts])
+            hit_y = np.where(first > 0, points_y[impacts, first], y[impacts])
+            self.active[impacts] = False
+            self.explode(hit_x, hit_y, terrain, tanks)
         
-        # Modify terrain
-        terrain.create_explosion(int(self.x), int(self.y), EXPLOSION_RADIUS)
+        # Shells that fell out of the bottom of the world are lost
+        self.active[:n] &= y < terrain.height
         
-        # Check if any tanks are in the blast radius
+        # MIRVs split at the top of their arc (or where they hit the ceiling)
+        apex = np.flatnonzero(self.active[:n] & (self.kind[:n] == MIRV) & rising & (vy >= 0))
+        if apex.size:
+            spread = (np.arange(MIRV_WARHEADS) - (MIRV_WARHEADS - 1) / 2) * MIRV_SPREAD
+            self.active[apex] = False
+            self.add(np.repeat(x[apex], MIRV_WARHEADS), np.repeat(y[apex], MIRV_WARHEADS),
+                     (vx[apex, None] + spread).ravel(), np.repeat(vy[apex], MIRV_WARHEADS),
+                     np.repeat(self.color[apex], MIRV_WARHEADS, axis=0), SHELL,
+                     np.repeat(old_x[apex], MIRV_WARHEADS), np.repeat(old_y[apex], MIRV_WARHEADS))
+        
+        if not self.active[:self.count].all():
+            self.compact()
+        return int(impacts.size)
+    
+    def explode(self, xs: np.ndarray, ys: np.ndarray, terrain: Terrain, tanks: List[Tank]):
+        """Handle the explosions of shells that hit terrain at (xs, ys)"""
+        # Modify terrain, on the worker thread from the end of this step
+        terrain.queue_explosions([(int(x), int(y), EXPLOSION_RADIUS) for x, y in zip(xs.tolist(), ys.tolist())])
+        
+        # Check if any tanks still in the game are in the blast radius of each explosion
         for tank in tanks:
-            distance = math.sqrt((tank.x - self.x)**2 + (tank.y - self.y)**2)
-            if distance < EXPLOSION_RADIUS:
+            if tank.shields <= 0:
+                continue
+            distance = np.sqrt((tank.x - xs) ** 2 + (tank.y - ys) ** 2)
+            # A tank's last shield is the last hit it takes
+            for _ in range(min(int((distance < EXPLOSION_RADIUS).sum()), tank.shields)):
                 tank.damage()
-                
-        # Update tank positions after terrain changes
-        for tank in tanks:
-            tank.update_position()
+    
+    def draw(self, screen, alpha: float = 1.0, camera_x: int = 0):
+        """Draw the shells, alpha of the way from their previous to their current positions"""
+        n = self.count
+        xs = (lerp(self.prev_x[:n], self.x[:n], alpha) - camera_x).astype(int)
+        ys = lerp(self.prev_y[:n], self.y[:n], alpha).astype(int)
+        for x, y, color in zip(xs.tolist(), ys.tolist(), self.color[:n].tolist()):
+            pygame.draw.circle(screen, color, (x, y), SHELL_RADIUS)
 
 class Game:
-    def __init__(self, num_players: int = 2):
-        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        pygame.display.set_caption("Tank Game")
-        self.clock = pygame.time.Clock()
-        self.terrain = Terrain(SCREEN_WIDTH, SCREEN_HEIGHT)
+    def __init__(self, num_players: int = 2, screen=None, width: int = SCREEN_WIDTH):
+        # The window is only opened by run(), so a Game can be built headless
+        self.screen = screen
+        self.terrain = Terrain(width, SCREEN_HEIGHT)
         
         # Create tanks
         self.num_players = max(2, min(num_players, 4))  # Between 2 and 4 players
         self.tanks = []
         
-        positions = [SCREEN_WIDTH // (self.num_players + 1) * (i + 1) for i in range(self.num_players)]
+        positions = [width // (self.num_players + 1) * (i + 1) for i in range(self.num_players)]
         for i in range(self.num_players):
             self.tanks.append(Tank(positions[i], self.terrain, TANK_COLORS[i], i + 1))
         
         self.current_player = 0
-        self.projectile = None
+        self.shells = Shells()
+        self.weapon = SHELL
+        self.blasts = []  # (x, y, age in steps) of explosions still flashing
         self.game_over = False
         self.winner = None
         self.waiting_for_projectile = False
+        self.running = True
         
         # Track which keys are being held down
         self.keys_pressed = {pygame.K_LEFT: False, pygame.K_RIGHT: False}
         
-    def handle_events(self):
-        """Handle pygame events"""
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-                
-            # Only handle player inputs when no projectile is active
-            if not self.waiting_for_projectile and not self.game_over:
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_LEFT or event.key == pygame.K_RIGHT:
-                        self.keys_pressed[event.key] = True
-                    elif event.key == pygame.K_SPACE:
-                        self.projectile = self.tanks[self.current_player].fire()
-                        self.waiting_for_projectile = True
-                        
-                elif event.type == pygame.KEYUP:
-                    if event.key in self.keys_pressed:
-                        self.keys_pressed[event.key] = False
+        # Simulation runs at a fixed rate, independent of the frame rate
+        self.timestep = FixedTimestep(SIMULATION_RATE)
+        
+        # Column at the left edge of the window, following the action
+        self.camera_x = self.camera_target()
+        
+    def handle_event(self, event):
+        """Handle one pygame event"""
+        if event.type == pygame.QUIT:
+            self.running = False
+            return
+        
+        # Hold F to fast-forward a shot
+        if event.type in (pygame.KEYDOWN, pygame.KEYUP) and event.key == pygame.K_f:
+            self.timestep.speed = FAST_FORWARD if event.type == pygame.KEYDOWN else 1.0
             
-            # Allow restart when game is over
-            if self.game_over and event.type == pygame.KEYDOWN and event.key == pygame.K_r:
-                self.__init__(self.num_players)
+        # Only handle player inputs when no shell is in flight
+        if not self.waiting_for_projectile and not self.game_over:
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_LEFT or event.key == pygame.K_RIGHT:
+                    self.keys_pressed[event.key] = True
+                elif event.key == pygame.K_SPACE:
+                    self.tanks[self.current_player].fire(self.shells, self.weapon)
+                    self.waiting_for_projectile = True
+                elif event.key == pygame.K_m:
+                    # Switch between plain shells and MIRVs
+                    self.weapon = MIRV if self.weapon == SHELL else SHELL
+                elif event.key == pygame.K_v:
+                    # Volley: every tank still in the game fires at once
+                    for tank in self.tanks:
+                        if tank.shields > 0:
+                            tank.fire(self.shells, self.weapon)
+                    self.waiting_for_projectile = True
+                    
+            elif event.type == pygame.KEYUP:
+                if event.key in self.keys_pressed:
+                    self.keys_pressed[event.key] = False
+        
+        # Allow restart when game is over
+        if self.game_over and event.type == pygame.KEYDOWN and event.key == pygame.K_r:
+            self.__init__(self.num_players, self.screen, self.terrain.width)
                 
-    def update(self):
-        """Update game state"""
+    def resolve_shot(self, max_steps: int = 10000) -> int:
+        """Run the shells in flight to their impacts without drawing (headless / AI play)"""
+        steps = 0
+        while self.waiting_for_projectile and steps < max_steps:
+            self.step()
+            steps += 1
+        return steps
+    
+    def update(self, dt: float):
+        """Run however many fixed steps dt seconds of real time cover"""
+        for _ in range(self.timestep.advance(dt)):
+            self.step()
+        self.retain_terrain()
+    
+    def step(self):
+        """Advance the game state by one fixed simulation step"""
+        # Swap in the terrain the worker made during the last frame, and let
+        # the tanks sink with the ground
+        self.terrain.finish()
+        for tank in self.tanks:
+            tank.update_position()
+        
         # Handle continuous key presses for barrel rotation
         if not self.waiting_for_projectile and not self.game_over:
             if self.keys_pressed[pygame.K_LEFT]:
@@ -416,13 +893,20 @@ class Game:
             if self.keys_pressed[pygame.K_RIGHT]:
                 self.tanks[self.current_player].rotate_barrel(-1)  # CW
         
-        # Update projectile if active
-        if self.waiting_for_projectile and self.projectile:
-            if self.projectile.update(self.terrain, self.tanks):
-                # Projectile exploded, move to next player
-                self.projectile = None
-                self.waiting_for_projectile = False
-                self.next_player()
+        # Update the shells in flight
+        if self.waiting_for_projectile:
+            self.shells.step(self.terrain, self.tanks)
+        
+        # Flash the new explosions, then hand their craters and the falling
+        # ground to the worker; frames are drawn from the old terrain meanwhile
+        self.blasts = [(x, y, age + 1) for x, y, age in self.blasts if age + 1 < BLAST_STEPS]
+        self.blasts += [(x, y, 0) for x, y, _ in self.terrain.queued]
+        self.terrain.begin()
+        
+        if self.waiting_for_projectile and not self.shells.count and not self.terrain.busy():
+            # The last shell is down and the ground has settled, move to next player
+            self.waiting_for_projectile = False
+            self.next_player()
         
         # Check for game over
         active_players = 0
@@ -435,39 +919,65 @@ class Game:
         if active_players <= 1 and self.num_players > 1:
             self.game_over = True
             self.winner = last_active + 1 if last_active >= 0 else None
+        
+        # Scroll the view towards the shell in flight or the tank to play
+        target = self.camera_target()
+        self.camera_x += max(-CAMERA_SPEED, min(target - self.camera_x, CAMERA_SPEED))
+    
+    def camera_target(self) -> int:
+        """Left edge of a view centred on the first shell in flight, or else on the current tank"""
+        if self.shells.count:
+            x = int(self.shells.x[0])
+        else:
+            x = self.tanks[self.current_player].x
+        view = min(SCREEN_WIDTH, self.terrain.width)
+        return max(0, min(x - view // 2, self.terrain.width - view))
+    
+    def retain_terrain(self):
+        """Let the terrain drop chunks far from the tanks, the shells and the view"""
+        xs = [tank.x for tank in self.tanks]
+        xs.extend(range(self.camera_x, self.camera_x + SCREEN_WIDTH + CHUNK_WIDTH, CHUNK_WIDTH))
+        xs.extend(self.shells.x[:self.shells.count].tolist())
+        self.terrain.retain(xs)
                 
     def next_player(self):
         """Move to the next player's turn"""
         self.current_player = (self.current_player + 1) % self.num_players
         
-        # Skip destroyed tanks
+        # Skip destroyed tanks, unless the last shot destroyed them all
+        if all(tank.shields <= 0 for tank in self.tanks):
+            return
         while self.tanks[self.current_player].shields <= 0:
             self.current_player = (self.current_player + 1) % self.num_players
     
     def draw(self):
-        """Draw the game"""
+        """Draw the game, interpolating moving objects between the last two steps"""
         # Draw sky
         self.screen.fill(SKY_COLOR)
         
         # Draw terrain
-        self.terrain.draw(self.screen)
+        self.terrain.draw(self.screen, self.camera_x)
         
         # Draw tanks
         for tank in self.tanks:
-            tank.draw(self.screen)
+            tank.draw(self.screen, self.camera_x)
             
-        # Draw projectile if active
-        if self.projectile:
-            self.projectile.draw(self.screen)
+        # Draw the shells in flight
+        self.shells.draw(self.screen, self.timestep.alpha, self.camera_x)
+        
+        # Draw explosion flashes, growing and fading
+        for x, y, age in self.blasts:
+            fade = 1 - age / BLAST_STEPS
+            radius = int(EXPLOSION_RADIUS * (0.5 + 0.5 * age / BLAST_STEPS))
+            pygame.draw.circle(self.screen, (255, int(80 + 120 * fade), 0), (x - self.camera_x, y), radius)
+            pygame.draw.circle(self.screen, (255, 255, int(200 * fade)), (x - self.camera_x, y), radius // 2)
             
         # Draw HUD
         self.draw_hud()
-            
-        pygame.display.flip()
         
     def draw_hud(self):
         """Draw the heads-up display"""
-        font = pygame.font.SysFont(None, 64)  # Doubled from 32
+        font = get_font(None, 64)  # Doubled from 32
         
         # Draw player shields
         for i, tank in enumerate(self.tanks):
@@ -479,7 +989,22 @@ class Game:
         if not self.game_over:
             pygame.draw.rect(self.screen, (255, 255, 255), 
                             (30 + self.current_player * 400, 30, 380, 60), 4)  # Doubled all values
-        
+            weapon_text = f"{WEAPON_NAMES[self.weapon]} (M to switch, V for a volley)"
+            text_surface = get_font(None, 40).render(weapon_text, True, (255, 255, 255))
+            self.screen.blit(text_surface, (40, 110))
+
+        # On a battlefield wider than the window, a strip along the top shows
+        # where the tanks and the view are
+        if self.terrain.width > SCREEN_WIDTH:
+            scale = SCREEN_WIDTH / self.terrain.width
+            pygame.draw.rect(self.screen, (255, 255, 255),
+                             (self.camera_x * scale, 4, SCREEN_WIDTH * scale, 16), 2)
+            for tank in self.tanks:
+                if tank.shields > 0:
+                    pygame.draw.circle(self.screen, tank.color, (int(tank.x * scale), 12), 5)
+            for x in self.shells.x[:self.shells.count].tolist():
+                pygame.draw.circle(self.screen, (0, 0, 0), (int(x * scale), 12), 3)
+
         # Game over message
         if self.game_over:
             if self.winner is not None:
@@ -491,14 +1016,121 @@ class Game:
             text_rect = text_surface.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2))
             self.screen.blit(text_surface, text_rect)
         
-    def run(self):
+    def is_animating(self) -> bool:
+        """True while a shell is in flight or exploding, the barrel is being turned or the view scrolls"""
+        return (self.waiting_for_projectile or bool(self.blasts) or any(self.keys_pressed.values())
+                or self.camera_x != self.camera_target())
+    
+    def state_key(self):
+        """Everything a replay must reproduce, as plain data"""
+        n = self.shells.count
+        shells = list(zip(self.shells.x[:n].tolist(), self.shells.y[:n].tolist(),
+                          self.shells.vx[:n].tolist(), self.shells.vy[:n].tolist()))
+        return (self.terrain.digest(),
+                [(tank.x, tank.y, tank.barrel_angle, tank.shields) for tank in self.tanks],
+                self.current_player, self.weapon, shells, self.terrain.collapsing, self.game_over, self.winner)
+
+    def snapshot(self) -> bytes:
+        self.terrain.finish()  # Mutations in progress belong in the snapshot
+        flags = ((self.waiting_for_projectile and FLAG_WAITING) | (self.game_over and FLAG_GAME_OVER)
+                 | (self.keys_pressed[pygame.K_LEFT] and FLAG_LEFT)
+                 | (self.keys_pressed[pygame.K_RIGHT] and FLAG_RIGHT)
+                 | (self.weapon == MIRV and FLAG_MIRV))
+        terrain = self.terrain
+        shells = self.shells
+        n = shells.count
+        parts = [SNAPSHOT.pack(self.num_players, self.current_player, flags, self.winner or 0,
+                               terrain.width, terrain.height, terrain.seed,
+                               self.timestep.accumulator, self.timestep.speed, len(terrain.modified), n,
+                               len(terrain.collapsing))]
+        parts += [TANK.pack(tank.x, tank.y, tank.barrel_angle, tank.shields) for tank in self.tanks]
+        records = np.empty(n, SHELL_RECORD)
+        for name in SHELL_RECORD.names:
+            records[name] = getattr(shells, name)[:n]
+        parts.append(records.tobytes())
+        parts += [SPAN.pack(x0, x1) for x0, x1 in terrain.collapsing]
+        for index in sorted(terrain.modified):
+            parts.append(index.to_bytes(2, "little"))
+            parts.append(np.packbits(terrain.chunk(index), axis=None).tobytes())
+        return b"".join(parts)
+
+    def restore(self, data):
+        (num_players, current_player, flags, winner, width, height, seed,
+         accumulator, speed, n_modified, n_shells, n_collapsing) = SNAPSHOT.unpack_from(data)
+        offset = SNAPSHOT.size
+        self.screen = getattr(self, 'screen', None)
+        self.running = getattr(self, 'running', True)
+        self.num_players = num_players
+        self.current_player = current_player
+        self.weapon = MIRV if flags & FLAG_MIRV else SHELL
+        self.waiting_for_projectile = bool(flags & FLAG_WAITING)
+        self.game_over = bool(flags & FLAG_GAME_OVER)
+        self.winner = winner or None
+        self.blasts = []
+        self.keys_pressed = {pygame.K_LEFT: bool(flags & FLAG_LEFT),
+                             pygame.K_RIGHT: bool(flags & FLAG_RIGHT)}
+        self.timestep = FixedTimestep(SIMULATION_RATE, speed=speed)
+        self.timestep.accumulator = accumulator
+
+        # The chunks come last; restore them first so tanks can be placed on them
+        terrain = self.terrain = Terrain(width, height, seed)
+        span_offset = offset + num_players * TANK.size + n_shells * SHELL_RECORD.itemsize
+        terrain.collapsing = [list(SPAN.unpack_from(data, span_offset + i * SPAN.size))
+                              for i in range(n_collapsing)]
+        chunk_offset = span_offset + n_collapsing * SPAN.size
+        for _ in range(n_modified):
+            index = int.from_bytes(data[chunk_offset:chunk_offset + 2], "little")
+            chunk_width = min(CHUNK_WIDTH, width - index * CHUNK_WIDTH)
+            size = -(-chunk_width * height // 8)
+            cells = np.unpackbits(np.frombuffer(data, np.uint8, size, chunk_offset + 2),
+                                  count=chunk_width * height)
+            chunk_offset += 2 + size
+            terrain.chunks[index] = cells.view(bool).reshape(chunk_width, height)
+            terrain.modified.add(index)
+            terrain.surveyed.add(index)
+            terrain.calculate_surface_heights(index * CHUNK_WIDTH, index * CHUNK_WIDTH + chunk_width)
+
+        self.tanks = []
+        for i in range(num_players):
+            x, y, barrel_angle, shields = TANK.unpack_from(data, offset)
+            offset += TANK.size
+            tank = Tank(x, self.terrain, TANK_COLORS[i], i + 1)
+            tank.y, tank.barrel_angle, tank.shields = y, barrel_angle, shields
+            self.tanks.append(tank)
+
+        records = np.frombuffer(data, SHELL_RECORD, n_shells, offset)
+        self.shells = Shells(max(16, n_shells))
+        self.shells.add(records["x"], records["y"], records["vx"], records["vy"], records["color"],
+                        records["kind"], records["prev_x"], records["prev_y"])
+        self.camera_x = self.camera_target()
+        
+    def run(self, recorder=None):
         """Main game loop"""
-        while True:
-            self.handle_events()
-            self.update()
-            self.draw()
-            self.clock.tick(FPS)
+        if self.screen is None:
+            pygame.init()
+            self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        pygame.display.set_caption("Tank Game")
+        gameloop.run(self, FPS, recorder)
+
+def main(num_players: int = 4, seed=None, record=None, width: int = SCREEN_WIDTH):
+    """Play until the window is closed"""
+    seed = replay.seed_session(seed)
+    game = Game(num_players=num_players, width=width)  # Change the number of players as needed
+    recorder = None
+    if record:
+        recorder = replay.Recorder(record, "tank", seed, {"num_players": num_players, "width": width}, FPS)
+    game.run(recorder)
 
 if __name__ == "__main__":
-    game = Game(num_players=4)  # Change the number of players as needed
-    game.run()
+    import argparse
+    parser = argparse.ArgumentParser(description='Tank Game')
+    parser.add_argument('--players', '-p', type=int, default=4, help='Number of players (2-4)')
+    parser.add_argument('--width', '-w', type=int, default=SCREEN_WIDTH,
+                        help='Battlefield width in pixels; wider than the window scrolls')
+    replay.add_arguments(parser)
+    profiler.add_arguments(parser)
+    args = parser.parse_args()
+    profiler.PROFILER.configure(args.profile)
+    main(args.players, args.seed, args.record, max(SCREEN_WIDTH, args.width))
+    pygame.quit()
+    sys.exit()
@@ -0,0 +1,261 @@
+"""Checks of the games' fast paths against slow, obviously right answers.
+
+    python -m unittest test_games        # or: python -m pytest test_games.py
+
+Incrementally kept chess scores and Zobrist keys against recomputing them,
+occupancy pyramid and terrain queries against looking at every cell,
+endgame tables against the values their positions' successors give, and
+snapshots and recordings of every game against the state they were made
+from. Everything runs headless.
+"""
+import os
+import random
+import tempfile
+import unittest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import numpy as np
+import pygame
+
+import chess
+import chess_eval
+import chess_tablebase
+import replay
+import snapshot
+import tank
+from occupancy import OccupancyPyramid
+
+# Game name -> constructor arguments for the snapshot and replay checks
+SESSIONS = {
+    "tank": {"num_players": 3},
+    "chess": {},
+    "cake": {"n_players": 4, "n_bots": 2},
+    "snail": {},
+    "nine_lives": {"start_round": 2},
+}
+KEYS = [pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN, pygame.K_SPACE,
+        pygame.K_a, pygame.K_f, pygame.K_BACKSPACE]
+
+
+def setUpModule():
+    pygame.init()
+
+
+def random_frames(rng, count):
+    """(dt, events) for count frames of someone mashing keys and clicking about"""
+    frames = []
+    for _ in range(count):
+        roll = rng.random()
+        events = []
+        if roll < 0.1:
+            events.append(pygame.event.Event(pygame.KEYDOWN, key=rng.choice(KEYS), mod=0))
+        elif roll < 0.2:
+            events.append(pygame.event.Event(pygame.KEYUP, key=rng.choice(KEYS), mod=0))
+        elif roll < 0.3:
+            events.append(pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1,
+                                             pos=(rng.randrange(1200), rng.randrange(900))))
+        frames.append((rng.choice([0.008, 0.016, 0.017, 0.033]), events))
+    return frames
+
+
+def play(game, frames):
+    for dt, events in frames:
+        for event in events:
+            game.handle_event(event)
+        game.update(dt)
+
+
+class ChessIncrementalTest(unittest.TestCase):
+    def test_scores_and_keys_match_recompute(self):
+        rng = random.Random(1)
+        for _ in range(5):
+            board = chess.Board()
+            player = chess.Player.NORTH
+            undos = []
+            for _ in range(120):
+                moves = board.generate_moves(player)
+                if moves:
+                    undos.append((board.scores[:], board.key, board.make_move(*rng.choice(moves))))
+                    self.assertEqual(board.scores, chess_eval.scores(board))
+                    self.assertEqual(board.key, board.compute_key())
+                player = chess.next_player(player)
+            # Taking the moves back returns every score and key on the way
+            for scores, key, undo in reversed(undos):
+                board.unmake_move(undo)
+                self.assertEqual(board.scores, scores)
+                self.assertEqual(board.key, key)
+
+    def test_unpack_recomputes(self):
+        board = chess.Board()
+        board.make_move(*board.generate_moves(chess.Player.NORTH)[0])
+        copy = chess.Board.__new__(chess.Board)
+        copy.unpack(board.pack())
+        self.assertEqual(copy.scores, board.scores)
+        self.assertEqual(copy.key, board.key)
+
+
+class OccupancyTest(unittest.TestCase):
+    def check_queries(self, pyramid, grid, rng, count=300):
+        width, height = grid.shape
+        for _ in range(count):
+            x0, x1 = sorted(rng.randrange(-5, width + 5) for _ in range(2))
+            y0, y1 = sorted(rng.randrange(-5, height + 5) for _ in range(2))
+            cells = grid[max(0, x0):max(0, x1), max(0, y0):max(0, y1)]
+            self.assertEqual(pyramid.any_set(x0, y0, x1, y1), bool(cells.any()))
+            self.assertEqual(pyramid.all_set(x0, y0, x1, y1), bool(cells.all()))  # True when empty
+            x, y = rng.randrange(width), rng.randrange(height)
+            block = pyramid.empty_block(x, y)
+            if block is None:
+                # Then even the smallest block around the cell has something set
+                size = pyramid.sizes[0]
+                self.assertTrue(grid[x // size * size:(x // size + 1) * size,
+                                     y // size * size:(y // size + 1) * size].any())
+            else:
+                bx0, by0, bx1, by1 = block
+                self.assertTrue(bx0 <= x < bx1 and by0 <= y < by1)
+                self.assertFalse(grid[bx0:bx1, by0:by1].any())
+
+    def test_pyramid_matches_cells(self):
+        rng = random.Random(2)
+        np_rng = np.random.default_rng(2)
+        # Ground below a ragged surface, with holes, on a grid that is not a
+        # whole number of blocks
+        grid = np.zeros((430, 317), dtype=bool)
+        surface = np_rng.integers(60, 250, size=grid.shape[0])
+        grid[np.arange(grid.shape[1])[None, :] >= surface[:, None]] = True
+        pyramid = OccupancyPyramid(grid)
+        self.check_queries(pyramid, grid, rng)
+        for _ in range(20):
+            x0, y0 = rng.randrange(430), rng.randrange(317)
+            x1, y1 = x0 + rng.randrange(1, 90), y0 + rng.randrange(1, 90)
+            grid[x0:x1, y0:y1] = rng.random() < 0.5
+            pyramid.update(x0, y0, x1, y1)
+            self.check_queries(pyramid, grid, rng, 50)
+
+    def test_terrain_queries_match_cells(self):
+        rng = random.Random(3)
+        terrain = tank.Terrain(1000, tank.SCREEN_HEIGHT, 3)
+        for _ in range(8):
+            terrain.create_explosion(rng.randrange(1000), rng.randrange(200, tank.SCREEN_HEIGHT),
+                                     tank.EXPLOSION_RADIUS)
+        while terrain.settle():
+            pass
+        for _ in range(300):
+            x0, x1 = rng.uniform(-20, 1020), rng.uniform(-20, 1020)
+            y0, y1 = rng.uniform(-20, tank.SCREEN_HEIGHT), rng.uniform(0, tank.SCREEN_HEIGHT + 20)
+            steps = rng.randrange(1, 400)
+            expected = next((i for i in range(1, steps + 1)
+                             if terrain.is_solid(int(x0 + (x1 - x0) * i / steps), int(y0 + (y1 - y0) * i / steps))),
+                            None)
+            self.assertEqual(terrain.first_solid(x0, y0, x1, y1, steps), expected)
+
+            x0, x1 = sorted(rng.randrange(0, 1000) for _ in range(2))
+            y0, y1 = sorted(rng.randrange(0, tank.SCREEN_HEIGHT) for _ in range(2))
+            cells = np.array([[terrain.is_solid(x, y) for y in range(y0, y1)] for x in range(x0, x1)], dtype=bool)
+            self.assertEqual(terrain.any_solid(x0, y0, x1, y1), bool(cells.any()))
+            self.assertEqual(terrain.all_solid(x0, y0, x1, y1), bool(cells.size) and bool(cells.all()))
+
+
+class TablebaseTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.TemporaryDirectory()
+        kk = chess_tablebase.generate("KK")
+        chess_tablebase.write_table(os.path.join(cls.folder.name, "KK.ktb"), "KK", kk)
+        chess_tablebase.write_table(os.path.join(cls.folder.name, "KNK.ktb"), "KNK",
+                                    chess_tablebase.generate("KNK", kk))
+        cls.tables = chess_tablebase.Tablebases.open(cls.folder.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        for table in cls.tables.tables.values():
+            table.close()
+        cls.folder.cleanup()
+
+    @staticmethod
+    def board(pieces):
+        board = chess.Board.__new__(chess.Board)
+        board.unpack(bytes(chess.BOARD_BYTES))
+        for piece_type, player, (row, col) in pieces:
+            board.grid[row][col] = chess.Piece(piece_type, player, row, col)
+        return board
+
+    def expected(self, board, player, opponent):
+        # The value the position's successors give it: the quickest win,
+        # else a draw, else the slowest loss
+        wins, losses, draw = [], [], False
+        for move in board.generate_moves(player):
+            target = board.grid[move[2]][move[3]]
+            if target and target.type == chess.PieceType.KING:
+                wins.append(1)
+                continue
+            undo = board.make_move(*move)
+            after = self.tables.probe(board, opponent)
+            board.unmake_move(undo)
+            if after == 0:
+                draw = True
+            elif after % 2 == 0:
+                wins.append(after + 1)
+            else:
+                losses.append(after + 1)
+        return min(wins) if wins else 0 if draw else max(losses)
+
+    def test_values_match_successors(self):
+        rng = random.Random(4)
+        north, east = chess.Player.NORTH, chess.Player.EAST
+        for extra in (None, chess.PieceType.KNIGHT):
+            for _ in range(150):
+                squares = rng.sample(chess_tablebase.SQUARES, 3)
+                pieces = [(chess.PieceType.KING, north, squares[0]), (chess.PieceType.KING, east, squares[2])]
+                if extra:
+                    pieces.append((extra, north, squares[1]))
+                board = self.board(pieces)
+                for player, opponent in ((north, east), (east, north)):
+                    self.assertEqual(self.tables.probe(board, player), self.expected(board, player, opponent),
+                                     (pieces, player))
+
+
+class SnapshotTest(unittest.TestCase):
+    def test_round_trip_keeps_state(self):
+        for name, args in SESSIONS.items():
+            with self.subTest(game=name):
+                game = replay.create_game(name, args, 42)
+                play(game, random_frames(random.Random(1), 300))
+                data = snapshot.dumps(game)
+                restored = snapshot.loads(data)
+                self.assertEqual(replay.state_digest(restored), replay.state_digest(game))
+                self.assertEqual(snapshot.dumps(restored), data)
+                # Both play on the same from here
+                frames = random_frames(random.Random(2), 200)
+                state = random.getstate()
+                play(game, frames)
+                random.setstate(state)
+                play(restored, frames)
+                self.assertEqual(replay.state_digest(restored), replay.state_digest(game))
+                # And restoring in place gives the snapshot back
+                snapshot.loads(data, into=game)
+                self.assertEqual(snapshot.dumps(game), data)
+
+
+class ReplayTest(unittest.TestCase):
+    def test_recordings_replay_identically(self):
+        with tempfile.TemporaryDirectory() as folder:
+            for name, args in SESSIONS.items():
+                with self.subTest(game=name):
+                    path = os.path.join(folder, f"{name}.krpl")
+                    seed = replay.seed_session(1234)
+                    game = replay.create_game(name, args, seed)
+                    recorder = replay.Recorder(path, name, seed, args)
+                    for dt, events in random_frames(random.Random(3), 600):
+                        dt = recorder.frame(dt, events)
+                        for event in events:
+                            game.handle_event(event)
+                        game.update(dt)
+                    recorder.finish(game)
+                    _, frames, matched = replay.replay(path)
+                    self.assertEqual(frames, 600)
+                    self.assertTrue(matched)
+
+
+if __name__ == "__main__":
+    unittest.main()
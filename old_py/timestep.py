@@ -0,0 +1,44 @@
+"""Fixed-timestep scheduling for the real-time games.
+
+Physics in tank.py and movement in cake.py are written per step (gravity is
+0.5 px/step^2, players move 5 px/step), so they must run a fixed number of
+steps per second no matter how fast frames are drawn. Each frame the loop
+hands its real frame time to FixedTimestep.advance(), runs that many steps,
+and draws with alpha to interpolate between the last two simulated states.
+"""
+
+
+class FixedTimestep:
+    """Accumulator turning variable frame times into whole simulation steps"""
+
+    def __init__(self, rate=60, max_steps=5, speed=1.0):
+        self.step = 1.0 / rate
+        self.max_steps = max_steps  # Steps per frame at 1x before time is dropped
+        self.speed = speed  # Fast-forward multiplier
+        self.accumulator = 0.0
+
+    def advance(self, frame_time):
+        """Add frame_time seconds of real time; return how many steps to run"""
+        self.accumulator += frame_time * self.speed
+        steps = int(self.accumulator / self.step)
+        limit = int(self.max_steps * max(1.0, self.speed))
+        if steps > limit:
+            # A long stall: run the capped number of steps and drop the rest
+            # rather than spiral into ever longer catch-up frames
+            steps = limit
+            self.accumulator = self.step * limit + self.accumulator % self.step
+        self.accumulator -= steps * self.step
+        return steps
+
+    @property
+    def alpha(self):
+        """How far the render time is between the previous and the current step"""
+        return min(1.0, self.accumulator / self.step)
+
+    def reset(self):
+        self.accumulator = 0.0
+
+
+def lerp(a, b, alpha):
+    """Linear interpolation from a to b"""
+    return a + (b - a) * alpha
@@ -0,0 +1,233 @@
+"""Headless AI-vs-AI tank tournaments, for balancing the game's numbers.
+
+    python tournament.py run --games 2000 --out results.jsonl
+    python tournament.py run --games 2000 --explosion-radius 50 --out r50.jsonl
+    python tournament.py stats results.jsonl r50.jsonl
+
+run plays complete tank games between computer players on seeded maps,
+spread over a process pool (one worker per core by default). Each game is
+independent and its result is a few hundred bytes, so throughput grows
+almost linearly with the number of workers. Results are appended to the
+--out file as JSON lines as the games finish, each carrying the settings it
+was played with:
+
+    {"seed": 17, "players": 4, "width": 1600, "params": {...}, "winner": 2,
+     "turns": 31, "shots": [8, 8, 8, 7], "shield_loss": [5, 1, 5, 5]}
+
+winner is the winning player's number, or null when nobody was left or the
+game hit --max-turns. Once the games are done, and for stats on any results
+files, it prints win rates with Wilson 95% intervals and the means of the
+other numbers with normal-approximation 95% intervals.
+
+The computer players fly every barrel angle through the same physics over
+the surface line (ignoring caves), take the one landing closest to a
+randomly chosen opponent without hitting themselves, then miss it by a
+Gaussian aiming error. Each game's players draw from their own generator
+seeded with the game's seed, so a result can be replayed exactly.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import time
+
+import pygame
+
+import tank
+
+MAX_TURNS = 200  # A game still going after this many shots is a draw
+AIM_ERROR = 3.0  # Standard deviation of the computer players' aim, in degrees
+MAX_FLIGHT = 2000  # Steps before an aiming trial gives up on a shot
+Z = 1.96  # 95% confidence
+
+# Balance settings a tournament can override, as module constants of tank
+PARAMS = {
+    'explosion_radius': 'EXPLOSION_RADIUS',
+    'projectile_speed': 'PROJECTILE_SPEED',
+    'gravity': 'GRAVITY',
+    'shields': 'START_SHIELDS',
+}
+
+
+def configure(params):
+    """Set the balance settings in this process (the pool's worker initializer)"""
+    for name, value in params.items():
+        setattr(tank, PARAMS[name], value)
+
+
+def landing(game, shooter, angle):
+    """Column where a shell fired at angle would first meet the surface, or None"""
+    terrain = game.terrain
+    shooter.barrel_angle = angle
+    x, y = shooter.get_barrel_end()
+    vx = math.cos(math.radians(angle)) * tank.PROJECTILE_SPEED
+    vy = -math.sin(math.radians(angle)) * tank.PROJECTILE_SPEED
+    for _ in range(MAX_FLIGHT):
+        vy += tank.GRAVITY
+        x += vx
+        y += vy
+        # Same bounces as Shells.step
+        if x < 0 or x >= terrain.width:
+            x = 0 if x < 0 else terrain.width - 1
+            vx = -vx * 0.8
+        if y < 0:
+            y = 0
+            vy = -vy * 0.8
+        if y >= terrain.height:
+            return None
+        if y >= terrain.height - terrain.get_height_at(int(x)):
+            return x
+    return None
+
+
+def aim(game, rng, error=AIM_ERROR):
+    """Barrel angle for the current player: the best shot at an opponent, plus aiming error"""
+    shooter = game.tanks[game.current_player]
+    opponents = [t for t in game.tanks if t is not shooter and t.shields > 0]
+    target = rng.choice(opponents)
+    best, best_miss = shooter.barrel_angle, math.inf
+    for angle in range(0, 181, 2):
+        x = landing(game, shooter, angle)
+        if x is None or abs(x - shooter.x) < tank.EXPLOSION_RADIUS:
+            continue
+        miss = abs(x - target.x)
+        if miss < best_miss:
+            best, best_miss = angle, miss
+    return max(0, min(180, round(best + rng.gauss(0, error))))
+
+
+def play_game(seed, num_players=4, width=tank.SCREEN_WIDTH, max_turns=MAX_TURNS, aim_error=AIM_ERROR,
+              params=None):
+    """Play one computer-vs-computer game headless and return its result record"""
+    random.seed(seed)  # The battlefield
+    rng = random.Random(seed)  # The players
+    game = tank.Game(num_players, width=width)
+    space = pygame.event.Event(pygame.KEYDOWN, key=pygame.K_SPACE)
+    shots = [0] * game.num_players
+    turns = 0
+    while not game.game_over and turns < max_turns:
+        player = game.current_player
+        game.tanks[player].barrel_angle = aim(game, rng, aim_error)
+        game.handle_event(space)
+        game.resolve_shot()
+        shots[player] += 1
+        turns += 1
+    return {
+        'seed': seed,
+        'players': game.num_players,
+        'width': width,
+        'params': params or {},
+        'winner': game.winner if game.game_over else None,
+        'turns': turns,
+        'shots': shots,
+        'shield_loss': [tank.START_SHIELDS - max(t.shields, 0) for t in game.tanks],
+    }
+
+
+def _play(job):
+    seed, kwargs = job
+    return play_game(seed, **kwargs)
+
+
+def wilson(successes, n):
+    """95% Wilson score interval for a proportion"""
+    if n == 0:
+        return 0.0, 1.0
+    p = successes / n
+    centre = (p + Z * Z / (2 * n)) / (1 + Z * Z / n)
+    spread = Z * math.sqrt(p * (1 - p) / n + Z * Z / (4 * n * n)) / (1 + Z * Z / n)
+    return max(0.0, centre - spread), min(1.0, centre + spread)
+
+
+def mean_interval(values):
+    """Mean and the half-width of its 95% interval"""
+    if len(values) < 2:
+        return (values[0] if values else 0.0), math.inf
+    return statistics.fmean(values), Z * statistics.stdev(values) / math.sqrt(len(values))
+
+
+def summarize(results):
+    """Print win rates and mean game statistics, one block per distinct setup"""
+    groups = {}
+    for result in results:
+        setup = (result['players'], result['width'], json.dumps(result['params'], sort_keys=True))
+        groups.setdefault(setup, []).append(result)
+    for (players, width, params), games in groups.items():
+        n = len(games)
+        print(f"{n} games, {players} players, width {width}, params {params}")
+        print(f"  {'winner':<16}{'share':>8}   95% interval")
+        for player in list(range(1, players + 1)) + [None]:
+            wins = sum(1 for g in games if g['winner'] == player)
+            low, high = wilson(wins, n)
+            label = f"player {player}" if player else "nobody"
+            print(f"  {label:<16}{wins / n:>8.1%}   [{low:.1%}, {high:.1%}]")
+        for label, values in (('turns', [g['turns'] for g in games]),
+                              ('shots by winner', [g['shots'][g['winner'] - 1] for g in games if g['winner']]),
+                              ('shield loss', [loss for g in games for loss in g['shield_loss']])):
+            mean, half = mean_interval(values)
+            print(f"  {label:<16}{mean:>8.2f} ± {half:.2f}")
+
+
+def cmd_run(args):
+    params = {name: getattr(args, name) for name in PARAMS if getattr(args, name) is not None}
+    kwargs = {'num_players': args.players, 'width': args.width, 'max_turns': args.max_turns,
+              'aim_error': args.aim_error, 'params': params}
+    jobs = [(args.seed + i, kwargs) for i in range(args.games)]
+    results = []
+    start = time.perf_counter()
+    with open(args.out, 'a') as out, multiprocessing.Pool(args.jobs, configure, (params,)) as pool:
+        for result in pool.imap_unordered(_play, jobs, chunksize=max(1, min(8, args.games // (args.jobs * 8)))):
+            out.write(json.dumps(result) + '\n')
+            out.flush()
+            results.append(result)
+            if len(results) % 100 == 0:
+                print(f"{len(results)}/{args.games} games", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    print(f"{len(results)} games in {elapsed:.1f} s on {args.jobs} workers "
+          f"({len(results) / elapsed:.1f} games/s); results in {args.out}")
+    summarize(results)
+    return 0
+
+
+def cmd_stats(args):
+    results = []
+    for path in args.results:
+        with open(path) as f:
+            results.extend(json.loads(line) for line in f if line.strip())
+    summarize(results)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Computer-vs-computer tank tournaments')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='Play games in parallel and append their results')
+    run.add_argument('--games', type=int, default=1000, help='Games to play')
+    run.add_argument('--players', type=int, default=4, help='Players per game (2-4)')
+    run.add_argument('--width', type=int, default=tank.SCREEN_WIDTH, help='Battlefield width in pixels')
+    run.add_argument('--seed', type=int, default=0, help='Seed of the first game; the others follow on')
+    run.add_argument('--jobs', type=int, default=os.cpu_count(), help='Worker processes')
+    run.add_argument('--max-turns', type=int, default=MAX_TURNS, help='Shots before a game is a draw')
+    run.add_argument('--aim-error', type=float, default=AIM_ERROR, help='Aiming error in degrees')
+    run.add_argument('--out', default='tournament.jsonl', help='Results file (appended to)')
+    run.add_argument('--explosion-radius', type=int, help=f'Default {tank.EXPLOSION_RADIUS}')
+    run.add_argument('--projectile-speed', type=float, help=f'Default {tank.PROJECTILE_SPEED}')
+    run.add_argument('--gravity', type=float, help=f'Default {tank.GRAVITY}')
+    run.add_argument('--shields', type=int, help=f'Starting shields, default {tank.START_SHIELDS}')
+    run.set_defaults(func=cmd_run)
+
+    stats = commands.add_parser('stats', help='Summarize results files')
+    stats.add_argument('results', nargs='+', help='JSON lines written by run')
+    stats.set_defaults(func=cmd_stats)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()